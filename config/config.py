@@ -1,8 +1,8 @@
 import os
 
 
-def _get_bool_env(key: str) -> bool:
-    return os.getenv(key) in ["True", "true", "1"]
+def _get_bool_env(key: str, default: str = "") -> bool:
+    return os.getenv(key, default) in ["True", "true", "1"]
 
 
 class Config:
@@ -40,5 +40,108 @@ class Config:
         self.WEAVIATE_GRPC_HOST = os.getenv("WEAVIATE_GRPC_HOST")
         self.WEAVIATE_GRPC_PORT = os.getenv("WEAVIATE_GRPC_PORT")
         self.WEAVIATE_API_KEY = os.getenv("WEAVIATE_API_KEY")
+        self.WEAVIATE_MULTI_TENANCY = _get_bool_env("WEAVIATE_MULTI_TENANCY")
+
+        # 混合检索配置，融合策略可选rrf/weighted，权重依次对应语义检索与全文检索
+        self.HYBRID_RETRIEVAL_FUSION = os.getenv("HYBRID_RETRIEVAL_FUSION", "rrf")
+        self.HYBRID_RETRIEVAL_WEIGHTS = [
+            float(weight)
+            for weight in os.getenv("HYBRID_RETRIEVAL_WEIGHTS", "0.5,0.5").split(",")
+        ]
+        self.HYBRID_RETRIEVAL_RRF_K = int(os.getenv("HYBRID_RETRIEVAL_RRF_K", 60))
+        self.HYBRID_RETRIEVAL_TIMEOUT = float(os.getenv("HYBRID_RETRIEVAL_TIMEOUT", 5))
+        # 混合检索共享线程池的线程数，为每个进程的总上限，由所有检索请求共享
+        self.HYBRID_RETRIEVAL_MAX_WORKERS = int(
+            os.getenv("HYBRID_RETRIEVAL_MAX_WORKERS", 16)
+        )
+
+        # 检索结果多样化配置，先获取fetch_k条候选记录，再按最大边际相关性重排序并去除近似重复片段
+        # MMR系数越小结果越多样，设置为1时只按相关性排序，关闭MMR时直接按相似度排序，重复阈值为MinHash估算的Jaccard相似度
+        self.RETRIEVAL_MMR_ENABLED = _get_bool_env("RETRIEVAL_MMR_ENABLED", "True")
+        self.RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", 20))
+        self.RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", 0.5))
+        self.RETRIEVAL_DUPLICATE_THRESHOLD = float(
+            os.getenv("RETRIEVAL_DUPLICATE_THRESHOLD", 0.8)
+        )
+
+        # 检索统计(片段命中次数、知识库查询记录)缓冲区的刷新间隔，单位为秒
+        self.RETRIEVAL_STATS_FLUSH_INTERVAL = float(
+            os.getenv("RETRIEVAL_STATS_FLUSH_INTERVAL", 5)
+        )
+
+        # 向量数据库后端配置
+        self.VECTOR_DATABASE_TYPE = os.getenv("VECTOR_DATABASE_TYPE", "weaviate")
+        self.LOCAL_VECTOR_DATABASE_PATH = os.getenv(
+            "LOCAL_VECTOR_DATABASE_PATH",
+            os.path.join(os.getcwd(), "storage", "vector_database"),
+        )
+
+        # 知识库文档索引构建配置
+        self.INDEXING_BATCH_SIZE = int(os.getenv("INDEXING_BATCH_SIZE", 500))
+        self.INDEXING_MAX_WORKERS = int(os.getenv("INDEXING_MAX_WORKERS", 5))
+        # 关键词提取的子进程数为每个进程的总上限，由所有索引线程共享，设置为1时串行提取
+        self.KEYWORD_EXTRACTION_MAX_WORKERS = int(
+            os.getenv("KEYWORD_EXTRACTION_MAX_WORKERS", 4)
+        )
+        self.KEYWORD_EXTRACTION_CHUNK_SIZE = int(
+            os.getenv("KEYWORD_EXTRACTION_CHUNK_SIZE", 200)
+        )
+        self.BUILD_PIPELINE_PARSING_WORKERS = int(
+            os.getenv("BUILD_PIPELINE_PARSING_WORKERS", 2)
+        )
+        self.BUILD_PIPELINE_INDEXING_WORKERS = int(
+            os.getenv("BUILD_PIPELINE_INDEXING_WORKERS", 1)
+        )
+        self.BUILD_PIPELINE_COMPLETED_WORKERS = int(
+            os.getenv("BUILD_PIPELINE_COMPLETED_WORKERS", 2)
+        )
+        self.BUILD_PIPELINE_QUEUE_SIZE = int(os.getenv("BUILD_PIPELINE_QUEUE_SIZE", 2))
+        # 分割结果缓存的大小上限，单位为字节，超过上限的大文档不缓存分割结果
+        self.DOCUMENT_SPLITTING_CACHE_MAX_SIZE = int(
+            os.getenv("DOCUMENT_SPLITTING_CACHE_MAX_SIZE", 1024 * 1024)
+        )
+        # PDF并行解析的子进程数为每个进程的总上限，由所有解析线程共享
+        self.FILE_EXTRACTOR_MAX_WORKERS = int(
+            os.getenv("FILE_EXTRACTOR_MAX_WORKERS", 4)
+        )
+        self.FILE_EXTRACTOR_PAGES_PER_TASK = int(
+            os.getenv("FILE_EXTRACTOR_PAGES_PER_TASK", 20)
+        )
+
+        # 查询文本嵌入缓存配置
+        self.EMBEDDINGS_QUERY_CACHE_SIZE = int(
+            os.getenv("EMBEDDINGS_QUERY_CACHE_SIZE", 1024)
+        )
+        self.EMBEDDINGS_QUERY_CACHE_TTL = int(
+            os.getenv("EMBEDDINGS_QUERY_CACHE_TTL", 86400)
+        )
+
+        # 文本嵌入向量缓存配置，精度可选float32/float16，过期时间及内存预算为0表示不限制，设置内存预算时必须同时设置过期时间
+        self.EMBEDDINGS_CACHE_DTYPE = os.getenv("EMBEDDINGS_CACHE_DTYPE", "float32")
+        self.EMBEDDINGS_CACHE_TTL = int(os.getenv("EMBEDDINGS_CACHE_TTL", 0))
+        self.EMBEDDINGS_CACHE_MAX_MEMORY = int(
+            os.getenv("EMBEDDINGS_CACHE_MAX_MEMORY", 0)
+        )
+
+        # 文本嵌入请求调度配置，合并窗口单位为秒，每分钟请求数/token数为0表示不限流，目标延迟超过后会收缩并发
+        self.EMBEDDINGS_DISPATCH_WINDOW = float(
+            os.getenv("EMBEDDINGS_DISPATCH_WINDOW", 0.02)
+        )
+        self.EMBEDDINGS_REQUESTS_PER_MINUTE = int(
+            os.getenv("EMBEDDINGS_REQUESTS_PER_MINUTE", 0)
+        )
+        self.EMBEDDINGS_TOKENS_PER_MINUTE = int(
+            os.getenv("EMBEDDINGS_TOKENS_PER_MINUTE", 0)
+        )
+        self.EMBEDDINGS_MAX_CONCURRENCY = int(
+            os.getenv("EMBEDDINGS_MAX_CONCURRENCY", 8)
+        )
+        self.EMBEDDINGS_TARGET_LATENCY = float(
+            os.getenv("EMBEDDINGS_TARGET_LATENCY", 5)
+        )
+        # 文本嵌入请求调度指标的日志输出间隔，单位为秒，0表示不输出
+        self.EMBEDDINGS_METRICS_LOG_INTERVAL = float(
+            os.getenv("EMBEDDINGS_METRICS_LOG_INTERVAL", 60)
+        )
 
         self.ASSISTANT_AGENT_ID = os.getenv("ASSISTANT_AGENT_ID")
@@ -1,8 +1,11 @@
-import queue
+import json
+import logging
+import os
+import re
 import time
 import uuid
-from queue import Queue
-from typing import Generator
+from threading import Event, Lock, Thread
+from typing import Any, Generator, Optional
 from uuid import UUID
 
 from redis import Redis
@@ -10,14 +13,105 @@ from redis import Redis
 from internal.core.agent.entities.queue_entity import AgentThought, QueueEvent
 from internal.entity.conversation_entity import InvokeFrom
 
+# 任务停止信号的发布订阅频道
+TASK_STOPPED_CHANNEL = "generate_task_stopped"
+
+# 任务事件流及上下文的过期时间，单位为秒，过期后无法再断线续传
+TASK_STREAM_EXPIRE_TIME = 1800
+
+# 任务事件流的最大长度(近似裁剪)，超出后最早的事件会被删除，从这些事件之后断线续传时只能读取到保留的事件
+TASK_STREAM_MAX_LENGTH = 10000
+
+# 断线续传时事件数据默认返回的字段
+RESUME_EVENT_FIELDS = frozenset(
+    {"event", "thought", "observation", "tool", "tool_input", "answer", "latency"}
+)
+
+
+class TaskStopSubscriber:
+    """任务停止信号订阅器，每个进程只维护一个订阅连接，收到停止信号后设置本地任务标识，监听时只需检查内存"""
+
+    def __init__(self, redis_client: Redis) -> None:
+        """构造函数，传递redis客户端"""
+        self.redis_client = redis_client
+        self._events: dict[str, Event] = {}
+        self._lock = Lock()
+        self._pid: Optional[int] = None
+
+    def register(self, task_id: UUID) -> Event:
+        """注册任务并返回任务的停止标识，调用方需要在注册后检查一次缓存中的停止键，避免遗漏订阅生效前的信号"""
+        self._ensure_started()
+        with self._lock:
+            return self._events.setdefault(str(task_id), Event())
+
+    def unregister(self, task_id: UUID) -> None:
+        """注销任务的停止标识"""
+        with self._lock:
+            self._events.pop(str(task_id), None)
+
+    def _ensure_started(self) -> None:
+        """懒启动订阅线程，进程fork后需要重新启动"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            Thread(target=self._run, daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        """订阅停止信号频道，连接断开后自动重连"""
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                # 1.订阅(含重连)成功后补查一次已注册任务的停止键，避免断线期间的信号丢失
+                pubsub.subscribe(TASK_STOPPED_CHANNEL)
+                self._sync()
+
+                # 2.收到停止信号后设置对应任务的本地停止标识
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    self._set(data.decode("utf-8") if isinstance(data, bytes) else data)
+            except Exception as e:
+                logging.exception(f"订阅任务停止信号出错, 错误信息: {str(e)}")
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    def _sync(self) -> None:
+        """使用一次批量请求检查所有已注册任务的停止键"""
+        with self._lock:
+            task_ids = list(self._events.keys())
+        if not task_ids:
+            return
+        results = self.redis_client.mget(
+            [
+                AgentQueueManager.generate_task_stopped_cache_key(task_id)
+                for task_id in task_ids
+            ]
+        )
+        for task_id, result in zip(task_ids, results):
+            if result is not None:
+                self._set(task_id)
+
+    def _set(self, task_id: str) -> None:
+        """设置任务的本地停止标识"""
+        with self._lock:
+            event = self._events.get(task_id)
+        if event is not None:
+            event.set()
+
 
 class AgentQueueManager:
-    """智能体队列管理器"""
+    """智能体队列管理器，事件通过redis stream传输，消费者可以运行在任意进程并支持从指定事件之后断线续传"""
 
     user_id: UUID
     invoke_from: InvokeFrom
     redis_client: Redis
-    _queues: dict[str, Queue]
+    _tasks: set[str]
+    _stop_subscriber: Optional[TaskStopSubscriber] = None
 
     def __init__(
         self,
@@ -28,48 +122,76 @@ class AgentQueueManager:
         # 1.初始化数据
         self.user_id = user_id
         self.invoke_from = invoke_from
-        self._queues = {}
+        self._tasks = set()
 
         # 2.内部初始化redis_client
         from internal.extension.module_extension import injector
 
         self.redis_client = injector.get(Redis)
 
-    def listen(self, task_id: UUID) -> Generator:
-        """监听队列返回的生成式数据"""
-        # 1.定义基础数据记录超时时间、开始时间、最后一次ping通时间
+    def listen(
+        self,
+        task_id: UUID,
+        last_event_id: Optional[str] = None,
+        readonly: bool = False,
+    ) -> Generator:
+        """监听任务事件流返回的生成式数据，传递last_event_id时从该事件之后继续读取，readonly为True时只读取事件流(断线续传)，超时或停止事件只由任务原始的监听者写入"""
+        # 1.定义基础数据记录超时时间、开始时间、最后一次ping通时间以及读取的起始位置
         listen_timeout = 600
         start_time = time.time()
         last_ping_time = 0
+        stream_key = self.generate_task_stream_cache_key(task_id)
+        last_id = (
+            last_event_id
+            if last_event_id and re.fullmatch(r"\d+-\d+", last_event_id)
+            else "0-0"
+        )
 
-        # 2.创建循环队列执行死循环读取数据，直到超时或者数据读取完毕
-        while True:
-            try:
-                # 3.从队列中提取数据并检测数据是否存在，如果存在则使用yield关键字返回
-                item = self.queue(task_id).get(timeout=1)
-                if item is None:
-                    break
-                yield item
-            except queue.Empty:
-                continue
-            finally:
-                # 4.计算获取数据的总耗时
+        # 2.注册任务的本地停止标识，停止信号通过发布订阅推送，注册后补查一次停止键，只读监听者不处理停止信号
+        stop_subscriber = self.stop_subscriber()
+        stop_event = Event() if readonly else stop_subscriber.register(task_id)
+        if not readonly and self._is_stopped(task_id):
+            stop_event.set()
+
+        try:
+            # 3.循环阻塞读取事件流，直到读取到结束标识，停止标识只检查内存
+            while True:
+                # 4.读取last_id之后的事件，没有新事件时最多阻塞1秒
+                response = self.redis_client.xread(
+                    {stream_key: last_id}, count=100, block=1000
+                )
+                for _, entries in response or []:
+                    for entry_id, fields in entries:
+                        last_id = (
+                            entry_id.decode("utf-8")
+                            if isinstance(entry_id, bytes)
+                            else entry_id
+                        )
+
+                        # 5.读取到结束标识时停止监听，否则还原事件并使用yield关键字返回
+                        if b"end" in fields:
+                            return
+                        agent_thought = AgentThought.parse_raw(fields[b"data"])
+                        agent_thought.stream_id = last_id
+                        yield agent_thought
+
+                # 6.计算获取数据的总耗时
                 elapsed_time = time.time() - start_time
 
-                # 5.每10秒发起一个ping请求
+                # 7.每10秒返回一个ping事件，ping事件只在本地生成，不写入事件流
                 if elapsed_time // 10 > last_ping_time:
-                    self.publish(
-                        task_id,
-                        AgentThought(
-                            id=uuid.uuid4(),
-                            task_id=task_id,
-                            event=QueueEvent.PING,
-                        ),
+                    yield AgentThought(
+                        id=uuid.uuid4(),
+                        task_id=task_id,
+                        event=QueueEvent.PING,
+                        stream_id=last_id,
                     )
                     last_ping_time = elapsed_time // 10
 
-                # 6.判断总耗时是否超时，如果超时则往队列中添加超时事件
+                # 8.判断总耗时是否超时，如果超时则往事件流中添加超时事件，只读监听者超时直接退出
                 if elapsed_time >= listen_timeout:
+                    if readonly:
+                        return
                     self.publish(
                         task_id,
                         AgentThought(
@@ -79,8 +201,8 @@ class AgentQueueManager:
                         ),
                     )
 
-                # 7.检测是否停止，如果已经停止则添加停止事件
-                if self._is_stopped(task_id):
+                # 9.检测本地停止标识，如果已经停止则添加停止事件
+                if stop_event.is_set():
                     self.publish(
                         task_id,
                         AgentThought(
@@ -89,15 +211,35 @@ class AgentQueueManager:
                             event=QueueEvent.STOP,
                         ),
                     )
+        finally:
+            if not readonly:
+                stop_subscriber.unregister(task_id)
+
+    def resume(
+        self,
+        task_id: UUID,
+        last_event_id: Optional[str] = None,
+        include: frozenset[str] = RESUME_EVENT_FIELDS,
+    ) -> Generator[str, None, None]:
+        """从last_event_id之后只读监听任务事件流，并将事件格式化为附带任务上下文的SSE数据，用于断线续传"""
+        task_context = self.get_task_context(task_id)
+        for agent_thought in self.listen(task_id, last_event_id, readonly=True):
+            data = {
+                **agent_thought.dict(include=set(include)),
+                "id": str(agent_thought.id),
+                **task_context,
+                "task_id": str(agent_thought.task_id),
+            }
+            yield f"id: {agent_thought.stream_id}\nevent: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
 
     def stop_listen(self, task_id: UUID) -> None:
-        """停止监听队列信息"""
-        self.queue(task_id).put(None)
+        """往事件流中添加结束标识，停止监听"""
+        self._xadd(task_id, {"end": 1})
 
     def publish(self, task_id: UUID, agent_thought: AgentThought) -> None:
-        """发布事件信息到队列"""
-        # 1.将事件添加到队列中
-        self.queue(task_id).put(agent_thought)
+        """发布事件信息到任务事件流"""
+        # 1.将事件添加到事件流中
+        self._xadd(task_id, {"data": agent_thought.json(exclude={"stream_id"})})
 
         # 2.检测事件类型是否为需要停止的类型，涵盖STOP、ERROR、TIMEOUT、AGENT_END
         if agent_thought.event in [
@@ -120,56 +262,64 @@ class AgentQueueManager:
             ),
         )
 
-    def _is_stopped(self, task_id: UUID) -> bool:
-        """检测任务是否停止"""
-        task_stopped_cache_key = self.generate_task_stopped_cache_key(task_id)
-        result = self.redis_client.get(task_stopped_cache_key)
-
-        if result is not None:
-            return True
-        return False
-
-    def queue(self, task_id: UUID) -> Queue:
-        """根据传递的task_id获取对应的任务队列信息"""
-        # 1.从队列字典中获取对应的任务队列
-        q = self._queues.get(str(task_id))
+    def set_task_context(self, task_id: UUID, **context: Any) -> None:
+        """记录任务的上下文信息(如会话id、消息id)，断线重连时用于还原事件数据"""
+        cache_key = self.generate_task_context_cache_key(task_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.hset(
+            cache_key, mapping={key: str(value) for key, value in context.items()}
+        )
+        pipeline.expire(cache_key, TASK_STREAM_EXPIRE_TIME)
+        pipeline.execute()
 
-        # 2.检测队列是否存在，如果不存在则创建队列，并添加缓存键标识
-        if not q:
-            # 3.添加缓存键标识
+    def _xadd(self, task_id: UUID, fields: dict) -> None:
+        """往任务事件流中追加一条记录并刷新过期时间，首次写入时记录任务归属"""
+        # 1.首次写入时设置任务对应的缓存键，代表这次任务已经开始了
+        if str(task_id) not in self._tasks:
             user_prefix = (
                 "account"
                 if self.invoke_from in [InvokeFrom.WEB_APP, InvokeFrom.DEBUGGER]
                 else "end-user"
             )
-
-            # 4.设置任务对应的缓存键，代表这次任务已经开始了
             self.redis_client.setex(
                 self.generate_task_belong_cache_key(task_id),
                 1800,
                 f"{user_prefix}-{str(self.user_id)}",
             )
+            self._tasks.add(str(task_id))
 
-            # 5.将任务队列添加到队列字典中
-            q = Queue()
-            self._queues[str(task_id)] = q
+        # 2.追加记录(近似裁剪事件流长度)并刷新过期时间，两条命令在一次往返中完成
+        stream_key = self.generate_task_stream_cache_key(task_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.xadd(
+            stream_key, fields, maxlen=TASK_STREAM_MAX_LENGTH, approximate=True
+        )
+        pipeline.expire(stream_key, TASK_STREAM_EXPIRE_TIME)
+        pipeline.execute()
 
-        return q
+    def _is_stopped(self, task_id: UUID) -> bool:
+        """检测任务是否停止"""
+        task_stopped_cache_key = self.generate_task_stopped_cache_key(task_id)
+        result = self.redis_client.get(task_stopped_cache_key)
+
+        if result is not None:
+            return True
+        return False
 
     @classmethod
-    def set_stop_flag(
+    def is_task_owner(
         cls, task_id: UUID, invoke_from: InvokeFrom, user_id: UUID
-    ) -> None:
-        """根据传递的任务id+调用来源停止某次会话"""
+    ) -> bool:
+        """根据传递的任务id+调用来源+用户id判断任务是否属于该用户，任务未执行或已过期时返回False"""
         # 1.获取redis_client客户端
         from internal.extension.module_extension import injector
 
         redis_client = injector.get(Redis)
 
-        # 2.获取当前任务的缓存键，如果任务没执行，则不需要停止
+        # 2.获取当前任务的缓存键，如果任务没执行，则不属于任何用户
         result = redis_client.get(cls.generate_task_belong_cache_key(task_id))
         if not result:
-            return
+            return False
 
         # 3.计算对应缓存键的结果
         user_prefix = (
@@ -177,12 +327,48 @@ class AgentQueueManager:
             if invoke_from in [InvokeFrom.WEB_APP, InvokeFrom.DEBUGGER]
             else "end-user"
         )
-        if result.decode("utf-8") != f"{user_prefix}-{str(user_id)}":
+        return result.decode("utf-8") == f"{user_prefix}-{str(user_id)}"
+
+    @classmethod
+    def get_task_context(cls, task_id: UUID) -> dict[str, str]:
+        """获取任务的上下文信息"""
+        from internal.extension.module_extension import injector
+
+        redis_client = injector.get(Redis)
+        return {
+            key.decode("utf-8"): value.decode("utf-8")
+            for key, value in redis_client.hgetall(
+                cls.generate_task_context_cache_key(task_id)
+            ).items()
+        }
+
+    @classmethod
+    def set_stop_flag(
+        cls, task_id: UUID, invoke_from: InvokeFrom, user_id: UUID
+    ) -> None:
+        """根据传递的任务id+调用来源停止某次会话"""
+        # 1.获取redis_client客户端
+        from internal.extension.module_extension import injector
+
+        redis_client = injector.get(Redis)
+
+        # 2.任务没执行或者不属于该用户，则不需要停止
+        if not cls.is_task_owner(task_id, invoke_from, user_id):
             return
 
-        # 4.生成停止键标识
+        # 3.生成停止键标识，并通过发布订阅通知正在监听该任务的进程
         stopped_cache_key = cls.generate_task_stopped_cache_key(task_id)
         redis_client.setex(stopped_cache_key, 600, 1)
+        redis_client.publish(TASK_STOPPED_CHANNEL, str(task_id))
+
+    @classmethod
+    def stop_subscriber(cls) -> TaskStopSubscriber:
+        """获取进程内共享的任务停止信号订阅器"""
+        if cls._stop_subscriber is None:
+            from internal.extension.module_extension import injector
+
+            cls._stop_subscriber = TaskStopSubscriber(injector.get(Redis))
+        return cls._stop_subscriber
 
     @classmethod
     def generate_task_belong_cache_key(cls, task_id: UUID) -> str:
@@ -193,3 +379,13 @@ class AgentQueueManager:
     def generate_task_stopped_cache_key(cls, task_id: UUID) -> str:
         """生成任务已停止的缓存键"""
         return f"generate_task_stopped:{str(task_id)}"
+
+    @classmethod
+    def generate_task_stream_cache_key(cls, task_id: UUID) -> str:
+        """生成任务事件流的缓存键"""
+        return f"generate_task_stream:{str(task_id)}"
+
+    @classmethod
+    def generate_task_context_cache_key(cls, task_id: UUID) -> str:
+        """生成任务上下文的缓存键"""
+        return f"generate_task_context:{str(task_id)}"
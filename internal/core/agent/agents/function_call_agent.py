@@ -225,7 +225,6 @@ class FunctionCallAgent(BaseAgent):
                             task_id=state["task_id"],
                             event=QueueEvent.AGENT_MESSAGE,
                             thought=content,
-                            message=messages_to_dict(state["messages"]),
                             answer=content,
                             latency=(time.perf_counter() - start_at),
                         ),
@@ -251,7 +250,19 @@ class FunctionCallAgent(BaseAgent):
                 ),
             )
         elif generation_type == "message":
-            # 7.如果LLM直接生成answer则表示已经拿到了最终答案，则停止监听
+            # 7.增量消息不携带消息列表，避免每个token都写入完整的消息列表，只在最后一条增量中携带
+            self.agent_queue_manager.publish(
+                state["task_id"],
+                AgentThought(
+                    id=id,
+                    task_id=state["task_id"],
+                    event=QueueEvent.AGENT_MESSAGE,
+                    message=messages_to_dict(state["messages"]),
+                    latency=(time.perf_counter() - start_at),
+                ),
+            )
+
+            # 8.如果LLM直接生成answer则表示已经拿到了最终答案，则停止监听
             self.agent_queue_manager.publish(
                 state["task_id"],
                 AgentThought(
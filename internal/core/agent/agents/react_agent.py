@@ -166,7 +166,6 @@ class ReACTAgent(FunctionCallAgent):
                         task_id=state["task_id"],
                         event=QueueEvent.AGENT_MESSAGE,
                         thought=content,
-                        message=messages_to_dict(state["messages"]),
                         answer=content,
                         latency=(time.perf_counter() - start_at),
                     ),
@@ -188,7 +187,6 @@ class ReACTAgent(FunctionCallAgent):
                                 task_id=state["task_id"],
                                 event=QueueEvent.AGENT_MESSAGE,
                                 thought=gathered.content,
-                                message=messages_to_dict(state["messages"]),
                                 answer=gathered.content,
                                 latency=(time.perf_counter() - start_at),
                             ),
@@ -233,14 +231,23 @@ class ReACTAgent(FunctionCallAgent):
                         task_id=state["task_id"],
                         event=QueueEvent.AGENT_MESSAGE,
                         thought=gathered.content,
-                        message=messages_to_dict(state["messages"]),
                         answer=gathered.content,
                         latency=(time.perf_counter() - start_at),
                     ),
                 )
 
-        # 14.如果最终类型是message则表示已经拿到最终答案，则停止监听
+        # 14.如果最终类型是message则表示已经拿到最终答案，增量消息不携带消息列表，只在最后一条增量中携带，然后停止监听
         if generation_type == "message":
+            self.agent_queue_manager.publish(
+                state["task_id"],
+                AgentThought(
+                    id=id,
+                    task_id=state["task_id"],
+                    event=QueueEvent.AGENT_MESSAGE,
+                    message=messages_to_dict(state["messages"]),
+                    latency=(time.perf_counter() - start_at),
+                ),
+            )
             self.agent_queue_manager.publish(
                 state["task_id"],
                 AgentThought(
@@ -61,6 +61,9 @@ class AgentThought(BaseModel):
     total_price: float = 0  # 总价格
     latency: float = 0  # 步骤推理耗时
 
+    # 事件在redis stream中的消息id，作为SSE的事件id用于断线续传
+    stream_id: str = ""
+
 
 class AgentResult(BaseModel):
     """智能体推理观察最终结果"""
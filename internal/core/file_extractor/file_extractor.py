@@ -1,9 +1,16 @@
+import multiprocessing
 import os.path
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
+from itertools import groupby
 from pathlib import Path
+from threading import Lock
+from typing import Iterator, Optional
 
 import requests
+from flask import current_app
 from injector import inject
 from langchain_community.document_loaders import (
     UnstructuredExcelLoader,
@@ -16,10 +23,70 @@ from langchain_community.document_loaders import (
     UnstructuredFileLoader,
     TextLoader,
 )
+from langchain_community.document_loaders.base import BaseLoader
+from langchain_core.documents import Document
 
+from internal.entity.upload_file_entity import MAX_EXTRACT_FILE_SIZE
+from internal.exception import FailException
 from internal.model import UploadFile
 from internal.service import CosService
 
+# PDF并行解析进程池，每个进程只创建一个并由所有解析线程共享，从而限制进程内同时运行的解析子进程总数
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_lock = Lock()
+
+# 解析线程所在的进程(celery、gunicorn)持有其他线程及锁，子进程使用forkserver/spawn启动，避免fork继承这些状态
+_pdf_mp_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _load_pdf_range(
+    range_file_path: str, file_path: str, page_offset: int
+) -> list[Document]:
+    """在子进程中按页解析PDF的某个页码区间文件，并将元数据还原为原始文件的页码与路径"""
+    documents = UnstructuredPDFLoader(range_file_path, mode="paged").load()
+    for document in documents:
+        document.metadata["source"] = file_path
+        if "page_number" in document.metadata:
+            document.metadata["page_number"] += page_offset
+    return documents
+
+
+def _get_pdf_max_workers() -> int:
+    """获取配置的PDF解析子进程数，该值为每个进程的总上限，由所有解析线程共享"""
+    return max(int(current_app.config.get("FILE_EXTRACTOR_MAX_WORKERS", 4)), 1)
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """获取当前进程共享的PDF解析进程池，不存在时按配置的子进程数创建"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=_get_pdf_max_workers(),
+                mp_context=_pdf_mp_context,
+            )
+        return _pdf_executor
+
+
+def _discard_pdf_executor(executor: ProcessPoolExecutor) -> None:
+    """进程池损坏(子进程异常退出)时丢弃进程池，下次使用时重新创建"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is executor:
+            _pdf_executor = None
+
+
+def _reset_pdf_executor_after_fork() -> None:
+    """fork后的子进程(如celery worker)不能复用父进程的进程池及锁，需要重新创建"""
+    global _pdf_executor, _pdf_executor_lock
+    _pdf_executor = None
+    _pdf_executor_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pdf_executor_after_fork)
+
 
 @inject
 @dataclass
@@ -46,18 +113,40 @@ class FileExtractor:
             # 4.从指定的路径中去加载文件
             return self.load_from_file(file_path, return_text, is_unstructured)
 
+    def lazy_load(
+        self,
+        upload_file: UploadFile,
+        is_unstructured: bool = True,
+        max_size: int = MAX_EXTRACT_FILE_SIZE,
+        parallel: bool = False,
+        pages_per_task: int = 20,
+    ) -> Iterator[Document]:
+        """流式加载传入的upload_file记录，按页/工作表逐个返回LangChain文档，parallel为True时并行解析大文件"""
+        # 1.记录的文件大小超过限制时直接拒绝，不执行下载与解析
+        if upload_file.size > max_size:
+            raise FailException("文件大小超过解析限制")
+
+        # 2.创建临时文件夹，对象存储中的文件以流式下载的方式写入本地，并按实际接收的字节数再次校验大小
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, os.path.basename(upload_file.key))
+            self.cos_service.download_file(upload_file.key, file_path, max_size)
+
+            # 3.逐个返回加载的文档，临时文件在生成器结束后才会被删除
+            if parallel:
+                yield from self.parallel_load_from_file(
+                    file_path, is_unstructured, pages_per_task
+                )
+            else:
+                yield from self.lazy_load_from_file(file_path, is_unstructured)
+
     @classmethod
     def load_from_url(cls, url: str, return_text: bool = False):
         """从传入的URL中去加载数据，返回LangChain文档列表或者字符串"""
-        # 1.下载远程URL的文件到本地
-        response = requests.get(url)
-
-        # 2.将文件下载到本地的临时文件夹
+        # 1.将文件下载到本地的临时文件夹
         with tempfile.TemporaryDirectory() as temp_dir:
-            # 3.获取文件的扩展名，并构建临时存储路径，将远程文件存储到本地
+            # 2.获取文件的扩展名，并构建临时存储路径，将远程文件流式存储到本地
             file_path = os.path.join(temp_dir, os.path.basename(url))
-            with open(file_path, "wb") as file:
-                file.write(response.content)
+            cls._download_from_url(url, file_path)
 
             return cls.load_from_file(file_path, return_text)
 
@@ -69,35 +158,155 @@ class FileExtractor:
         is_unstructured: bool = True,
     ):
         """从本地文件中加载数据，返回LangChain文档列表或者字符串"""
-        # 1.获取文件的扩展名
+        # 1.根据不同的文件扩展名去加载不同的加载器
         delimiter = "\n\n"
+        loader = cls._get_loader(file_path, is_unstructured)
+
+        # 2.返回加载的文档列表或者文本
+        return (
+            delimiter.join([document.page_content for document in loader.load()])
+            if return_text
+            else loader.load()
+        )
+
+    @classmethod
+    def lazy_load_from_file(
+        cls,
+        file_path: str,
+        is_unstructured: bool = True,
+    ) -> Iterator[Document]:
+        """从本地文件中流式加载数据，PDF/PPT按页、Excel按工作表逐个返回LangChain文档"""
+        loader = cls._get_loader(file_path, is_unstructured, paged=True)
+        if Path(file_path).suffix.lower() in [".xlsx", ".xls"]:
+            yield from cls._merge_excel_elements(loader.lazy_load())
+            return
+        yield from loader.lazy_load()
+
+    @classmethod
+    def parallel_load_from_file(
+        cls,
+        file_path: str,
+        is_unstructured: bool = True,
+        pages_per_task: int = 20,
+    ) -> Iterator[Document]:
+        """将PDF文件按页码区间拆分后使用进程池并行解析，并按原始页码顺序返回文档，其他类型文件则流式串行加载"""
+        # 1.只有PDF支持按页码区间拆分，其他文件类型或者只配置了单个子进程时直接串行加载
+        if Path(file_path).suffix.lower() != ".pdf" or _get_pdf_max_workers() <= 1:
+            yield from cls.lazy_load_from_file(file_path, is_unstructured)
+            return
+
+        # 2.拆分PDF需要依赖pypdf(unstructured[pdf]的子依赖)，未安装或页数较少时串行加载
+        try:
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            yield from cls.lazy_load_from_file(file_path, is_unstructured)
+            return
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+        if page_count <= pages_per_task:
+            yield from cls.lazy_load_from_file(file_path, is_unstructured)
+            return
+
+        # 3.按页码区间将PDF拆分成多个临时文件，存放在原始文件的同级目录下
+        range_file_paths, page_offsets = [], []
+        for start in range(0, page_count, pages_per_task):
+            writer = PdfWriter()
+            for index in range(start, min(start + pages_per_task, page_count)):
+                writer.add_page(reader.pages[index])
+            range_file_path = f"{file_path}.{start}.pdf"
+            writer.write(range_file_path)
+            range_file_paths.append(range_file_path)
+            page_offsets.append(start)
+
+        # 4.使用进程内共享的进程池并行解析各个区间，多个解析线程同时运行时子进程总数仍不超过配置的上限，
+        # map会按照提交顺序返回结果，从而保证页码顺序
+        executor = _get_pdf_executor()
+        try:
+            for documents in executor.map(
+                _load_pdf_range,
+                range_file_paths,
+                [file_path] * len(range_file_paths),
+                page_offsets,
+            ):
+                yield from documents
+        except BrokenProcessPool:
+            _discard_pdf_executor(executor)
+            raise
+
+    @classmethod
+    def _get_loader(
+        cls,
+        file_path: str,
+        is_unstructured: bool = True,
+        paged: bool = False,
+    ) -> BaseLoader:
+        """根据文件的扩展名获取对应的加载器，paged为True时PDF/PPT按页拆分文档，Excel按元素拆分后由lazy_load_from_file合并为工作表"""
+        # 1.获取文件的扩展名
         file_extension = Path(file_path).suffix.lower()
 
         # 2.根据不同的文件扩展名去加载不同的加载器
         if file_extension in [".xlsx", ".xls"]:
-            loader = UnstructuredExcelLoader(file_path)
+            return UnstructuredExcelLoader(
+                file_path, mode="elements" if paged else "single"
+            )
         elif file_extension == ".pdf":
-            loader = UnstructuredPDFLoader(file_path)
+            return UnstructuredPDFLoader(file_path, mode="paged" if paged else "single")
         elif file_extension in [".md", ".markdown"]:
-            loader = UnstructuredMarkdownLoader(file_path)
+            return UnstructuredMarkdownLoader(file_path)
         elif file_extension in [".htm", ".html"]:
-            loader = UnstructuredHTMLLoader(file_path)
+            return UnstructuredHTMLLoader(file_path)
         elif file_extension == ".csv":
-            loader = UnstructuredCSVLoader(file_path)
-        elif file_extension in [".ppt", "pptx"]:
-            loader = UnstructuredPowerPointLoader(file_path)
+            return UnstructuredCSVLoader(file_path)
+        elif file_extension in [".ppt", ".pptx"]:
+            return UnstructuredPowerPointLoader(
+                file_path, mode="paged" if paged else "single"
+            )
         elif file_extension == ".xml":
-            loader = UnstructuredXMLLoader(file_path)
+            return UnstructuredXMLLoader(file_path)
         else:
-            loader = (
+            return (
                 UnstructuredFileLoader(file_path)
                 if is_unstructured
                 else TextLoader(file_path, encoding="utf-8")
             )
 
-        # 3.返回加载的文档列表或者文本
-        return (
-            delimiter.join([document.page_content for document in loader.load()])
-            if return_text
-            else loader.load()
-        )
+    @classmethod
+    def _merge_excel_elements(cls, elements: Iterator[Document]) -> Iterator[Document]:
+        """Excel按元素加载时会将一个工作表拆分成多个元素(表格/标题等)，将同一工作表的相邻元素合并成一个文档"""
+        for (source, page_number, page_name), sheet_elements in groupby(
+            elements,
+            key=lambda element: (
+                element.metadata.get("source"),
+                element.metadata.get("page_number"),
+                element.metadata.get("page_name"),
+            ),
+        ):
+            yield Document(
+                page_content="\n\n".join(
+                    element.page_content for element in sheet_elements
+                ),
+                metadata={
+                    "source": source,
+                    "page_number": page_number,
+                    "page_name": page_name,
+                },
+            )
+
+    @classmethod
+    def _download_from_url(
+        cls, url: str, file_path: str, max_size: int = MAX_EXTRACT_FILE_SIZE
+    ):
+        """以流式的方式将远程URL文件下载到本地，超过大小限制时抛出异常"""
+        with requests.get(url, stream=True) as response:
+            # 1.请求失败时不能将错误页面当作文件内容解析
+            if not response.ok:
+                raise FailException(f"远程文件下载失败，状态码：{response.status_code}")
+
+            # 2.流式写入本地文件并校验文件大小
+            size = 0
+            with open(file_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FailException("远程文件大小超过解析限制")
+                    file.write(chunk)
@@ -1,4 +1,12 @@
+from .diversity import maximal_marginal_relevance, suppress_near_duplicates
 from .full_text_retriever import FullTextRetriever
+from .hybrid_retriever import HybridRetriever
 from .semantic_retriever import SemanticRetriever
 
-__all__ = ["SemanticRetriever", "FullTextRetriever"]
+__all__ = [
+    "SemanticRetriever",
+    "FullTextRetriever",
+    "HybridRetriever",
+    "maximal_marginal_relevance",
+    "suppress_near_duplicates",
+]
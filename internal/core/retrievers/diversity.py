@@ -0,0 +1,101 @@
+import re
+import zlib
+
+import numpy as np
+from langchain_core.documents import Document as LCDocument
+
+# MinHash使用的梅森素数，哈希函数为(a*x+b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+
+def maximal_marginal_relevance(
+    query_vector: list[float],
+    vectors: list[list[float]],
+    k: int = 4,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """最大边际相关性(MMR)重排序，返回选中记录的下标，lambda_mult越小结果越多样"""
+    if len(vectors) == 0 or k <= 0:
+        return []
+
+    # 1.归一化向量后一次性计算与查询的相关性以及记录之间的相似度矩阵
+    matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+    query = _normalize(np.asarray([query_vector], dtype=np.float32))[0]
+    relevance = matrix @ query
+    similarity = matrix @ matrix.T
+
+    # 2.第一条选择相关性最高的记录，之后每次选择相关性与冗余度权衡后得分最高的记录
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    candidates = np.ones(len(matrix), dtype=bool)
+    candidates[selected[0]] = False
+    while len(selected) < min(k, len(matrix)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~candidates] = -np.inf
+        index = int(np.argmax(scores))
+        selected.append(index)
+        candidates[index] = False
+        np.maximum(max_similarity, similarity[index], out=max_similarity)
+
+    return selected
+
+
+def suppress_near_duplicates(
+    lc_documents: list[LCDocument],
+    threshold: float = 0.8,
+    shingle_size: int = 5,
+    num_perm: int = 64,
+) -> list[LCDocument]:
+    """基于字符shingle的MinHash签名去除近似重复的文档，按顺序保留先出现的文档"""
+    if len(lc_documents) <= 1 or threshold >= 1:
+        return list(lc_documents)
+
+    # 1.计算每条文档的MinHash签名，并通过签名估算两两之间的Jaccard相似度
+    signatures = np.stack(
+        [
+            _minhash_signature(lc_document.page_content, shingle_size, num_perm)
+            for lc_document in lc_documents
+        ]
+    )
+    similarity = (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+
+    # 2.依次判断每条文档与已保留文档的相似度，超过阈值的视为重复文档
+    kept = np.zeros(len(lc_documents), dtype=bool)
+    for index in range(len(lc_documents)):
+        if not (similarity[index][kept] >= threshold).any():
+            kept[index] = True
+
+    return [lc_document for lc_document, keep in zip(lc_documents, kept) if keep]
+
+
+def _minhash_signature(text: str, shingle_size: int, num_perm: int) -> np.ndarray:
+    """计算文本的MinHash签名，忽略大小写、空白及标点符号的差异"""
+    # 1.规范化文本并切分成字符shingle，文本长度不足时整段作为一个shingle
+    text = re.sub(r"[\W_]+", "", text.lower())
+    shingles = {
+        text[i : i + shingle_size] for i in range(max(len(text) - shingle_size + 1, 1))
+    }
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+    # 2.使用固定种子生成的num_perm个哈希函数，取每个哈希函数下的最小值作为签名
+    a, b = _hash_params(num_perm)
+    return ((np.outer(hashes, a) + b) % _MERSENNE_PRIME).min(axis=0)
+
+
+def _hash_params(num_perm: int) -> tuple[np.ndarray, np.ndarray]:
+    """生成MinHash的哈希函数参数，a小于2^31以保证a*x+b不会超出uint64范围"""
+    rng = np.random.default_rng(num_perm)
+    return (
+        rng.integers(1, 1 << 31, num_perm, dtype=np.uint64),
+        rng.integers(0, 1 << 31, num_perm, dtype=np.uint64),
+    )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行归一化向量矩阵，零向量保持不变"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
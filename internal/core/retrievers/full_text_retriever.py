@@ -1,22 +1,28 @@
-from collections import Counter
+from typing import Optional
 from uuid import UUID
 
+import numpy as np
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.documents import Document as LCDocument
 from langchain_core.pydantic_v1 import Field
 from langchain_core.retrievers import BaseRetriever
+from sqlalchemy import text
 
-from internal.model import KeywordTable, Segment
+from internal.model import KeywordPosting, KeywordStatistic, Segment
 from internal.service import JiebaService
 from pkg.sqlalchemy import SQLAlchemy
 
 
 class FullTextRetriever(BaseRetriever):
-    """全文检索器"""
+    """全文检索器，基于关键词倒排索引及BM25打分"""
 
     db: SQLAlchemy
     dataset_ids: list[UUID]
     jieba_service: JiebaService
+    k1: float = 1.5  # BM25词频饱和参数
+    b: float = 0.75  # BM25片段长度归一化参数
+    # 单条查询语句的超时时间(秒)，超时后由数据库终止查询
+    timeout: Optional[float] = None
     search_kwargs: dict = Field(default_factory=dict)
 
     def _get_relevant_documents(
@@ -29,32 +35,49 @@ class FullTextRetriever(BaseRetriever):
         # 1.将查询query转换成关键词列表
         keywords = self.jieba_service.extract_keywords(query, 10)
 
-        # 2.查找指定知识库的关键词表
-        keyword_tables = [
-            keyword_table
-            for keyword_table, in self.db.session.query(KeywordTable)
-            .with_entities(KeywordTable.keyword_table)
-            .filter(KeywordTable.dataset_id.in_(self.dataset_ids))
-            .all()
-        ]
+        # 2.设置了超时时间时在当前事务中设置语句超时，超时的检索由数据库直接终止，不会在后台继续占用连接
+        if self.timeout:
+            self.db.session.execute(
+                text(
+                    f"SET LOCAL statement_timeout = {max(int(self.timeout * 1000), 1)}"
+                )
+            )
 
-        # 3.遍历所有的知识库关键词表，找到匹配query关键词的id列表
-        all_ids = []
-        for keyword_table in keyword_tables:
-            # 4.遍历每一个关键词表的每一项
-            for keyword, segment_ids in keyword_table.items():
-                # 5.如果数据存在则提取关键词对应的片段id列表
-                if keyword in keywords:
-                    all_ids.extend(segment_ids)
+        # 3.一次查询从倒排索引中取出所有query关键词的倒排列表，并左关联知识库关键词统计(统计缺失时使用估算值)
+        postings = (
+            self.db.session.query(
+                KeywordPosting.dataset_id,
+                KeywordPosting.keyword,
+                KeywordPosting.segment_id,
+                KeywordPosting.frequency,
+                KeywordPosting.segment_length,
+                KeywordStatistic.segment_count,
+                KeywordStatistic.total_length,
+            )
+            .outerjoin(
+                KeywordStatistic,
+                KeywordStatistic.dataset_id == KeywordPosting.dataset_id,
+            )
+            .filter(
+                KeywordPosting.dataset_id.in_(self.dataset_ids),
+                KeywordPosting.keyword.in_(keywords),
+            )
+            .all()
+        )
+        if not postings:
+            return []
 
-        # 6.统计segment_id出现的频率，这里可以使用Counter进行快速统计
-        id_counter = Counter(all_ids)
+        # 4.使用BM25计算每个片段的得分
+        segment_ids, scores = self._bm25(postings)
 
-        # 7.获取频率最高的前k条数据，格式为[(segment_id, freq), (segment_id, freq), ...]
+        # 5.获取得分最高的前k条数据，格式为[(segment_id, score), (segment_id, score), ...]
         k = self.search_kwargs.get("k", 4)
-        top_k_ids = id_counter.most_common(k)
+        top_k_ids = [
+            (segment_ids[index], float(scores[index]))
+            for index in np.argsort(-scores, kind="stable")[:k]
+        ]
 
-        # 8.根据得到的id列表检索数据库得到片段列表信息
+        # 6.根据得到的id列表检索数据库得到片段列表信息
         segments = (
             self.db.session.query(Segment)
             .filter(Segment.id.in_([id for id, _ in top_k_ids]))
@@ -62,12 +85,12 @@ class FullTextRetriever(BaseRetriever):
         )
         segment_dict = {str(segment.id): segment for segment in segments}
 
-        # 9.根据频率进行排序
+        # 7.根据得分进行排序
         sorted_segments = [
-            segment_dict[str(id)] for id, freq in top_k_ids if id in segment_dict
+            (segment_dict[id], score) for id, score in top_k_ids if id in segment_dict
         ]
 
-        # 10.构建LangChain文档列表
+        # 8.构建LangChain文档列表
         lc_documents = [
             LCDocument(
                 page_content=segment.content,
@@ -79,10 +102,68 @@ class FullTextRetriever(BaseRetriever):
                     "node_id": str(segment.node_id),
                     "document_enabled": True,
                     "segment_enabled": True,
-                    "score": 0,
+                    "score": score,
                 },
             )
-            for segment in sorted_segments
+            for segment, score in sorted_segments
         ]
 
         return lc_documents
+
+    def _bm25(self, postings: list) -> tuple[list[str], np.ndarray]:
+        """根据倒排列表计算BM25得分，文档频率为知识库内关键词倒排列表的长度，返回片段id列表及对应得分"""
+        # 1.将倒排记录转换成数组，知识库关键词统计缺失时使用倒排列表中出现的片段估算片段数及总长度
+        dataset_ids, keywords, segment_ids, frequency, length, count, total = zip(
+            *postings
+        )
+        dataset_segments = {}
+        for dataset_id, segment_id, segment_length in zip(
+            dataset_ids, segment_ids, length
+        ):
+            dataset_segments.setdefault(str(dataset_id), {})[
+                str(segment_id)
+            ] = segment_length
+        fallback = {
+            dataset_id: (len(segments), sum(segments.values()))
+            for dataset_id, segments in dataset_segments.items()
+        }
+        count = [
+            fallback[str(dataset_id)][0] if value is None else value
+            for dataset_id, value in zip(dataset_ids, count)
+        ]
+        total = [
+            fallback[str(dataset_id)][1] if value is None else value
+            for dataset_id, value in zip(dataset_ids, total)
+        ]
+
+        # 2.按(知识库, 关键词)分组统计文档频率
+        _, term_index, df = np.unique(
+            [
+                f"{dataset_id}:{keyword}"
+                for dataset_id, keyword in zip(dataset_ids, keywords)
+            ],
+            return_inverse=True,
+            return_counts=True,
+        )
+        df = df[term_index].astype(np.float64)
+        frequency = np.asarray(frequency, dtype=np.float64)
+        length = np.asarray(length, dtype=np.float64)
+        count = np.maximum(np.asarray(count, dtype=np.float64), df)
+        avg_length = np.maximum(np.asarray(total, dtype=np.float64), 1) / np.maximum(
+            count, 1
+        )
+
+        # 3.计算每条倒排记录的BM25得分
+        idf = np.log(1 + (count - df + 0.5) / (df + 0.5))
+        scores = (
+            idf
+            * frequency
+            * (self.k1 + 1)
+            / (frequency + self.k1 * (1 - self.b + self.b * length / avg_length))
+        )
+
+        # 4.按照片段聚合得分
+        unique_segment_ids, segment_index = np.unique(
+            [str(segment_id) for segment_id in segment_ids], return_inverse=True
+        )
+        return unique_segment_ids.tolist(), np.bincount(segment_index, weights=scores)
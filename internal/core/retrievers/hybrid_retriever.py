@@ -0,0 +1,141 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Optional
+
+from flask import Flask
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document as LCDocument
+from langchain_core.pydantic_v1 import Field
+from langchain_core.retrievers import BaseRetriever
+
+from internal.entity.dataset_entity import FusionStrategy
+
+# 进程内共享的混合检索线程池，所有请求共用同一个有界线程池，避免每次检索创建线程池导致线程数随并发请求数增长
+_hybrid_executor: Optional[ThreadPoolExecutor] = None
+_hybrid_executor_lock = Lock()
+
+
+def _get_hybrid_executor(max_workers: int) -> ThreadPoolExecutor:
+    """获取当前进程的混合检索线程池，不存在时按传递的线程数创建"""
+    global _hybrid_executor
+    with _hybrid_executor_lock:
+        if _hybrid_executor is None:
+            _hybrid_executor = ThreadPoolExecutor(
+                max_workers=max(max_workers, 1), thread_name_prefix="hybrid-retriever"
+            )
+        return _hybrid_executor
+
+
+def _reset_hybrid_executor_after_fork() -> None:
+    """fork后的子进程(如celery worker)不能复用父进程的线程池及锁，需要重新创建"""
+    global _hybrid_executor, _hybrid_executor_lock
+    _hybrid_executor = None
+    _hybrid_executor_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_hybrid_executor_after_fork)
+
+
+class HybridRetriever(BaseRetriever):
+    """混合检索器，在进程共享的有界线程池中并发执行多个检索器(每个检索器使用独立的应用上下文及数据库会话)，并使用RRF或加权得分融合结果"""
+
+    flask_app: Flask
+    retrievers: list[BaseRetriever]
+    weights: list[float]
+    fusion_strategy: str = FusionStrategy.RRF
+    rrf_k: int = 60  # RRF平滑常数，值越大排名靠后的文档权重衰减越慢
+    # 每个检索器的超时时间(秒)，超时的检索器结果会被丢弃，检索器自身也需要按该时间设置底层客户端超时，保证超时后停止执行
+    timeout: float = 5
+    search_kwargs: dict = Field(default_factory=dict)
+    degraded: bool = False  # 最近一次检索是否有检索器超时或出错导致结果不完整
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+    ) -> list[LCDocument]:
+        """并发执行所有检索器，丢弃超时或出错的检索器结果后融合并返回前k条"""
+        # 1.在共享线程池中并发执行所有检索器，执行完成或者超时后立即返回，超时仍在排队的任务直接取消
+        executor = _get_hybrid_executor(
+            self.flask_app.config.get("HYBRID_RETRIEVAL_MAX_WORKERS", 16)
+        )
+        futures = [
+            executor.submit(self._invoke, retriever, query)
+            for retriever in self.retrievers
+        ]
+        wait(futures, timeout=self.timeout)
+        for future in futures:
+            future.cancel()
+
+        # 2.收集已完成检索器的结果，超时(含检索器自身超时)或出错的检索器降级为空结果
+        self.degraded = False
+        results = []
+        for retriever, future in zip(self.retrievers, futures):
+            if (
+                future.cancelled()
+                or not future.done()
+                or isinstance(future.exception(), TimeoutError)
+            ):
+                logging.warning(
+                    f"混合检索中检索器超时, retriever: {type(retriever).__name__}"
+                )
+                self.degraded = True
+                results.append([])
+            elif future.exception() is not None:
+                logging.error(
+                    f"混合检索中检索器出错, retriever: {type(retriever).__name__}, 错误信息: {str(future.exception())}"
+                )
+                self.degraded = True
+                results.append([])
+            else:
+                results.append(future.result())
+
+        # 3.融合结果并返回前k条
+        k = self.search_kwargs.get("k", 4)
+        return self._fuse(results)[:k]
+
+    def _invoke(self, retriever: BaseRetriever, query: str) -> list[LCDocument]:
+        """在独立的应用上下文中执行检索器，确保每个检索器使用自己的数据库会话"""
+        with self.flask_app.app_context():
+            return retriever.invoke(query)
+
+    def _fuse(self, results: list[list[LCDocument]]) -> list[LCDocument]:
+        """按照片段id合并各检索器的结果，根据融合策略计算得分并倒序排列"""
+        fused_scores: dict[str, float] = {}
+        documents: dict[str, LCDocument] = {}
+        for lc_documents, weight in zip(results, self.weights):
+            for lc_document, score in zip(lc_documents, self._score(lc_documents)):
+                segment_id = str(lc_document.metadata["segment_id"])
+                documents.setdefault(segment_id, lc_document)
+                fused_scores[segment_id] = (
+                    fused_scores.get(segment_id, 0) + weight * score
+                )
+
+        return [
+            documents[segment_id]
+            for segment_id in sorted(
+                fused_scores,
+                key=lambda segment_id: fused_scores[segment_id],
+                reverse=True,
+            )
+        ]
+
+    def _score(self, lc_documents: list[LCDocument]) -> list[float]:
+        """计算单个检索器结果中每条文档的融合得分"""
+        # 1.RRF融合只使用排名，得分为1/(rrf_k+排名)
+        if self.fusion_strategy == FusionStrategy.RRF:
+            return [1 / (self.rrf_k + rank) for rank in range(1, len(lc_documents) + 1)]
+
+        # 2.加权融合使用归一化后的检索得分，得分无区分度(如全文检索)时按排名线性衰减
+        scores: list[float] = [
+            lc_document.metadata.get("score", 0) or 0 for lc_document in lc_documents
+        ]
+        if not scores:
+            return []
+        max_score, min_score = max(scores), min(scores)
+        if max_score > min_score:
+            return [(score - min_score) / (max_score - min_score) for score in scores]
+        return [1 - rank / len(scores) for rank in range(len(scores))]
@@ -1,18 +1,24 @@
+from typing import Optional
 from uuid import UUID
 
 from langchain_core.callbacks import CallbackManagerForRetrieverRun
 from langchain_core.pydantic_v1 import Field
 from langchain_core.retrievers import BaseRetriever
-from langchain_weaviate import WeaviateVectorStore
-from weaviate.classes.query import Filter
+
+from internal.core.vector_database import BaseVectorDatabase
+from .diversity import maximal_marginal_relevance
 
 
 class SemanticRetriever(BaseRetriever):
     """相似性检索器/向量检索器"""
 
     dataset_ids: list[UUID]
-    vector_store: WeaviateVectorStore
+    vector_database: BaseVectorDatabase
+    # 检索类型，mmr时一次性获取fetch_k条候选记录并按最大边际相关性重排序
+    search_type: str = "similarity"
     search_kwargs: dict = Field(default_factory=dict)
+    # 检索超时时间(秒)，传递给向量数据库，超时后停止检索并抛出TimeoutError
+    timeout: Optional[float] = None
 
     def _get_relevant_documents(
         self,
@@ -24,23 +30,19 @@ class SemanticRetriever(BaseRetriever):
         # 1.提取最大搜索条件k，默认值为4
         k = self.search_kwargs.pop("k", 4)
 
-        # 2.执行相似性检索并获取得分信息
-        search_result = self.vector_store.similarity_search_with_relevance_scores(
-            query=query,
-            k=k,
-            **{
-                "filters": Filter.all_of(
-                    [
-                        Filter.by_property("dataset_id").contains_any(
-                            [str(dataset_id) for dataset_id in self.dataset_ids]
-                        ),
-                        Filter.by_property("document_enabled").equal(True),
-                        Filter.by_property("segment_enabled").equal(True),
-                    ]
-                ),
-                **self.search_kwargs,
-            },
-        )
+        # 2.执行相似性检索并获取得分信息，知识库及启用状态的过滤由向量数据库后端完成
+        if self.search_type == "mmr":
+            search_result = self._max_marginal_relevance_search(query, k)
+        else:
+            search_result = (
+                self.vector_database.similarity_search_with_relevance_scores(
+                    query=query,
+                    dataset_ids=[str(dataset_id) for dataset_id in self.dataset_ids],
+                    k=k,
+                    timeout=self.timeout,
+                    **self.search_kwargs,
+                )
+            )
         if search_result is None or len(search_result) == 0:
             return []
         lc_documents, scores = zip(*search_result)
@@ -50,3 +52,25 @@ class SemanticRetriever(BaseRetriever):
             lc_document.metadata["score"] = score
 
         return list(lc_documents)
+
+    def _max_marginal_relevance_search(self, query: str, k: int) -> list:
+        """获取fetch_k条候选记录及其存储的向量，使用最大边际相关性选出前k条，返回(文档, 得分)列表"""
+        # 1.一次调用获取查询向量、候选记录以及记录向量
+        query_vector, candidates = self.vector_database.similarity_search_with_vectors(
+            query=query,
+            dataset_ids=[str(dataset_id) for dataset_id in self.dataset_ids],
+            k=max(self.search_kwargs.get("fetch_k", 20), k),
+            score_threshold=self.search_kwargs.get("score_threshold"),
+            timeout=self.timeout,
+        )
+        if not candidates:
+            return []
+
+        # 2.按照最大边际相关性重排序并取前k条
+        indexes = maximal_marginal_relevance(
+            query_vector,
+            [vector for _, _, vector in candidates],
+            k=k,
+            lambda_mult=self.search_kwargs.get("lambda_mult", 0.5),
+        )
+        return [(candidates[index][0], candidates[index][1]) for index in indexes]
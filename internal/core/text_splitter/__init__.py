@@ -0,0 +1,3 @@
+from .token_text_splitter import TokenAwareTextSplitter
+
+__all__ = ["TokenAwareTextSplitter"]
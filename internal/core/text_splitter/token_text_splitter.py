@@ -0,0 +1,173 @@
+import copy
+import re
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+import tiktoken
+from langchain_core.documents import Document
+from langchain_text_splitters import TextSplitter
+
+
+class TokenAwareTextSplitter(TextSplitter):
+    """基于token偏移的递归文本分割器，分割过程中每个文档只编码一次，并计算每个片段的准确token数"""
+
+    def __init__(
+        self,
+        separators: list[str],
+        encoding_name: str = "cl100k_base",
+        **kwargs,
+    ) -> None:
+        """构造函数，编译正则分隔符并初始化tiktoken编码器"""
+        super().__init__(**kwargs)
+        self._separators = [
+            re.compile(separator) if separator else None for separator in separators
+        ]
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def split_text(self, text: str) -> list[str]:
+        """分割传递的文本，返回片段文本列表"""
+        return [chunk for chunk, _ in self.split_text_with_token_count(text)]
+
+    def split_text_with_token_count(self, text: str) -> list[tuple[str, int]]:
+        """分割传递的文本，返回片段文本以及对应的token数"""
+        # 1.整个文本只编码一次，并获取每个token在文本中的起始字符偏移，末尾追加文本长度作为最后一个token的结束偏移
+        tokens = self._encoding.encode(text, disallowed_special=())
+        _, offsets = self._encoding.decode_with_offsets(tokens)
+        offsets = [*offsets, len(text)]
+
+        # 2.基于字符区间递归分割文本，区间的token数通过偏移二分计算
+        ranges = self._split_range(text, offsets, 0, len(text), 0)
+
+        # 3.去除片段两端的空白字符，片段边界可能改变分词结果，因此对最终片段重新编码得到准确的token数
+        chunks = []
+        for start, end in ranges:
+            if self._strip_whitespace:
+                while start < end and text[start].isspace():
+                    start += 1
+                while end > start and text[end - 1].isspace():
+                    end -= 1
+            if start < end:
+                chunk = text[start:end]
+                chunks.append(
+                    (chunk, len(self._encoding.encode(chunk, disallowed_special=())))
+                )
+
+        return chunks
+
+    def create_documents(
+        self, texts: list[str], metadatas: Optional[list[dict]] = None
+    ) -> list[Document]:
+        """根据文本列表创建片段文档列表，每个片段的token数会记录在元数据的token_count中"""
+        metadatas = metadatas or [{}] * len(texts)
+        documents = []
+        for text, metadata in zip(texts, metadatas):
+            for chunk, token_count in self.split_text_with_token_count(text):
+                documents.append(
+                    Document(
+                        page_content=chunk,
+                        metadata={
+                            **copy.deepcopy(metadata),
+                            "token_count": token_count,
+                        },
+                    )
+                )
+        return documents
+
+    def _count(self, text: str, offsets: list[int], start: int, end: int) -> int:
+        """计算字符区间[start, end)的token数，完整落在区间内的token通过偏移二分计算，两端被截断的文本则重新编码"""
+        # 1.查找区间内第一个和最后一个token边界，多个token共用同一字符时边界会重复，取最靠前的一个
+        first = bisect_left(offsets, start)
+        last = bisect_left(offsets, end)
+        if last == len(offsets) or offsets[last] != end:
+            last -= 1
+
+        # 2.区间内没有完整的token，直接对区间文本重新编码
+        if first >= last:
+            return len(self._encoding.encode(text[start:end], disallowed_special=()))
+
+        # 3.完整token数加上两端截断文本重新编码后的token数
+        head = text[start : offsets[first]]
+        tail = text[offsets[last] : end]
+        return (
+            last
+            - first
+            + (len(self._encoding.encode(head, disallowed_special=())) if head else 0)
+            + (len(self._encoding.encode(tail, disallowed_special=())) if tail else 0)
+        )
+
+    def _split_range(
+        self, text: str, offsets: list[int], start: int, end: int, index: int
+    ) -> list[tuple[int, int]]:
+        """使用第index个及之后的分隔符递归分割字符区间，返回片段的字符区间列表"""
+        # 1.查找第一个在区间内能匹配到的分隔符，空分隔符表示按字符分割
+        separator, next_index = None, len(self._separators)
+        for i in range(index, len(self._separators)):
+            pattern = self._separators[i]
+            if pattern is None or pattern.search(text, start, end):
+                separator, next_index = pattern, i + 1
+                break
+
+        # 2.使用分隔符将区间拆分成连续的小区间，分隔符保留在下一个小区间的开头
+        pieces = self._split_pieces(text, start, end, separator)
+
+        # 3.token数不超过chunk_size的小区间进行合并，超过的则使用下一个分隔符继续分割
+        chunks, good_pieces = [], []
+        for piece_start, piece_end in pieces:
+            if self._count(text, offsets, piece_start, piece_end) <= self._chunk_size:
+                good_pieces.append((piece_start, piece_end))
+                continue
+            if good_pieces:
+                chunks.extend(self._merge_pieces(text, offsets, good_pieces))
+                good_pieces = []
+            if next_index >= len(self._separators):
+                chunks.append((piece_start, piece_end))
+            else:
+                chunks.extend(
+                    self._split_range(text, offsets, piece_start, piece_end, next_index)
+                )
+        if good_pieces:
+            chunks.extend(self._merge_pieces(text, offsets, good_pieces))
+
+        return chunks
+
+    @classmethod
+    def _split_pieces(
+        cls, text: str, start: int, end: int, separator: Optional[re.Pattern]
+    ) -> Iterable[tuple[int, int]]:
+        """使用分隔符将字符区间拆分成连续的小区间"""
+        if separator is None:
+            return [(i, i + 1) for i in range(start, end)]
+
+        pieces, prev = [], start
+        for match in separator.finditer(text, start, end):
+            if match.start() > prev:
+                pieces.append((prev, match.start()))
+                prev = match.start()
+        pieces.append((prev, end))
+        return pieces
+
+    def _merge_pieces(
+        self, text: str, offsets: list[int], pieces: list[tuple[int, int]]
+    ) -> list[tuple[int, int]]:
+        """将连续的小区间合并成不超过chunk_size的片段，相邻片段之间保留不超过chunk_overlap的重叠"""
+        chunks, head, current = [], 0, []
+        for piece_start, piece_end in pieces:
+            if (
+                head < len(current)
+                and self._count(text, offsets, current[head][0], piece_end)
+                > self._chunk_size
+            ):
+                chunks.append((current[head][0], current[-1][1]))
+                # 从头部移除小区间，直到剩余部分满足重叠大小且能容纳新的小区间
+                while head < len(current) and (
+                    self._count(text, offsets, current[head][0], current[-1][1])
+                    > self._chunk_overlap
+                    or self._count(text, offsets, current[head][0], piece_end)
+                    > self._chunk_size
+                ):
+                    head += 1
+            current.append((piece_start, piece_end))
+        if head < len(current):
+            chunks.append((current[head][0], current[-1][1]))
+
+        return chunks
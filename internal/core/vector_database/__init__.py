@@ -0,0 +1,9 @@
+from .base_vector_database import BaseVectorDatabase
+from .local_vector_database import LocalVectorDatabase
+from .weaviate_vector_database import WeaviateVectorDatabase
+
+__all__ = [
+    "BaseVectorDatabase",
+    "LocalVectorDatabase",
+    "WeaviateVectorDatabase",
+]
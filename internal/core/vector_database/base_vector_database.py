@@ -0,0 +1,82 @@
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from langchain_core.documents import Document
+
+
+class BaseVectorDatabase(ABC):
+    """向量数据库后端基类，统一索引构建与检索流程所需的增删改查操作"""
+
+    @abstractmethod
+    def add_vectors(
+        self,
+        dataset_id: str,
+        documents: list[Document],
+        ids: list[str],
+        vectors: list[list[float]],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """往知识库中新增文档及其向量，文档元数据作为可过滤属性存储，batch_size为单次批量写入的记录数，返回写入失败的id列表"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(
+        self,
+        dataset_id: str,
+        id: str,
+        properties: dict[str, Any],
+        vector: Optional[list[float]] = None,
+    ) -> None:
+        """更新单条记录的属性，传递vector时同步更新向量"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_in_batch(
+        self,
+        dataset_id: str,
+        ids: list[str],
+        properties: dict[str, Any],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """将同一组属性批量更新到id列表对应的记录，返回更新失败(含不存在)的id列表"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_by_ids(self, dataset_id: str, ids: list[str]) -> None:
+        """根据id列表删除知识库中的记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_by_document_id(self, dataset_id: str, document_id: str) -> None:
+        """删除文档关联的所有记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_by_dataset_id(self, dataset_id: str) -> None:
+        """删除知识库关联的所有记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """在知识库列表中执行相似性检索，只返回文档与片段均已启用的记录，得分越高越相似，超过timeout(秒)时停止检索并抛出TimeoutError"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def similarity_search_with_vectors(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[float], list[tuple[Document, float, list[float]]]]:
+        """执行相似性检索并返回查询向量以及每条记录的得分与存储的向量，供最大边际相关性(MMR)等重排序使用，超时处理同上"""
+        raise NotImplementedError
@@ -0,0 +1,460 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from bisect import bisect_right
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Iterator, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from internal.exception import NotFoundException
+from .base_vector_database import BaseVectorDatabase
+
+try:
+    import fcntl
+except ImportError:  # windows下不支持fcntl，退化为只使用进程内锁
+    fcntl = None
+
+
+@dataclass
+class _LocalIndex:
+    """单个知识库的本地索引快照，由只追加的变更日志回放得到，向量分片使用内存映射加载且写入后不再修改"""
+
+    # id -> (文本, 元数据, 向量行号)
+    records: dict[str, tuple[str, dict[str, Any], int]]
+    # 归一化后的float32向量分片，所有分片按写入顺序拼接后的行号即向量行号
+    shards: list[np.ndarray]
+    offsets: list[int]  # 每个分片第一行对应的向量行号
+    dead_rows: int  # 已被覆盖或删除的向量行数
+    operation_count: int  # 变更日志中的操作数
+    # 变更日志的inode+已读取的字节数，用于增量读取其他进程追加的操作
+    version: tuple[int, int]
+    _search_arrays: Optional[tuple[list[str], np.ndarray, np.ndarray]] = field(
+        default=None, repr=False
+    )
+
+    @property
+    def search_arrays(self) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """懒计算检索使用的id列表、向量行号数组及文档与片段均已启用的布尔掩码"""
+        if self._search_arrays is None:
+            ids = list(self.records.keys())
+            self._search_arrays = (
+                ids,
+                np.fromiter(
+                    (self.records[id][2] for id in ids), dtype=np.int64, count=len(ids)
+                ),
+                np.fromiter(
+                    (
+                        self.records[id][1].get("document_enabled") is True
+                        and self.records[id][1].get("segment_enabled") is True
+                        for id in ids
+                    ),
+                    dtype=bool,
+                    count=len(ids),
+                ),
+            )
+        return self._search_arrays
+
+    def vector(self, row: int) -> np.ndarray:
+        """根据向量行号获取向量"""
+        shard = bisect_right(self.offsets, row) - 1
+        return self.shards[shard][row - self.offsets[shard]]
+
+
+class LocalVectorDatabase(BaseVectorDatabase):
+    """本地向量数据库，每个知识库对应一个NumPy扁平索引，向量按批次写入分片文件，记录变更追加到日志文件，适合小规模知识库及离线测试"""
+
+    LOG_FILE = "records.jsonl"
+    SHARDS_DIR = "shards"
+    LOCK_FILE = ".lock"
+    COMPACT_MAX_SHARDS = 64  # 分片数超过上限时合并为一个分片
+    COMPACT_MAX_OPERATIONS = 1024  # 变更日志的操作数超过上限时重写日志
+
+    def __init__(self, embeddings: Embeddings, root_path: str):
+        """构造函数，传递文本嵌入模型及索引存储根目录"""
+        self.embeddings = embeddings
+        self.root_path = root_path
+        self._indexes: dict[str, _LocalIndex] = {}
+        self._lock = Lock()
+
+    def add_vectors(
+        self,
+        dataset_id: str,
+        documents: list[Document],
+        ids: list[str],
+        vectors: list[list[float]],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """往知识库索引中追加记录，已存在的id会被覆盖，每次调用只写入一个新的向量分片并追加一条日志"""
+        if not ids:
+            return []
+        new_vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+
+        with self._write(dataset_id):
+            self._append_log(
+                dataset_id,
+                {
+                    "op": "add",
+                    "shard": self._write_shard(dataset_id, new_vectors),
+                    "records": [
+                        {
+                            "id": str(id),
+                            "text": document.page_content,
+                            "metadata": dict(document.metadata),
+                        }
+                        for id, document in zip(ids, documents)
+                    ],
+                },
+            )
+
+        return []
+
+    def update(
+        self,
+        dataset_id: str,
+        id: str,
+        properties: dict[str, Any],
+        vector: Optional[list[float]] = None,
+    ) -> None:
+        """更新单条记录的属性，只修改属性时只追加一条日志，传递向量时写入一个单行分片"""
+        with self._write(dataset_id) as index:
+            # 1.查找对应的记录
+            id = str(id)
+            if id not in index.records:
+                raise NotFoundException(f"向量数据库记录不存在: {id}")
+
+            # 2.未传递向量时只记录属性变更，text属性对应记录的文本内容
+            if vector is None:
+                self._append_log(
+                    dataset_id, {"op": "update", "ids": [id], "properties": properties}
+                )
+                return
+
+            # 3.传递了向量时合并属性后作为新记录写入，覆盖原有记录
+            properties = dict(properties)
+            text, metadata, _ = index.records[id]
+            self._append_log(
+                dataset_id,
+                {
+                    "op": "add",
+                    "shard": self._write_shard(
+                        dataset_id,
+                        self._normalize(np.asarray([vector], dtype=np.float32)),
+                    ),
+                    "records": [
+                        {
+                            "id": id,
+                            "text": properties.pop("text", text),
+                            "metadata": {**metadata, **properties},
+                        }
+                    ],
+                },
+            )
+
+    def update_in_batch(
+        self,
+        dataset_id: str,
+        ids: list[str],
+        properties: dict[str, Any],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """批量更新记录的属性，只追加一条日志"""
+        with self._write(dataset_id) as index:
+            ids = [str(id) for id in ids]
+            updated_ids = [id for id in ids if id in index.records]
+            if updated_ids:
+                self._append_log(
+                    dataset_id,
+                    {"op": "update", "ids": updated_ids, "properties": properties},
+                )
+
+        return [id for id in ids if id not in index.records]
+
+    def delete_by_ids(self, dataset_id: str, ids: list[str]) -> None:
+        id_set = set(str(id) for id in ids)
+        self._delete_where(dataset_id, lambda id, metadata: id in id_set)
+
+    def delete_by_document_id(self, dataset_id: str, document_id: str) -> None:
+        document_id = str(document_id)
+        self._delete_where(
+            dataset_id, lambda id, metadata: metadata.get("document_id") == document_id
+        )
+
+    def delete_by_dataset_id(self, dataset_id: str) -> None:
+        """删除知识库对应的整个索引目录"""
+        with self._lock, self._file_lock(dataset_id, exclusive=True):
+            self._indexes.pop(str(dataset_id), None)
+            shutil.rmtree(self._dataset_path(dataset_id), ignore_errors=True)
+
+    def similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """计算查询向量与各知识库索引的相关性得分，过滤未启用的记录后合并取前k条"""
+        _, search_result = self.similarity_search_with_vectors(
+            query, dataset_ids, k, score_threshold, timeout
+        )
+        return [(document, score) for document, score, _ in search_result]
+
+    def similarity_search_with_vectors(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[float], list[tuple[Document, float, list[float]]]]:
+        """执行相似性检索并返回查询向量及记录归一化后的向量，得分为映射到[0, 1]的余弦相似度(1 + cos) / 2"""
+        # 1.计算并归一化查询向量
+        deadline = time.monotonic() + timeout if timeout else None
+        query_vector = self._normalize(
+            np.asarray([self.embeddings.embed_query(query)], dtype=np.float32)
+        )[0]
+
+        # 2.在每个知识库索引中分别取前k条候选记录，逐个分片计算内积，避免拼接向量矩阵
+        candidates = []
+        for dataset_id in dataset_ids:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"本地向量数据库检索超时, timeout: {timeout}s")
+            index = self._get_index(dataset_id)
+            if not index.records:
+                continue
+            ids, rows, enabled = index.search_arrays
+            similarities = np.concatenate(
+                [shard @ query_vector for shard in index.shards]
+            )[rows]
+            scores = np.where(enabled, (1 + similarities) / 2, -np.inf)
+            top_k = min(k, len(scores))
+            for position in np.argpartition(-scores, top_k - 1)[:top_k]:
+                if np.isfinite(scores[position]):
+                    candidates.append((float(scores[position]), index, ids[position]))
+
+        # 3.合并所有候选记录，按得分倒序取前k条并过滤低于阈值的记录
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return query_vector.tolist(), [
+            (
+                Document(
+                    page_content=index.records[id][0],
+                    metadata=dict(index.records[id][1]),
+                ),
+                score,
+                index.vector(index.records[id][2]).tolist(),
+            )
+            for score, index, id in candidates[:k]
+            if score_threshold is None or score >= score_threshold
+        ]
+
+    def _delete_where(self, dataset_id: str, predicate) -> None:
+        """删除知识库索引中满足条件的记录，只追加一条日志"""
+        with self._write(dataset_id) as index:
+            ids = [
+                id
+                for id, (_, metadata, _) in index.records.items()
+                if predicate(id, metadata)
+            ]
+            if ids:
+                self._append_log(dataset_id, {"op": "delete", "ids": ids})
+
+    def _get_index(self, dataset_id: str) -> _LocalIndex:
+        """获取知识库索引快照，变更日志被其他进程追加时增量读取"""
+        if not os.path.isdir(self._dataset_path(dataset_id)):
+            return self._load(dataset_id)
+        with self._lock, self._file_lock(dataset_id, exclusive=False):
+            return self._load(dataset_id)
+
+    @contextmanager
+    def _write(self, dataset_id: str) -> Iterator[_LocalIndex]:
+        """在进程内锁与跨进程文件锁的保护下加载索引，写入完成后分片或日志过多时执行合并"""
+        with self._lock, self._file_lock(dataset_id, exclusive=True):
+            yield self._load(dataset_id)
+
+            index = self._load(dataset_id)
+            if (
+                index.dead_rows > len(index.records)
+                or len(index.shards) > self.COMPACT_MAX_SHARDS
+                or index.operation_count > self.COMPACT_MAX_OPERATIONS
+            ):
+                self._compact(dataset_id, index)
+
+    def _load(self, dataset_id: str) -> _LocalIndex:
+        """从磁盘加载知识库索引，日志未被重写时只回放新追加的操作，调用方需持有锁"""
+        # 1.变更日志不存在时返回空索引
+        dataset_id = str(dataset_id)
+        log_path = os.path.join(self._dataset_path(dataset_id), self.LOG_FILE)
+        empty_index = _LocalIndex(
+            records={},
+            shards=[],
+            offsets=[],
+            dead_rows=0,
+            operation_count=0,
+            version=(0, 0),
+        )
+        if not os.path.exists(log_path):
+            return empty_index
+
+        # 2.日志未变化时直接使用缓存的快照，日志被重写(inode变化)时从头回放
+        stat = os.stat(log_path)
+        index = self._indexes.get(dataset_id)
+        if index is None or index.version[0] != stat.st_ino:
+            index = empty_index
+        if index.version == (stat.st_ino, stat.st_size):
+            return index
+
+        # 3.读取新追加的完整行，末尾未写完的行留到下次读取
+        offset = index.version[1] if index.version[0] == stat.st_ino else 0
+        with open(log_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+        data = data[: data.rfind(b"\n") + 1]
+        operations = [json.loads(line) for line in data.splitlines() if line.strip()]
+
+        # 4.在快照副本上回放操作，已被其他线程持有的快照保持不变
+        index = self._apply(
+            dataset_id, index, operations, (stat.st_ino, offset + len(data))
+        )
+        self._indexes[dataset_id] = index
+
+        return index
+
+    def _apply(
+        self,
+        dataset_id: str,
+        index: _LocalIndex,
+        operations: list[dict[str, Any]],
+        version: tuple[int, int],
+    ) -> _LocalIndex:
+        """在索引快照的副本上回放变更日志中的操作"""
+        records = dict(index.records)
+        shards, offsets = list(index.shards), list(index.offsets)
+        row_count = offsets[-1] + len(shards[-1]) if shards else 0
+        dead_rows = index.dead_rows
+        for operation in operations:
+            if operation["op"] == "add":
+                # 1.新增记录对应一个新的向量分片，同id的旧记录对应的向量行失效
+                shards.append(self._load_shard(dataset_id, operation["shard"]))
+                offsets.append(row_count)
+                for row, record in enumerate(operation["records"], start=row_count):
+                    if record["id"] in records:
+                        dead_rows += 1
+                    records[record["id"]] = (record["text"], record["metadata"], row)
+                row_count += len(shards[-1])
+            elif operation["op"] == "update":
+                # 2.合并属性，text属性对应记录的文本内容
+                for id in operation["ids"]:
+                    if id not in records:
+                        continue
+                    properties = dict(operation["properties"])
+                    text, metadata, row = records[id]
+                    records[id] = (
+                        properties.pop("text", text),
+                        {**metadata, **properties},
+                        row,
+                    )
+            elif operation["op"] == "delete":
+                for id in operation["ids"]:
+                    if records.pop(id, None) is not None:
+                        dead_rows += 1
+
+        return _LocalIndex(
+            records=records,
+            shards=shards,
+            offsets=offsets,
+            dead_rows=dead_rows,
+            operation_count=index.operation_count + len(operations),
+            version=version,
+        )
+
+    def _compact(self, dataset_id: str, index: _LocalIndex) -> None:
+        """将有效记录合并为一个分片并重写变更日志，随后删除不再引用的分片文件，调用方需持有写锁"""
+        # 1.收集有效记录的向量并写入新的分片
+        dataset_path = self._dataset_path(dataset_id)
+        shard = None
+        if index.records:
+            _, rows, _ = index.search_arrays
+            shard = self._write_shard(dataset_id, np.concatenate(index.shards)[rows])
+
+        # 2.先写临时日志再原子替换，替换后其他进程会检测到inode变化并从头回放
+        log_path = os.path.join(dataset_path, self.LOG_FILE)
+        with open(f"{log_path}.tmp", "w", encoding="utf-8") as f:
+            if shard is not None:
+                f.write(
+                    json.dumps(
+                        {
+                            "op": "add",
+                            "shard": shard,
+                            "records": [
+                                {"id": id, "text": text, "metadata": metadata}
+                                for id, (text, metadata, _) in index.records.items()
+                            ],
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+        os.replace(f"{log_path}.tmp", log_path)
+        self._indexes.pop(str(dataset_id), None)
+
+        # 3.删除旧的分片文件，已经通过内存映射打开的分片在关闭前仍然可读
+        shards_path = os.path.join(dataset_path, self.SHARDS_DIR)
+        for name in os.listdir(shards_path) if os.path.isdir(shards_path) else []:
+            if name != shard:
+                os.remove(os.path.join(shards_path, name))
+
+    def _append_log(self, dataset_id: str, operation: dict[str, Any]) -> None:
+        """往变更日志末尾追加一条操作，调用方需持有写锁"""
+        log_path = os.path.join(self._dataset_path(dataset_id), self.LOG_FILE)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(operation, ensure_ascii=False) + "\n")
+
+    def _write_shard(self, dataset_id: str, vectors: np.ndarray) -> str:
+        """将向量矩阵写入新的分片文件，先写临时文件再原子替换，返回分片文件名"""
+        shards_path = os.path.join(self._dataset_path(dataset_id), self.SHARDS_DIR)
+        os.makedirs(shards_path, exist_ok=True)
+        name = f"{uuid.uuid4().hex}.npy"
+        with open(os.path.join(shards_path, f"{name}.tmp"), "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        os.replace(
+            os.path.join(shards_path, f"{name}.tmp"), os.path.join(shards_path, name)
+        )
+        return name
+
+    def _load_shard(self, dataset_id: str, name: str) -> np.ndarray:
+        """使用内存映射加载向量分片"""
+        return np.load(
+            os.path.join(self._dataset_path(dataset_id), self.SHARDS_DIR, name),
+            mmap_mode="r",
+        )
+
+    @contextmanager
+    def _file_lock(self, dataset_id: str, exclusive: bool) -> Iterator[None]:
+        """跨进程文件锁，保证celery任务与api进程之间读写互斥"""
+        dataset_path = self._dataset_path(dataset_id)
+        os.makedirs(dataset_path, exist_ok=True)
+        with open(os.path.join(dataset_path, self.LOCK_FILE), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _dataset_path(self, dataset_id: str) -> str:
+        return os.path.join(self.root_path, str(dataset_id))
+
+    @classmethod
+    def _normalize(cls, vectors: np.ndarray) -> np.ndarray:
+        """按行归一化向量矩阵，零向量保持不变"""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
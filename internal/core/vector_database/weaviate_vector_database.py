@@ -0,0 +1,366 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Optional
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_weaviate import WeaviateVectorStore
+from weaviate import WeaviateClient
+from weaviate.classes.config import Configure, DataType, Property
+from weaviate.classes.query import Filter
+from weaviate.classes.tenants import Tenant
+from weaviate.collections import Collection
+from weaviate.exceptions import WeaviateBaseError
+
+from .base_vector_database import BaseVectorDatabase
+
+# 向量数据库的集合名字
+COLLECTION_NAME = "Dataset"
+
+# 多租户集合名字，每个知识库对应一个租户(独立分片)
+MULTI_TENANCY_COLLECTION_NAME = "DatasetTenant"
+
+# 创建多租户集合及租户时使用的进程内锁，避免多个批次线程同时创建
+_tenant_lock = Lock()
+
+
+class WeaviateVectorDatabase(BaseVectorDatabase):
+    """Weaviate向量数据库，默认所有知识库共用同一个集合并通过dataset_id属性过滤，开启多租户后每个知识库对应一个独立租户"""
+
+    def __init__(
+        self,
+        client: WeaviateClient,
+        embeddings: Embeddings,
+        multi_tenancy: bool = False,
+    ):
+        """构造函数，传递weaviate客户端、文本嵌入模型以及是否按知识库拆分租户"""
+        self.client = client
+        self.embeddings = embeddings
+        self.multi_tenancy = multi_tenancy
+
+    @property
+    def vector_store(self) -> WeaviateVectorStore:
+        return WeaviateVectorStore(
+            client=self.client,
+            index_name=COLLECTION_NAME,
+            text_key="text",
+            embedding=self.embeddings,
+        )
+
+    @property
+    def multi_tenancy_vector_store(self) -> WeaviateVectorStore:
+        return WeaviateVectorStore(
+            client=self.client,
+            index_name=MULTI_TENANCY_COLLECTION_NAME,
+            text_key="text",
+            embedding=self.embeddings,
+            use_multi_tenancy=True,
+        )
+
+    @property
+    def collection(self) -> Collection:
+        return self.client.collections.get(COLLECTION_NAME)
+
+    @property
+    def multi_tenancy_collection(self) -> Collection:
+        return self.client.collections.get(MULTI_TENANCY_COLLECTION_NAME)
+
+    def add_vectors(
+        self,
+        dataset_id: str,
+        documents: list[Document],
+        ids: list[str],
+        vectors: list[list[float]],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """使用weaviate原生批量接口(gRPC)写入数据，属性结构与WeaviateVectorStore保持一致"""
+        collection = (
+            self._get_tenant_collection(dataset_id, create=True)
+            if self.multi_tenancy
+            else self.collection
+        )
+        with collection.batch.fixed_size(batch_size=batch_size) as batch:
+            for document, id, vector in zip(documents, ids, vectors):
+                batch.add_object(
+                    properties={"text": document.page_content, **document.metadata},
+                    uuid=id,
+                    vector=vector,
+                )
+
+        return [str(failed.object_.uuid) for failed in collection.batch.failed_objects]
+
+    def update(
+        self,
+        dataset_id: str,
+        id: str,
+        properties: dict[str, Any],
+        vector: Optional[list[float]] = None,
+    ) -> None:
+        self._get_collection(dataset_id).data.update(
+            uuid=id, properties=properties, vector=vector
+        )
+
+    def update_in_batch(
+        self,
+        dataset_id: str,
+        ids: list[str],
+        properties: dict[str, Any],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """weaviate不支持按条件批量更新属性，先批量读取记录及向量，合并属性后使用批量接口按原uuid覆盖写入"""
+        # 1.批量读取记录及其向量
+        collection = self._get_collection(dataset_id)
+        ids = [str(id) for id in ids]
+        response = collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any(ids),
+            include_vector=True,
+            limit=len(ids),
+        )
+
+        # 2.合并属性后覆盖写入，未读取到的记录视为更新失败
+        found_ids = set()
+        with collection.batch.fixed_size(batch_size=batch_size) as batch:
+            for obj in response.objects:
+                found_ids.add(str(obj.uuid))
+                batch.add_object(
+                    properties={**obj.properties, **properties},
+                    uuid=obj.uuid,
+                    vector=obj.vector["default"],
+                )
+
+        return [
+            str(failed.object_.uuid) for failed in collection.batch.failed_objects
+        ] + [id for id in ids if id not in found_ids]
+
+    def delete_by_ids(self, dataset_id: str, ids: list[str]) -> None:
+        self._get_collection(dataset_id).data.delete_many(
+            where=Filter.by_id().contains_any([str(id) for id in ids]),
+        )
+
+    def delete_by_document_id(self, dataset_id: str, document_id: str) -> None:
+        self._get_collection(dataset_id).data.delete_many(
+            where=Filter.by_property("document_id").equal(str(document_id)),
+        )
+
+    def delete_by_dataset_id(self, dataset_id: str) -> None:
+        """删除知识库关联的所有记录，多租户模式下直接删除整个租户"""
+        if self.multi_tenancy:
+            if self._get_existing_tenants([dataset_id]):
+                self.multi_tenancy_collection.tenants.remove([str(dataset_id)])
+            return
+        self.collection.data.delete_many(
+            where=Filter.by_property("dataset_id").equal(str(dataset_id)),
+        )
+
+    def similarity_search_with_relevance_scores(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """执行相似性检索，多租户模式下只检索相关知识库的租户并合并结果，否则在全局集合中按属性过滤，两种模式均使用WeaviateVectorStore的相关性得分"""
+        if self.multi_tenancy:
+            return self._similarity_search_in_tenants(
+                query, dataset_ids, k, score_threshold, timeout, **kwargs
+            )
+
+        return self.vector_store.similarity_search_with_relevance_scores(
+            query=query,
+            k=k,
+            score_threshold=score_threshold,
+            filters=Filter.all_of(
+                [
+                    Filter.by_property("dataset_id").contains_any(
+                        [str(dataset_id) for dataset_id in dataset_ids]
+                    ),
+                    *self._enabled_filters(),
+                ]
+            ),
+            **kwargs,
+        )
+
+    def similarity_search_with_vectors(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> tuple[list[float], list[tuple[Document, float, list[float]]]]:
+        """执行相似性检索后按node_id批量读取记录向量，得分与similarity_search_with_relevance_scores保持一致"""
+        # 1.执行相似性检索，保证得分与普通检索使用同一个尺度
+        deadline = time.monotonic() + timeout if timeout else None
+        search_result = self.similarity_search_with_relevance_scores(
+            query, dataset_ids, k, score_threshold, timeout
+        )
+
+        # 2.按知识库分组批量读取记录存储的向量，非多租户模式下所有记录都在全局集合中
+        node_ids_by_dataset: dict[str, list[str]] = {}
+        for document, _ in search_result:
+            dataset_id = (
+                str(document.metadata["dataset_id"]) if self.multi_tenancy else ""
+            )
+            node_ids_by_dataset.setdefault(dataset_id, []).append(
+                str(document.metadata["node_id"])
+            )
+        vectors = {}
+        for dataset_id, node_ids in node_ids_by_dataset.items():
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"weaviate向量检索超时, timeout: {timeout}s")
+            collection = (
+                self._get_tenant_collection(dataset_id)
+                if self.multi_tenancy
+                else self.collection
+            )
+            response = collection.query.fetch_objects(
+                filters=Filter.by_id().contains_any(node_ids),
+                include_vector=True,
+                limit=len(node_ids),
+            )
+            for obj in response.objects:
+                vectors[str(obj.uuid)] = obj.vector["default"]
+
+        # 3.查询向量命中嵌入缓存，不会重复请求嵌入模型
+        return self.embeddings.embed_query(query), [
+            (document, score, vectors[str(document.metadata["node_id"])])
+            for document, score in search_result
+            if str(document.metadata["node_id"]) in vectors
+        ]
+
+    def migrate_to_tenant(
+        self, dataset_id: str, ids: list[str], batch_size: int = 100
+    ) -> list[str]:
+        """将全局集合中属于该知识库的记录连同向量迁移到对应租户，迁移成功后从全局集合中删除，返回迁移失败的id列表"""
+        # 1.从全局集合中批量读取记录及其向量
+        response = self.collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any([str(id) for id in ids]),
+            include_vector=True,
+            limit=len(ids),
+        )
+        if not response.objects:
+            return []
+
+        # 2.使用原有的uuid写入租户，重复迁移时会覆盖已有记录
+        documents, object_ids, vectors = [], [], []
+        for obj in response.objects:
+            properties = dict(obj.properties)
+            documents.append(
+                Document(page_content=properties.pop("text", ""), metadata=properties)
+            )
+            object_ids.append(str(obj.uuid))
+            vectors.append(obj.vector["default"])
+        failed_ids = self.add_vectors(
+            dataset_id, documents, object_ids, vectors, batch_size=batch_size
+        )
+
+        # 3.删除全局集合中已迁移成功的记录
+        failed_id_set = set(failed_ids)
+        migrated_ids = [id for id in object_ids if id not in failed_id_set]
+        if migrated_ids:
+            self.collection.data.delete_many(
+                where=Filter.by_id().contains_any(migrated_ids),
+            )
+
+        return failed_ids
+
+    def _similarity_search_in_tenants(
+        self,
+        query: str,
+        dataset_ids: list[str],
+        k: int,
+        score_threshold: Optional[float],
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """在多个知识库租户中并行执行相似性检索，合并结果后取前k条，超时后取消尚未开始的租户检索并抛出TimeoutError"""
+        # 1.过滤掉不存在的租户
+        tenants = self._get_existing_tenants(dataset_ids)
+        if not tenants:
+            return []
+        vector_store = self.multi_tenancy_vector_store
+        filters = Filter.all_of(self._enabled_filters())
+
+        # 2.并行检索各个租户，超时后不等待仍在执行的租户检索
+        executor = ThreadPoolExecutor(max_workers=min(len(tenants), 8))
+        futures = [
+            executor.submit(
+                vector_store.similarity_search_with_relevance_scores,
+                query=query,
+                k=k,
+                score_threshold=score_threshold,
+                filters=filters,
+                tenant=tenant,
+                **kwargs,
+            )
+            for tenant in tenants
+        ]
+        _, not_done = wait(futures, timeout=timeout)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not_done:
+            raise TimeoutError(f"weaviate多租户向量检索超时, timeout: {timeout}s")
+
+        # 3.合并所有租户的结果并取前k条
+        search_result = [item for future in futures for item in future.result()]
+        search_result.sort(key=lambda item: item[1], reverse=True)
+
+        return search_result[:k]
+
+    @classmethod
+    def _enabled_filters(cls) -> list[Filter]:
+        """文档与片段均已启用的过滤条件"""
+        return [
+            Filter.by_property("document_enabled").equal(True),
+            Filter.by_property("segment_enabled").equal(True),
+        ]
+
+    def _get_collection(self, dataset_id: str) -> Collection:
+        """根据是否开启多租户获取知识库对应的集合"""
+        if self.multi_tenancy:
+            return self._get_tenant_collection(dataset_id)
+        return self.collection
+
+    def _get_tenant_collection(
+        self, dataset_id: str, create: bool = False
+    ) -> Collection:
+        """获取知识库对应的租户集合，create为True时自动创建多租户集合及租户"""
+        if create and not self._get_existing_tenants([dataset_id]):
+            # 1.同一进程内的多个批次线程串行创建，其他进程并发创建时已存在视为创建成功
+            with _tenant_lock:
+                # 2.多租户集合不存在时创建集合，属性结构与WeaviateVectorStore默认结构一致
+                if not self.client.collections.exists(MULTI_TENANCY_COLLECTION_NAME):
+                    try:
+                        self.client.collections.create(
+                            name=MULTI_TENANCY_COLLECTION_NAME,
+                            properties=[Property(name="text", data_type=DataType.TEXT)],
+                            multi_tenancy_config=Configure.multi_tenancy(enabled=True),
+                        )
+                    except WeaviateBaseError:
+                        if not self.client.collections.exists(
+                            MULTI_TENANCY_COLLECTION_NAME
+                        ):
+                            raise
+
+                # 3.租户不存在时创建租户
+                if not self._get_existing_tenants([dataset_id]):
+                    try:
+                        self.multi_tenancy_collection.tenants.create(
+                            [Tenant(name=str(dataset_id))]
+                        )
+                    except WeaviateBaseError:
+                        if not self._get_existing_tenants([dataset_id]):
+                            raise
+
+        return self.multi_tenancy_collection.with_tenant(str(dataset_id))
+
+    def _get_existing_tenants(self, dataset_ids: list[str]) -> list[str]:
+        """获取已经存在的知识库租户名字列表"""
+        if not self.client.collections.exists(MULTI_TENANCY_COLLECTION_NAME):
+            return []
+        tenants = self.multi_tenancy_collection.tenants.get_by_names(
+            [str(dataset_id) for dataset_id in dataset_ids]
+        )
+        return list(tenants.keys())
@@ -4,10 +4,34 @@ LOCK_EXPIRE_TIME = 600
 # 更新文档启用状态缓存锁
 LOCK_DOCUMENT_UPDATE_ENABLED = "lock:document:update:enabled_{document_id}"
 
-# 更新关键词表缓存锁
-LOCK_KEYWORD_TABLE_UPDATE_KEYWORD_TABLE = (
-    "lock:keyword_table:update:keyword_table_{dataset_id}"
-)
-
 # 更新片段启用状态缓存锁
 LOCK_SEGMENT_UPDATE_ENABLED = "lock:segment:update:enabled_{segment_id}"
+
+# 文档分割结果缓存，使用分割实现版本+文件哈希+处理规则哈希作为键
+CACHE_DOCUMENT_SPLITTING = (
+    "cache:document:splitting:v{version}:{upload_file_hash}_{process_rule_hash}"
+)
+
+# 文档分割实现版本，文件提取器或文本分割器的输出发生变化时需要递增，使旧的分割结果缓存失效
+DOCUMENT_SPLITTING_VERSION = 2
+
+# 文档分割结果缓存的过期时间，单位为秒，默认为7天
+CACHE_DOCUMENT_SPLITTING_EXPIRE_TIME = 7 * 24 * 3600
+
+# 知识库版本号，知识库内容或启用状态变化时递增，用于检索结果缓存精确失效
+CACHE_DATASET_VERSION = "cache:dataset:version:{dataset_id}"
+
+# 检索结果缓存，使用检索参数+知识库版本号的哈希作为键
+CACHE_RETRIEVAL_RESULT = "cache:retrieval:result:{hash}"
+
+# 检索结果缓存的过期时间，单位为秒，默认为1小时
+CACHE_RETRIEVAL_RESULT_EXPIRE_TIME = 3600
+
+# 片段命中次数缓冲区(hash)，由后台线程聚合后批量写入postgres
+CACHE_SEGMENT_HIT_COUNT_BUFFER = "cache:segment:hit_count:buffer"
+
+# 知识库查询记录缓冲区(list)，由后台线程批量插入postgres
+CACHE_DATASET_QUERY_BUFFER = "cache:dataset_query:buffer"
+
+# 刷新检索统计缓冲区锁，保证同一时间只有一个进程在刷新
+LOCK_RETRIEVAL_STATS_FLUSH = "lock:retrieval_stats:flush"
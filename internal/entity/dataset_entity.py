@@ -67,6 +67,13 @@ class RetrievalStrategy(str, Enum):
     HYBRID = "hybrid"
 
 
+class FusionStrategy(str, Enum):
+    """混合检索结果融合策略枚举"""
+
+    RRF = "rrf"
+    WEIGHTED = "weighted"
+
+
 class RetrievalSource(str, Enum):
     """检索来源"""
 
@@ -13,3 +13,6 @@ ALLOWED_DOCUMENT_EXTENSION = [
     "docx",
     "csv",
 ]
+
+# 文件提取时允许解析的最大文件大小，单位为字节，默认为500MB
+MAX_EXTRACT_FILE_SIZE = 500 * 1024 * 1024
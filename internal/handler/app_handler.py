@@ -219,7 +219,7 @@ class AppHandler:
         # 2.调用服务发起会话调试
         response = self.app_service.debug_chat(app_id, req.query.data, current_user)
 
-        return compact_generate_response(response)
+        return compact_generate_response(response, drain_on_disconnect=True)
 
     @login_required
     def stop_debug_chat(self, app_id: UUID, task_id: UUID):
@@ -227,6 +227,14 @@ class AppHandler:
         self.app_service.stop_debug_chat(app_id, task_id, current_user)
         return success_message("停止应用调试会话成功")
 
+    @login_required
+    def resume_debug_chat(self, app_id: UUID, task_id: UUID):
+        """根据传递的应用id+任务id以及请求头中的Last-Event-ID，重新连接调试会话的流式事件"""
+        response = self.app_service.resume_debug_chat(
+            app_id, task_id, request.headers.get("Last-Event-ID"), current_user
+        )
+        return compact_generate_response(response)
+
     @login_required
     def get_debug_conversation_messages_with_page(self, app_id: UUID):
         """根据传递的应用id，获取该应用的调试会话分页列表记录"""
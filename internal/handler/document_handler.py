@@ -9,6 +9,7 @@ from internal.schema.document_schema import (
     CreateDocumentsResp,
     GetDocumentResp,
     UpdateDocumentNameReq,
+    UpdateDocumentContentReq,
     GetDocumentsWithPageReq,
     GetDocumentsWithPageResp,
     UpdateDocumentEnabledReq,
@@ -70,6 +71,21 @@ class DocumentHandler:
 
         return success_message("更新文档名称成功")
 
+    @login_required
+    def update_document_content(self, dataset_id: UUID, document_id: UUID):
+        """根据传递的知识库id+文档id使用新上传的文件替换文档内容，并增量重建索引"""
+        # 1.提取请求并校验数据
+        req = UpdateDocumentContentReq()
+        if not req.validate():
+            return validate_error_json(req.errors)
+
+        # 2.调用服务替换文档内容并异步增量重建索引
+        self.document_service.update_document_content(
+            dataset_id, document_id, UUID(req.upload_file_id.data), current_user
+        )
+
+        return success_message("更新文档内容成功，正在重建索引")
+
     @login_required
     def update_document_enabled(self, dataset_id: UUID, document_id: UUID):
         """根据传递的知识库id+文档id更新指定文档的启用状态"""
@@ -1,5 +1,7 @@
 from dataclasses import dataclass
+from uuid import UUID
 
+from flask import request
 from flask_login import login_required, current_user
 from injector import inject
 
@@ -26,4 +28,13 @@ class OpenAPIHandler:
         # 2.调用服务创建会话
         resp = self.openapi_service.chat(req, current_user)
 
+        return compact_generate_response(resp, drain_on_disconnect=True)
+
+    @login_required
+    def resume_chat(self, task_id: UUID):
+        """根据传递的任务id以及请求头中的Last-Event-ID，重新连接开放API流式对话"""
+        resp = self.openapi_service.resume_chat(
+            task_id, request.headers.get("Last-Event-ID"), current_user
+        )
+
         return compact_generate_response(resp)
@@ -49,7 +49,7 @@ class WebAppHandler:
         # 2.嗲用服务获取对应响应内容
         response = self.web_app_service.web_app_chat(token, req, current_user)
 
-        return compact_generate_response(response)
+        return compact_generate_response(response, drain_on_disconnect=True)
 
     @login_required
     def stop_web_app_chat(self, token: str, task_id: UUID):
@@ -57,6 +57,14 @@ class WebAppHandler:
         self.web_app_service.stop_web_app_chat(token, task_id, current_user)
         return success_message("停止WebApp会话成功")
 
+    @login_required
+    def resume_web_app_chat(self, token: str, task_id: UUID):
+        """根据传递的token+task_id以及请求头中的Last-Event-ID，重新连接WebApp对话的流式事件"""
+        response = self.web_app_service.resume_web_app_chat(
+            token, task_id, request.headers.get("Last-Event-ID"), current_user
+        )
+        return compact_generate_response(response)
+
     @login_required
     def get_conversations(self, token: str):
         """根据传递的token+is_pinned获取指定WebApp下的所有会话列表信息"""
@@ -1,6 +1,15 @@
 from .api_tool import ApiTool, ApiToolProvider
 from .app import App, AppDatasetJoin, AppConfig, AppConfigVersion
-from .dataset import Dataset, Document, Segment, KeywordTable, DatasetQuery, ProcessRule
+from .dataset import (
+    Dataset,
+    Document,
+    Segment,
+    KeywordTable,
+    KeywordPosting,
+    KeywordStatistic,
+    DatasetQuery,
+    ProcessRule,
+)
 from .upload_file import UploadFile
 from .conversation import Conversation, Message, MessageAgentThought
 from .account import Account, AccountOAuth
@@ -20,6 +29,8 @@ __all__ = [
     "Document",
     "Segment",
     "KeywordTable",
+    "KeywordPosting",
+    "KeywordStatistic",
     "DatasetQuery",
     "ProcessRule",
     "Conversation",
@@ -241,6 +241,47 @@ class KeywordTable(db.Model):
     )
 
 
+class KeywordPosting(db.Model):
+    """关键词倒排索引表模型，每一行代表知识库中某个关键词命中的一个片段"""
+
+    __tablename__ = "keyword_posting"
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            "dataset_id", "keyword", "segment_id", name="pk_keyword_posting"
+        ),
+        Index("keyword_posting_segment_id_idx", "segment_id"),
+    )
+    dataset_id = Column(UUID, nullable=False)
+    keyword = Column(Text, nullable=False)
+    segment_id = Column(UUID, nullable=False)
+    frequency = Column(Integer, nullable=False, server_default=text("1"))  # 词频
+    segment_length = Column(
+        Integer, nullable=False, server_default=text("0")
+    )  # 片段长度(jieba分词数，与词频单位一致)，冗余存储以便BM25打分时不再回表
+    created_at = Column(
+        DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP(0)")
+    )
+
+
+class KeywordStatistic(db.Model):
+    """知识库关键词统计表模型，记录倒排索引中的片段数及片段总长度，用于计算BM25的IDF及平均片段长度"""
+
+    __tablename__ = "keyword_statistic"
+    __table_args__ = (PrimaryKeyConstraint("dataset_id", name="pk_keyword_statistic"),)
+    dataset_id = Column(UUID, nullable=False)
+    segment_count = Column(Integer, nullable=False, server_default=text("0"))
+    total_length = Column(Integer, nullable=False, server_default=text("0"))
+    updated_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=text("CURRENT_TIMESTAMP(0)"),
+        server_onupdate=text("CURRENT_TIMESTAMP(0)"),
+    )
+    created_at = Column(
+        DateTime, nullable=False, server_default=text("CURRENT_TIMESTAMP(0)")
+    )
+
+
 class DatasetQuery(db.Model):
     """知识库查询表模型"""
 
@@ -140,6 +140,10 @@ class Router:
             methods=["POST"],
             view_func=self.app_handler.stop_debug_chat,
         )
+        bp.add_url_rule(
+            "/apps/<uuid:app_id>/conversations/tasks/<uuid:task_id>/events",
+            view_func=self.app_handler.resume_debug_chat,
+        )
         bp.add_url_rule(
             "/apps/<uuid:app_id>/conversations/messages",
             view_func=self.app_handler.get_debug_conversation_messages_with_page,
@@ -283,6 +287,11 @@ class Router:
             methods=["POST"],
             view_func=self.document_handler.update_document_name,
         )
+        bp.add_url_rule(
+            "/datasets/<uuid:dataset_id>/documents/<uuid:document_id>/content",
+            methods=["POST"],
+            view_func=self.document_handler.update_document_content,
+        )
         bp.add_url_rule(
             "/datasets/<uuid:dataset_id>/documents/<uuid:document_id>/enabled",
             methods=["POST"],
@@ -402,6 +411,10 @@ class Router:
             methods=["POST"],
             view_func=self.openapi_handler.chat,
         )
+        openapi_bp.add_url_rule(
+            "/openapi/chat/<uuid:task_id>/events",
+            view_func=self.openapi_handler.resume_chat,
+        )
         # 内置应用模块
         bp.add_url_rule(
             "/builtin-apps/categories",
@@ -513,6 +526,10 @@ class Router:
             methods=["POST"],
             view_func=self.web_app_handler.stop_web_app_chat,
         )
+        bp.add_url_rule(
+            "/web-apps/<string:token>/chat/<uuid:task_id>/events",
+            view_func=self.web_app_handler.resume_web_app_chat,
+        )
         bp.add_url_rule(
             "/web-apps/<string:token>/conversations",
             view_func=self.web_app_handler.get_conversations,
@@ -3,7 +3,14 @@ import uuid
 from flask_wtf import FlaskForm
 from marshmallow import Schema, fields, pre_dump
 from wtforms import StringField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, ValidationError, Length, Optional
+from wtforms.validators import (
+    DataRequired,
+    AnyOf,
+    ValidationError,
+    Length,
+    Optional,
+    UUID,
+)
 
 from internal.entity.dataset_entity import ProcessType, DEFAULT_PROCESS_RULE
 from internal.lib.helper import datetime_to_timestamp
@@ -219,6 +226,18 @@ class UpdateDocumentNameReq(FlaskForm):
     )
 
 
+class UpdateDocumentContentReq(FlaskForm):
+    """更新文档内容请求，使用新上传的文件替换文档内容并增量重建索引"""
+
+    upload_file_id = StringField(
+        "upload_file_id",
+        validators=[
+            DataRequired("文件id不能为空"),
+            UUID(message="文件id的格式必须是UUID"),
+        ],
+    )
+
+
 class GetDocumentsWithPageReq(PaginatorReq):
     """获取文档分页列表请求"""
 
@@ -13,6 +13,8 @@ from .indexing_service import IndexingService
 from .keyword_table_service import KeywordTableService
 from .process_rule_service import ProcessRuleService
 from .segment_service import SegmentService
+from .retrieval_cache_service import RetrievalCacheService
+from .retrieval_stats_service import RetrievalStatsService
 from .retrieval_service import RetrievalService
 from .conversation_service import ConversationService
 from .jwt_service import JwtService
@@ -44,6 +46,8 @@ __all__ = [
     "KeywordTableService",
     "ProcessRuleService",
     "SegmentService",
+    "RetrievalCacheService",
+    "RetrievalStatsService",
     "RetrievalService",
     "ConversationService",
     "JwtService",
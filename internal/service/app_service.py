@@ -3,7 +3,8 @@ import json
 from dataclasses import dataclass
 from datetime import datetime
 from threading import Thread
-from typing import Any, Generator
+import uuid
+from typing import Any, Generator, Optional
 from uuid import UUID
 
 import requests
@@ -621,12 +622,27 @@ class AppService(BaseService):
             ),
         )
 
+        # 10.1 记录任务上下文，用于断线重连时还原事件数据
+        task_id = uuid.uuid4()
+        agent.agent_queue_manager.set_task_context(
+            task_id,
+            conversation_id=debug_conversation.id,
+            message_id=message.id,
+        )
+
+        # 10.2 提前记录流式输出及持久化所需的数据，客户端断开连接后生成器会转交后台线程继续执行，此时请求上下文(current_user)及会话中的模型对象均已不可用
+        flask_app = current_app._get_current_object()
+        account_id = account.id
+        conversation_id = debug_conversation.id
+        message_id = message.id
+
         agent_thoughts = {}
         for agent_thought in agent.stream(
             {
                 "messages": [HumanMessage(query)],
                 "history": history,
                 "long_term_memory": debug_conversation.summary,
+                "task_id": task_id,
             }
         ):
             # 11.提取thought以及answer
@@ -647,6 +663,8 @@ class AppService(BaseService):
                                 + agent_thought.thought,
                                 "answer": agent_thoughts[event_id].answer
                                 + agent_thought.answer,
+                                "message": agent_thought.message
+                                or agent_thoughts[event_id].message,
                                 "latency": agent_thought.latency,
                             }
                         )
@@ -666,22 +684,22 @@ class AppService(BaseService):
                     }
                 ),
                 "id": event_id,
-                "conversation_id": str(debug_conversation.id),
-                "message_id": str(message.id),
+                "conversation_id": str(conversation_id),
+                "message_id": str(message_id),
                 "task_id": str(agent_thought.task_id),
             }
-            yield f"event: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
+            yield f"id: {agent_thought.stream_id}\nevent: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
 
         # 22.将消息以及推理过程添加到数据库
         thread = Thread(
             target=self.conversation_service.save_agent_thoughts,
             kwargs={
-                "flask_app": current_app._get_current_object(),
-                "account_id": account.id,
+                "flask_app": flask_app,
+                "account_id": account_id,
                 "app_id": app_id,
                 "app_config": draft_app_config,
-                "conversation_id": debug_conversation.id,
-                "message_id": message.id,
+                "conversation_id": conversation_id,
+                "message_id": message_id,
                 "agent_thoughts": [
                     agent_thought for agent_thought in agent_thoughts.values()
                 ],
@@ -697,6 +715,29 @@ class AppService(BaseService):
         # 2.调用智能体队列管理器停止特定任务
         AgentQueueManager.set_stop_flag(task_id, InvokeFrom.DEBUGGER, account.id)
 
+    def resume_debug_chat(
+        self,
+        app_id: UUID,
+        task_id: UUID,
+        last_event_id: Optional[str],
+        account: Account,
+    ) -> Generator:
+        """根据传递的应用id+任务id+最后接收的事件id，重新连接调试会话的流式事件，从断开处继续输出"""
+        # 1.获取应用信息并校验权限
+        self.get_app(app_id, account)
+
+        # 2.校验任务是否属于当前账号，任务过期后事件流同样会被清除
+        if not AgentQueueManager.is_task_owner(
+            task_id, InvokeFrom.DEBUGGER, account.id
+        ):
+            raise NotFoundException("该调试会话任务不存在或已过期，请核实后重试")
+
+        # 3.从最后接收的事件之后继续监听任务事件流
+        agent_queue_manager = AgentQueueManager(
+            user_id=account.id, invoke_from=InvokeFrom.DEBUGGER
+        )
+        yield from agent_queue_manager.resume(task_id, last_event_id)
+
     def get_debug_conversation_messages_with_page(
         self,
         app_id: UUID,
@@ -117,6 +117,8 @@ class AssistantAgentService(BaseService):
                                 + agent_thought.thought,
                                 "answer": agent_thoughts[event_id].answer
                                 + agent_thought.answer,
+                                "message": agent_thought.message
+                                or agent_thoughts[event_id].message,
                                 "latency": agent_thought.latency,
                             }
                         )
@@ -1,5 +1,7 @@
 from typing import Any, Optional
 
+from sqlalchemy import insert
+
 from internal.exception import FailException
 from pkg.sqlalchemy import SQLAlchemy
 
@@ -16,6 +18,14 @@ class BaseService:
             self.db.session.add(model_instance)
         return model_instance
 
+    def create_many(
+        self, model: Any, values: list[dict], chunk_size: int = 2000
+    ) -> None:
+        """根据传递的模型类+键值对列表批量创建数据库记录，在同一个事务中分块执行多行INSERT"""
+        with self.db.auto_commit():
+            for i in range(0, len(values), chunk_size):
+                self.db.session.execute(insert(model), values[i : i + chunk_size])
+
     def delete(self, model_instance: Any) -> Any:
         """根据传递的模型实例删除数据库记录"""
         with self.db.auto_commit():
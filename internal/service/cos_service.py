@@ -3,6 +3,7 @@ import hashlib
 import uuid
 from injector import inject
 from dataclasses import dataclass
+from typing import Optional
 from qcloud_cos import CosConfig, CosS3Client
 import os
 
@@ -79,16 +80,32 @@ class CosService:
             hash=hashlib.sha3_256(file_content).hexdigest(),
         )
 
-    def download_file(self, key: str, target_file_path: str):
-        """下载文件"""
+    def download_file(
+        self, key: str, target_file_path: str, max_size: Optional[int] = None
+    ):
+        """下载文件，传递max_size时流式下载并按实际接收的字节数校验大小，超过限制时中断下载并抛出异常"""
         client = self._get_client()
         bucket = self._get_bucket()
 
-        client.download_file(
-            Bucket=bucket,
-            Key=key,
-            DestFilePath=target_file_path,
-        )
+        if max_size is None:
+            client.download_file(
+                Bucket=bucket,
+                Key=key,
+                DestFilePath=target_file_path,
+            )
+            return
+
+        body = client.get_object(Bucket=bucket, Key=key)["Body"]
+        try:
+            size = 0
+            with open(target_file_path, "wb") as file:
+                for chunk in body.get_stream(chunk_size=1024 * 1024):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FailException("文件大小超过解析限制")
+                    file.write(chunk)
+        finally:
+            body.get_raw_stream().close()
 
     @classmethod
     def get_file_url(cls, key: str):
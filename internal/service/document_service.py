@@ -18,12 +18,14 @@ from internal.model import Dataset, Document, Segment, UploadFile, ProcessRule
 from internal.schema.document_schema import GetDocumentsWithPageReq
 from internal.task.document_task import (
     build_documents,
+    reindex_document,
     update_document_enabled,
     delete_document,
 )
 from pkg.paginator import Paginator
 from pkg.sqlalchemy import SQLAlchemy
 from .base_service import BaseService
+from .retrieval_cache_service import RetrievalCacheService
 from internal.model import Account
 
 
@@ -34,6 +36,7 @@ class DocumentService(BaseService):
 
     db: SQLAlchemy
     redis_client: Redis
+    retrieval_cache_service: RetrievalCacheService
 
     def create_documents(
         self,
@@ -213,6 +216,53 @@ class DocumentService(BaseService):
 
         return self.update(document, **kwargs)
 
+    def update_document_content(
+        self,
+        dataset_id: UUID,
+        document_id: UUID,
+        upload_file_id: UUID,
+        account: Account,
+    ):
+        """根据传递的知识库id+文档id+上传文件id，替换文档的文件内容并异步增量重建索引，只处理发生变化的片段"""
+
+        # 1.获取文档并校验权限
+        document = self.get(Document, document_id)
+        if document is None:
+            raise NotFoundException("该文档不存在，请核实后重试")
+        if document.dataset_id != dataset_id or document.account_id != account.id:
+            raise ForbiddenException("当前用户无权限修改该知识库下的文档，请核实后重试")
+
+        # 2.判断文档是否处于可以重建的状态，只有构建完成/出错的时候才可以重建
+        if document.status not in [DocumentStatus.COMPLETED, DocumentStatus.ERROR]:
+            raise FailException("当前文档处于不可修改状态，请稍后重试")
+
+        # 3.文档正在修改启用状态时不允许重建
+        cache_key = LOCK_DOCUMENT_UPDATE_ENABLED.format(document_id=document.id)
+        if self.redis_client.get(cache_key) is not None:
+            raise FailException("当前文档正在修改启用状态，请稍后再次尝试")
+
+        # 4.校验上传文件权限与文件扩展
+        upload_file = self.get(UploadFile, upload_file_id)
+        if (
+            upload_file is None
+            or upload_file.account_id != account.id
+            or upload_file.extension.lower() not in ALLOWED_DOCUMENT_EXTENSION
+        ):
+            raise FailException("暂未解析到合法文件，请重新上传")
+
+        # 5.更新文档关联的文件并重置状态
+        self.update(
+            document,
+            upload_file_id=upload_file.id,
+            status=DocumentStatus.WAITING,
+            error="",
+        )
+
+        # 6.调用异步任务增量重建文档索引
+        reindex_document.delay(document.id)
+
+        return document
+
     def update_document_enabled(
         self, dataset_id: UUID, document_id: UUID, enabled: bool, account: Account
     ):
@@ -248,6 +298,7 @@ class DocumentService(BaseService):
             disabled_at=None if enabled else datetime.now(),
         )
         self.redis_client.setex(cache_key, LOCK_EXPIRE_TIME, 1)
+        self.retrieval_cache_service.bump_dataset_version(dataset_id)
 
         # 6.启用异步任务完成后续操作
         update_document_enabled.delay(document.id)
@@ -268,8 +319,9 @@ class DocumentService(BaseService):
         if document.status not in [DocumentStatus.COMPLETED, DocumentStatus.ERROR]:
             raise FailException("当前文档处于不可删除状态，请稍后重试")
 
-        # 3.删除postgres中的文档基础信息
+        # 3.删除postgres中的文档基础信息，并递增知识库版本号使检索结果缓存失效
         self.delete(document)
+        self.retrieval_cache_service.bump_dataset_version(dataset_id)
 
         # 4.调用异步任务执行后续操作，涵盖：关键词表更新、片段数据删除、weaviate记录删除等
         delete_document.delay(dataset_id, document_id)
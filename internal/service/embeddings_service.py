@@ -1,11 +1,24 @@
+import logging
 import os
-from dataclasses import dataclass
-from typing import List
+import re
+import struct
+import time
+import random
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from hashlib import sha256
+from queue import Empty, Queue
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
 import tiktoken
-from injector import inject
+from injector import inject, singleton
 from langchain.embeddings import CacheBackedEmbeddings
-from langchain_community.storage import RedisStore
 from langchain_core.embeddings import Embeddings
+from langchain_core.stores import BaseStore
 from langchain_openai import OpenAIEmbeddings
 
 # from langchain_huggingface import HuggingFaceEmbeddings
@@ -13,6 +26,8 @@ from redis import Redis
 
 from langchain_community.embeddings import QianfanEmbeddingsEndpoint
 
+from config import Config
+
 ak = "uexDJXSAF3qDg7tR3vkQZLOS"
 sk = "ovpeF9z5CcZleDczaFuc49AVhOjxGezS"
 
@@ -28,29 +43,500 @@ class QianfanFloatEmbedding(Embeddings):
         """嵌入文档列表。"""
         # 调用原始 embedding 方法获取向量
         embeddings = self.qianfan_embedding.embed_documents(texts)
-        # 强制将每个向量中的所有值转换为 float
-        return [[float(val) for val in emb] for emb in embeddings]
+        # 使用NumPy将每个向量中的所有值批量转换为 float
+        return np.asarray(embeddings, dtype=np.float64).tolist()
 
     def embed_query(self, text: str):
         """嵌入单个查询文本。"""
         # 调用原始 embedding 方法获取向量
         embedding = self.qianfan_embedding.embed_query(text)
-        # 强制将向量中的所有值转换为 float
-        return [float(val) for val in embedding]
+        # 使用NumPy将向量中的所有值批量转换为 float
+        return np.asarray(embedding, dtype=np.float64).tolist()
+
+    @property
+    def chunk_size(self) -> int:
+        """千帆文本嵌入模型单次请求支持的最大文本数"""
+        return self.qianfan_embedding.chunk_size
+
+
+class EmbeddingRedisStore(BaseStore[str, List[float]]):
+    """向量redis存储器，使用小端float32/float16二进制编码存储向量，并携带模型与维度头信息，支持批量读写、TTL及内存预算"""
+
+    # 头信息格式：魔数(2字节)+数据类型(1字节)+模型名字长度(1字节)+向量维度(4字节)，之后紧跟模型名字
+    HEADER_FORMAT = "<2sBBI"
+    HEADER_MAGIC = b"EV"
+    DTYPES = {"float32": (0, np.dtype("<f4")), "float16": (1, np.dtype("<f2"))}
+
+    def __init__(
+        self,
+        redis: Redis,
+        model_name: str,
+        namespace: str = "embeddings",
+        dtype: str = "float32",
+        ttl: Optional[int] = None,
+        max_memory: Optional[int] = None,
+    ):
+        """构造函数，传递redis客户端、模型名字、命名空间、存储精度、过期时间及最大内存预算(字节)，内存预算按TTL窗口统计，设置预算时必须同时设置TTL"""
+        if max_memory and not ttl:
+            raise ValueError("设置向量缓存内存预算时必须同时设置缓存过期时间(TTL)")
+        self.redis = redis
+        self.model_name = model_name
+        self.namespace = namespace
+        self.dtype_code, self.dtype = self.DTYPES[dtype]
+        self.ttl = ttl or None
+        self.max_memory = max_memory or None
+        self._model_bytes = model_name.encode()
+        self._header_size = struct.calcsize(self.HEADER_FORMAT) + len(self._model_bytes)
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[List[float]]]:
+        """使用MGET批量获取向量，数据不存在或者模型不一致时返回None"""
+        if not keys:
+            return []
+        values = self.redis.mget([self._generate_key(key) for key in keys])
+        return [self.decode(value) if value is not None else None for value in values]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, List[float]]]) -> None:
+        """使用pipeline批量写入向量，超过命名空间的内存预算时跳过写入"""
+        # 1.将所有向量编码成二进制数据
+        items = [
+            (self._generate_key(key), self.encode(value))
+            for key, value in key_value_pairs
+        ]
+        if not items:
+            return
+
+        # 2.检测内存预算，预算按照TTL划分时间窗口统计，当前与上一个窗口写入的字节数之和即为存活数据的上限
+        size = sum(len(data) for _, data in items)
+        if self.max_memory is not None:
+            budget_keys = self._generate_budget_keys()
+            used = sum(int(value or 0) for value in self.redis.mget(budget_keys))
+            if used + size > self.max_memory:
+                return
+
+        # 3.使用pipeline批量写入向量数据并累加当前窗口的写入字节数
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, data in items:
+            pipeline.set(key, data, ex=self.ttl)
+        if self.max_memory is not None:
+            pipeline.incrby(budget_keys[0], size)
+            pipeline.expire(budget_keys[0], self.ttl * 2)
+        pipeline.execute()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        """批量删除向量数据"""
+        if keys:
+            self.redis.delete(*[self._generate_key(key) for key in keys])
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        """迭代当前命名空间下的缓存键，原始键写入时经过哈希处理，因此返回的是哈希后的键，prefix同样匹配哈希后的键"""
+        key_prefix = f"{self.namespace}:{self.model_name}:"
+        match = key_prefix + re.sub(r"([*?\[\]\\])", r"\\\1", prefix or "") + "*"
+        for key in self.redis.scan_iter(match=match):
+            key = key.decode() if isinstance(key, bytes) else key
+            yield key[len(key_prefix) :]
+
+    def encode(self, vector: List[float]) -> bytes:
+        """将向量编码成头信息+小端二进制数据"""
+        array = np.asarray(vector, dtype=self.dtype)
+        header = struct.pack(
+            self.HEADER_FORMAT,
+            self.HEADER_MAGIC,
+            self.dtype_code,
+            len(self._model_bytes),
+            array.shape[0],
+        )
+        return header + self._model_bytes + array.tobytes()
+
+    def decode(self, data: bytes) -> Optional[List[float]]:
+        """将二进制数据解码成向量，头信息不合法或者模型不一致时返回None"""
+        # 1.解析头信息并校验魔数与模型名字
+        header_size = struct.calcsize(self.HEADER_FORMAT)
+        if len(data) < header_size:
+            return None
+        magic, dtype_code, model_length, dimension = struct.unpack_from(
+            self.HEADER_FORMAT, data
+        )
+        model_bytes = data[header_size : header_size + model_length]
+        if magic != self.HEADER_MAGIC or model_bytes != self._model_bytes:
+            return None
+
+        # 2.根据头信息中的数据类型解码向量数据
+        dtype = next(
+            (dtype for code, dtype in self.DTYPES.values() if code == dtype_code),
+            None,
+        )
+        if dtype is None:
+            return None
+        return np.frombuffer(
+            data, dtype=dtype, count=dimension, offset=header_size + model_length
+        ).tolist()
+
+    def _generate_key(self, key: str) -> str:
+        """根据命名空间+模型名字+原始键哈希生成redis缓存键"""
+        return f"{self.namespace}:{self.model_name}:{sha256(key.encode()).hexdigest()}"
+
+    def _generate_budget_keys(self) -> list[str]:
+        """生成当前及上一个时间窗口的内存预算统计键，统计键与向量缓存键使用不同的前缀，避免被当成缓存键迭代"""
+        window = int(time.time() // self.ttl)
+        return [
+            f"{self.namespace}:budget:{self.model_name}:bytes:{window}",
+            f"{self.namespace}:budget:{self.model_name}:bytes:{window - 1}",
+        ]
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """为查询嵌入添加进程内LRU+Redis两级缓存的文本嵌入模型包装器，文档嵌入直接委托给底层模型"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        store: EmbeddingRedisStore,
+        max_size: int = 1024,
+    ):
+        """构造函数，传递底层嵌入模型、查询向量redis存储器、LRU最大容量"""
+        self.embeddings = embeddings
+        self.store = store
+        self.max_size = max_size
+        self._lru: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表，直接委托给底层嵌入模型"""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询文本，依次查询进程内LRU、redis缓存，都未命中时再调用底层嵌入模型"""
+        # 1.规范化查询文本作为缓存键，redis存储器会拼接模型名字并计算哈希
+        cache_key = self._normalize_text(text)
+
+        # 2.查询进程内LRU缓存
+        vector = self._get_from_lru(cache_key)
+        if vector is not None:
+            return vector
+
+        # 3.查询redis缓存，命中后回填到进程内LRU中
+        vector = self.store.mget([cache_key])[0]
+        if vector is not None:
+            self._set_to_lru(cache_key, vector)
+            return vector
+
+        # 4.调用底层嵌入模型计算向量，并写入两级缓存
+        vector = self.embeddings.embed_query(text)
+        self.store.mset([(cache_key, vector)])
+        self._set_to_lru(cache_key, vector)
+
+        return vector
+
+    @classmethod
+    def _normalize_text(cls, text: str) -> str:
+        """规范化查询文本，统一unicode形式并合并多余的空白字符"""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+    def _get_from_lru(self, cache_key: str) -> Optional[list[float]]:
+        """从进程内LRU缓存中获取向量，命中时将其移动到队尾"""
+        with self._lock:
+            vector = self._lru.get(cache_key)
+            if vector is not None:
+                self._lru.move_to_end(cache_key)
+            return vector
+
+    def _set_to_lru(self, cache_key: str, vector: list[float]) -> None:
+        """将向量写入进程内LRU缓存，超过最大容量时淘汰最久未使用的数据"""
+        with self._lock:
+            self._lru[cache_key] = vector
+            self._lru.move_to_end(cache_key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+
+class TokenBucket:
+    """令牌桶限流器，按照每分钟容量匀速补充令牌，令牌不足时阻塞等待"""
+
+    def __init__(self, capacity_per_minute: int):
+        """构造函数，传递每分钟的令牌容量"""
+        self.capacity = capacity_per_minute
+        self.rate = capacity_per_minute / 60
+        self._tokens = float(capacity_per_minute)
+        self._last_time = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self, amount: int = 1) -> None:
+        """获取指定数量的令牌，单次请求超过桶容量时等待桶满后放行，避免永久阻塞"""
+        amount = max(amount, 1)
+        while True:
+            with self._lock:
+                # 1.根据流逝的时间补充令牌
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last_time) * self.rate
+                )
+                self._last_time = now
+
+                # 2.令牌充足时直接扣减并返回
+                required = min(amount, self.capacity)
+                if self._tokens >= required:
+                    self._tokens -= amount
+                    return
+                wait_time = (required - self._tokens) / self.rate
+
+            # 3.令牌不足时在锁外等待补充
+            time.sleep(wait_time)
+
+
+@dataclass
+class _EmbeddingRequest:
+    """待合并的嵌入请求分片"""
+
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbeddingDispatcher(Embeddings):
+    """文本嵌入请求调度器，将并发的嵌入请求在时间窗口内合并为供应商批次，并通过令牌桶限流与AIMD自适应并发控制请求速率"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 16,
+        batch_window: float = 0.02,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 8,
+        target_latency: float = 5.0,
+        max_retries: int = 5,
+        length_function: Callable[[str], int] = len,
+        metrics_log_interval: float = 60,
+    ):
+        """构造函数，传递底层嵌入模型、批次大小、合并窗口(秒)、每分钟请求数/token数限制(0为不限制)、最大并发数、目标延迟(秒)、限流重试次数、token计算函数及指标日志间隔(秒，0为不输出)"""
+        self.embeddings = embeddings
+        self.max_batch_size = max(max_batch_size, 1)
+        self.batch_window = batch_window
+        self.max_concurrency = max(max_concurrency, 1)
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.length_function = length_function
+        self.metrics_log_interval = metrics_log_interval
+        self._request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        )
+        self._token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        )
+
+        # 并发窗口从最大并发数的一半开始，成功时加性增长，限流或超时时乘性减少
+        self._concurrency = max(self.max_concurrency / 2, 1.0)
+        self._inflight = 0
+        self._condition = Condition()
+        self._queue: Queue[_EmbeddingRequest] = Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[Thread] = None
+        self._pid: Optional[int] = None
+        self._metrics = {
+            "batches": 0,
+            "texts": 0,
+            "rate_limited": 0,
+            "errors": 0,
+            "latency": 0.0,
+        }
+        self._metrics_logged_at = time.monotonic()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """嵌入文档列表，按照批次大小切分成请求分片后提交到调度队列，并按原顺序拼接结果"""
+        if not texts:
+            return []
+        self._ensure_started()
+
+        # 1.将文本列表切分成不超过批次大小的请求分片并提交到队列
+        requests = [
+            _EmbeddingRequest(texts=texts[i : i + self.max_batch_size])
+            for i in range(0, len(texts), self.max_batch_size)
+        ]
+        for request in requests:
+            self._queue.put(request)
+
+        # 2.等待所有分片完成并按顺序拼接结果
+        return [vector for request in requests for vector in request.future.result()]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询文本，与文档请求一同合并调度"""
+        return self.embed_documents([text])[0]
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        """获取调度器的运行指标，涵盖队列深度、在途批次数、当前并发窗口及累计统计"""
+        with self._condition:
+            batches = self._metrics["batches"]
+            return {
+                "queue_depth": self._queue.qsize(),
+                "inflight": self._inflight,
+                "concurrency": int(self._concurrency),
+                "batches": batches,
+                "texts": self._metrics["texts"],
+                "rate_limited": self._metrics["rate_limited"],
+                "errors": self._metrics["errors"],
+                "avg_latency": self._metrics["latency"] / batches if batches else 0.0,
+            }
+
+    def _ensure_started(self) -> None:
+        """懒启动调度线程，进程fork后(如celery子进程)需要重新创建线程与线程池"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._condition:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._inflight = 0
+            self._queue = Queue()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="embedding-dispatcher",
+            )
+            self._thread = Thread(target=self._dispatch_loop, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _dispatch_loop(self) -> None:
+        """调度循环，在时间窗口内合并请求分片，获取并发名额与令牌后提交到线程池执行"""
+        pending: Optional[_EmbeddingRequest] = None
+        while True:
+            # 1.阻塞获取第一个请求分片，并在合并窗口内继续收集，直到达到批次大小
+            batch = [pending or self._queue.get()]
+            pending = None
+            size = len(batch[0].texts)
+            deadline = time.monotonic() + self.batch_window
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if size + len(request.texts) > self.max_batch_size:
+                    pending = request
+                    break
+                batch.append(request)
+                size += len(request.texts)
+
+            # 2.等待并发窗口出现空闲名额
+            with self._condition:
+                while self._inflight >= int(self._concurrency):
+                    self._condition.wait()
+                self._inflight += 1
+
+            # 3.提交到线程池执行
+            self._executor.submit(self._execute, batch)
+
+    def _execute(self, batch: list[_EmbeddingRequest]) -> None:
+        """执行单个合并批次，遇到限流时减小并发窗口并退避重试，完成后将结果分发给各个请求分片"""
+        texts = [text for request in batch for text in request.texts]
+        try:
+            for attempt in range(self.max_retries + 1):
+                # 1.获取请求数与token数令牌
+                if self._request_bucket is not None:
+                    self._request_bucket.acquire(1)
+                if self._token_bucket is not None:
+                    self._token_bucket.acquire(
+                        sum(self.length_function(text) for text in texts)
+                    )
+
+                # 2.调用底层嵌入模型，限流时乘性减少并发窗口并指数退避
+                start_at = time.monotonic()
+                try:
+                    vectors = self.embeddings.embed_documents(texts)
+                except Exception as e:
+                    if not self._is_rate_limited(e) or attempt >= self.max_retries:
+                        raise
+                    self._on_rate_limited()
+                    time.sleep(min(2**attempt, 30) * random.uniform(0.5, 1.0))
+                    continue
+
+                # 3.请求成功，根据延迟调整并发窗口，并按分片拆分结果
+                self._on_success(time.monotonic() - start_at, len(texts))
+                offset = 0
+                for request in batch:
+                    request.future.set_result(
+                        vectors[offset : offset + len(request.texts)]
+                    )
+                    offset += len(request.texts)
+                return
+        except Exception as e:
+            with self._condition:
+                self._metrics["errors"] += 1
+            for request in batch:
+                request.future.set_exception(e)
+        finally:
+            with self._condition:
+                self._inflight -= 1
+                self._condition.notify_all()
+            self._log_metrics()
+
+    def _log_metrics(self) -> None:
+        """距离上次输出超过指标日志间隔时将运行指标写入日志，用于观察限流及并发窗口的变化"""
+        if self.metrics_log_interval <= 0:
+            return
+        with self._condition:
+            now = time.monotonic()
+            if now - self._metrics_logged_at < self.metrics_log_interval:
+                return
+            self._metrics_logged_at = now
+        logging.info(f"文本嵌入请求调度指标: {self.metrics}")
+
+    def _on_success(self, latency: float, text_count: int) -> None:
+        """请求成功时更新指标，延迟未超过目标时加性增加并发窗口，否则乘性减少"""
+        with self._condition:
+            self._metrics["batches"] += 1
+            self._metrics["texts"] += text_count
+            self._metrics["latency"] += latency
+            if latency <= self.target_latency:
+                self._concurrency = min(
+                    self.max_concurrency, self._concurrency + 1 / self._concurrency
+                )
+            else:
+                self._concurrency = max(1.0, self._concurrency * 0.75)
+            self._condition.notify_all()
+
+    def _on_rate_limited(self) -> None:
+        """触发限流时更新指标，并将并发窗口减半"""
+        with self._condition:
+            self._metrics["rate_limited"] += 1
+            self._concurrency = max(1.0, self._concurrency / 2)
+
+    @classmethod
+    def _is_rate_limited(cls, error: Exception) -> bool:
+        """检测异常是否为供应商的限流错误(HTTP 429或千帆QPS/TPM超限)"""
+        status_code = getattr(error, "status_code", None) or getattr(
+            getattr(error, "response", None), "status_code", None
+        )
+        if status_code == 429:
+            return True
+        message = str(error).lower()
+        return any(
+            flag in message
+            for flag in ["429", "rate limit", "too many requests", "limit reached"]
+        )
 
 
 @inject
+@singleton
 @dataclass
 class EmbeddingsService:
     """文本嵌入模型服务"""
 
-    _store: RedisStore
+    _store: EmbeddingRedisStore
     _embeddings: Embeddings
-    _cache_backed_embeddings: CacheBackedEmbeddings
+    _dispatcher: EmbeddingDispatcher
+    _cache_backed_embeddings: QueryCachedEmbeddings
 
-    def __init__(self, redis: Redis):
-        """构造函数，初始化文本嵌入模型客户端、存储器、缓存客户端"""
-        self._store = RedisStore(client=redis)
+    def __init__(self, redis: Redis, conf: Config):
+        """构造函数，初始化文本嵌入模型客户端、存储器、缓存客户端，服务在应用创建前注入，因此从Config读取配置"""
+        self._store = EmbeddingRedisStore(
+            redis,
+            model_name="embedding-v1",
+            namespace="embeddings",
+            dtype=conf.EMBEDDINGS_CACHE_DTYPE,
+            ttl=conf.EMBEDDINGS_CACHE_TTL,
+            max_memory=conf.EMBEDDINGS_CACHE_MAX_MEMORY,
+        )
         # self._embeddings = HuggingFaceEmbeddings(
         #     model_name="nomic-ai/nomic-embed-text-v1.5",
         #     cache_folder=os.path.join(os.getcwd(), "internal", "core", "embeddings"),
@@ -66,10 +552,27 @@ class EmbeddingsService:
             qianfan_sk=sk,
             model="embedding-v1",
         )
-        self._cache_backed_embeddings = CacheBackedEmbeddings.from_bytes_store(
+        self._dispatcher = EmbeddingDispatcher(
             self._embeddings,
-            self._store,
-            namespace="embeddings",
+            max_batch_size=self.max_batch_size,
+            batch_window=conf.EMBEDDINGS_DISPATCH_WINDOW,
+            requests_per_minute=conf.EMBEDDINGS_REQUESTS_PER_MINUTE,
+            tokens_per_minute=conf.EMBEDDINGS_TOKENS_PER_MINUTE,
+            max_concurrency=conf.EMBEDDINGS_MAX_CONCURRENCY,
+            target_latency=conf.EMBEDDINGS_TARGET_LATENCY,
+            length_function=self.calculate_token_count,
+            metrics_log_interval=conf.EMBEDDINGS_METRICS_LOG_INTERVAL,
+        )
+        self._cache_backed_embeddings = QueryCachedEmbeddings(
+            CacheBackedEmbeddings(self._dispatcher, self._store),
+            EmbeddingRedisStore(
+                redis,
+                model_name="embedding-v1",
+                namespace="embeddings:query",
+                dtype=conf.EMBEDDINGS_CACHE_DTYPE,
+                ttl=conf.EMBEDDINGS_QUERY_CACHE_TTL,
+            ),
+            max_size=conf.EMBEDDINGS_QUERY_CACHE_SIZE,
         )
 
     @classmethod
@@ -79,13 +582,18 @@ class EmbeddingsService:
         return len(encoding.encode(query))
 
     @property
-    def store(self) -> RedisStore:
+    def max_batch_size(self) -> int:
+        """获取文本嵌入模型单次请求支持的最大文本数，用于批量嵌入时切分请求"""
+        return getattr(self._embeddings, "chunk_size", 16)
+
+    @property
+    def store(self) -> EmbeddingRedisStore:
         return self._store
 
     @property
     def embeddings(self) -> Embeddings:
-        return self._embeddings
+        return self._dispatcher
 
     @property
-    def cache_backed_embeddings(self) -> CacheBackedEmbeddings:
+    def cache_backed_embeddings(self) -> QueryCachedEmbeddings:
         return self._cache_backed_embeddings
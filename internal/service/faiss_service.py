@@ -29,7 +29,7 @@ class FaissService:
         # 3.初始化faiss向量数据库
         self.faiss = FAISS.load_local(
             folder_path=faiss_vector_store_path,
-            embeddings=self.embeddings_service.embeddings,
+            embeddings=self.embeddings_service.cache_backed_embeddings,
             allow_dangerous_deserialization=True,
         )
 
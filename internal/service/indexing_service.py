@@ -1,30 +1,48 @@
+import json
 import logging
 import re
 import uuid
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from queue import Full, Queue
+from threading import Thread
+from typing import Any, Callable, Iterable, Iterator, Optional
 from uuid import UUID
 
 from flask import Flask, current_app
 from injector import inject
 from langchain_core.documents import Document as LCDocument
 from redis import Redis
-from sqlalchemy import func
-from weaviate.classes.query import Filter
+from sqlalchemy import func, update
 
 from internal.core.file_extractor import FileExtractor
-from internal.entity.cache_entity import LOCK_DOCUMENT_UPDATE_ENABLED
+from internal.core.vector_database import WeaviateVectorDatabase
+from internal.entity.cache_entity import (
+    LOCK_DOCUMENT_UPDATE_ENABLED,
+    CACHE_DOCUMENT_SPLITTING,
+    CACHE_DOCUMENT_SPLITTING_EXPIRE_TIME,
+    DOCUMENT_SPLITTING_VERSION,
+)
 from internal.entity.dataset_entity import DocumentStatus, SegmentStatus
 from internal.exception import NotFoundException
 from internal.lib.helper import generate_text_hash
-from internal.model import Document, Segment, KeywordTable, DatasetQuery
+from internal.model import (
+    Dataset,
+    Document,
+    Segment,
+    KeywordTable,
+    KeywordPosting,
+    KeywordStatistic,
+    DatasetQuery,
+)
 from pkg.sqlalchemy import SQLAlchemy
 from .base_service import BaseService
 from .embeddings_service import EmbeddingsService
 from .jieba_service import JiebaService
 from .keyword_table_service import KeywordTableService
 from .process_rule_service import ProcessRuleService
+from .retrieval_cache_service import RetrievalCacheService
 from .vector_database_service import VectorDatabaseService
 
 
@@ -41,44 +59,337 @@ class IndexingService(BaseService):
     jieba_service: JiebaService
     keyword_table_service: KeywordTableService
     vector_database_service: VectorDatabaseService
+    retrieval_cache_service: RetrievalCacheService
 
     def build_documents(self, document_ids: list[UUID]):
-        """根据传递的文档id列表构建知识库文档，涵盖了加载、分割、索引构建、数据存储等内容"""
-        # 1.根据传递的文档id获取所有文档
-        documents = (
-            self.db.session.query(Document).filter(Document.id.in_(document_ids)).all()
-        )
+        """根据传递的文档id列表构建知识库文档，涵盖了加载、分割、索引构建、数据存储等内容，各阶段之间使用有界队列流水线并行执行"""
+        # 1.根据传递的文档id获取所有文档id，后续每个阶段在各自的线程中重新查询文档
+        document_ids = [
+            id
+            for id, in self.db.session.query(Document)
+            .with_entities(Document.id)
+            .filter(Document.id.in_(document_ids))
+            .all()
+        ]
+
+        # 2.定义流水线的各个阶段：解析+分割(CPU)、索引构建(jieba)、存储(嵌入+向量数据库)，以及每个阶段的并发数
+        config = current_app.config
+        stages = [
+            (
+                self._parsing_and_splitting,
+                config.get("BUILD_PIPELINE_PARSING_WORKERS", 2),
+            ),
+            (self._indexing, config.get("BUILD_PIPELINE_INDEXING_WORKERS", 1)),
+            (self._completed, config.get("BUILD_PIPELINE_COMPLETED_WORKERS", 2)),
+        ]
+
+        # 3.创建阶段之间的有界队列，队列满时上游阶段会阻塞，从而形成背压
+        queue_size = config.get("BUILD_PIPELINE_QUEUE_SIZE", 2)
+        queues = [Queue(maxsize=queue_size) for _ in range(len(stages))]
+
+        # 4.为每个阶段创建对应数量的工作线程，全部创建完成后再启动，上游阶段投递数据时需要检测下游线程是否存活
+        flask_app = current_app._get_current_object()
+        stage_threads = [[] for _ in stages]
+        for index, (handler, workers) in enumerate(stages):
+            has_next = index + 1 < len(stages)
+            stage_threads[index].extend(
+                Thread(
+                    target=self._run_pipeline_stage,
+                    args=(
+                        flask_app,
+                        handler,
+                        queues[index],
+                        queues[index + 1] if has_next else None,
+                        stage_threads[index + 1] if has_next else [],
+                    ),
+                    daemon=True,
+                )
+                for _ in range(max(workers, 1))
+            )
+        for threads in stage_threads:
+            for thread in threads:
+                thread.start()
+
+        # 5.将文档id依次投递到第一个阶段，第一个阶段的线程全部退出时停止投递，并将剩余的文档标记为错误
+        for position, document_id in enumerate(document_ids):
+            if not self._put_pipeline_item(
+                queues[0], (document_id, None), stage_threads[0]
+            ):
+                logging.error(
+                    "构建文档流水线的解析线程已全部退出，剩余文档无法继续构建"
+                )
+                with self.db.auto_commit():
+                    self.db.session.query(Document).filter(
+                        Document.id.in_(document_ids[position:])
+                    ).update(
+                        {
+                            "status": DocumentStatus.ERROR,
+                            "error": "构建文档流水线异常退出",
+                            "stopped_at": datetime.now(),
+                        },
+                        synchronize_session=False,
+                    )
+                break
+
+        # 6.逐个阶段发送结束信号并等待完成，确保上游全部处理完毕后下游才结束
+        for index, threads in enumerate(stage_threads):
+            for _ in threads:
+                self._put_pipeline_item(queues[index], None, threads)
+            for thread in threads:
+                thread.join()
+
+    def _run_pipeline_stage(
+        self,
+        flask_app: Flask,
+        handler: Callable[[Document, Any], Any],
+        in_queue: Queue,
+        out_queue: Optional[Queue],
+        out_threads: list[Thread],
+    ):
+        """流水线阶段工作线程，从输入队列读取文档并执行处理，成功后将结果投递到下一阶段，失败则更新文档为错误状态"""
+        with flask_app.app_context():
+            while True:
+                # 1.读取输入队列数据，None代表该阶段已结束
+                item = in_queue.get()
+                if item is None:
+                    break
+                document_id, payload = item
+
+                # 2.在当前线程的会话中查询文档并执行阶段处理，所有异常都在循环内处理，保证线程只会因结束信号退出
+                try:
+                    document = self.get(Document, document_id)
+                    if document is None:
+                        continue
+                    result = handler(document, payload)
+                    if out_queue is not None and not self._put_pipeline_item(
+                        out_queue, (document_id, result), out_threads
+                    ):
+                        raise RuntimeError("构建文档流水线的下游线程已全部退出")
+                except Exception as e:
+                    logging.exception(f"构建文档发生错误，错误信息：{str(e)}")
+                    self._update_document_error(document_id, e)
 
-        # 2.执行循环遍历所有文档完成对每个文档的构建
-        for document in documents:
+    @classmethod
+    def _put_pipeline_item(
+        cls, queue: Queue, item: Any, consumers: list[Thread]
+    ) -> bool:
+        """向流水线队列投递数据，队列已满时定期检测下游线程是否存活，下游线程全部退出时放弃投递并返回False，避免永久阻塞"""
+        while True:
             try:
-                # 3.更新当前状态为解析中，并记录开始处理的时间
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                if not any(consumer.is_alive() for consumer in consumers):
+                    return False
+
+    def _update_document_error(self, document_id: UUID, error: Exception):
+        """将文档更新为错误状态，更新失败时只记录日志，避免流水线线程异常退出"""
+        try:
+            self.db.session.rollback()
+            document = self.get(Document, document_id)
+            if document is not None:
                 self.update(
                     document,
-                    status=DocumentStatus.PARSING,
-                    processing_started_at=datetime.now(),
+                    status=DocumentStatus.ERROR,
+                    error=str(error),
+                    stopped_at=datetime.now(),
                 )
+        except Exception as e:
+            logging.exception(
+                f"更新文档错误状态失败，文档id：{document_id}，错误信息：{str(e)}"
+            )
 
-                # 4.执行文档加载步骤，并更新文档的状态与时间
-                lc_documents = self._parsing(document)
+    def _parsing_and_splitting(self, document: Document, _: Any = None):
+        """流水线第一阶段，执行文档加载与分割，返回片段列表"""
+        # 1.更新当前状态为解析中，并记录开始处理的时间
+        self.update(
+            document,
+            status=DocumentStatus.PARSING,
+            processing_started_at=datetime.now(),
+        )
 
-                # 5.执行文档分割步骤，并更新文档状态与时间，涵盖了片段的信息
-                lc_segments = self._splitting(document, lc_documents)
+        # 2.根据文件哈希+处理规则查询分割结果缓存，命中则跳过下载、解析与分割
+        cache_key = self._generate_splitting_cache_key(document)
+        cache_result = self.redis_client.get(cache_key)
+        if cache_result is not None:
+            splitting_result = json.loads(cache_result)
+            self.update(
+                document,
+                character_count=splitting_result["character_count"],
+                status=DocumentStatus.SPLITTING,
+                parsing_completed_at=datetime.now(),
+            )
+            token_counts = splitting_result.get(
+                "token_counts", [None] * len(splitting_result["segments"])
+            )
+            return self._save_segments(
+                document,
+                [
+                    LCDocument(
+                        page_content=content,
+                        metadata={"token_count": token_count},
+                    )
+                    for content, token_count in zip(
+                        splitting_result["segments"], token_counts
+                    )
+                ],
+            )
 
-                # 6.执行文档索引构建，涵盖关键词提取、向量，并更新数据状态
-                self._indexing(document, lc_segments)
+        # 3.流式加载文档，文档在分割时被逐页消费，解析完成后更新文档的状态与时间
+        lc_documents = self._parsing(document)
+
+        # 4.执行文档分割步骤，片段的token数在分割时已经计算完成
+        lc_segments = self._split_documents(document, lc_documents)
+
+        # 5.缓存分割结果，相同文件+相同处理规则再次构建时可以直接复用，超过大小上限的大文档不缓存，避免在redis中重复存储postgres的内容
+        cache_value = json.dumps(
+            {
+                "character_count": document.character_count,
+                "segments": [lc_segment.page_content for lc_segment in lc_segments],
+                "token_counts": [
+                    lc_segment.metadata.get("token_count") for lc_segment in lc_segments
+                ],
+            },
+            ensure_ascii=False,
+        ).encode()
+        if len(cache_value) <= current_app.config.get(
+            "DOCUMENT_SPLITTING_CACHE_MAX_SIZE", 1024 * 1024
+        ):
+            self.redis_client.setex(
+                cache_key, CACHE_DOCUMENT_SPLITTING_EXPIRE_TIME, cache_value
+            )
 
-                # 7.存储操作，涵盖文档状态更新，以及向量数据库的存储
-                self._completed(document, lc_segments)
+        # 6.存储片段数据，并更新文档状态与时间
+        return self._save_segments(document, lc_segments)
 
-            except Exception as e:
-                logging.exception(f"构建文档发生错误，错误信息：{str(e)}")
-                self.update(
-                    document,
-                    status=DocumentStatus.ERROR,
-                    error=str(e),
-                    stopped_at=datetime.now(),
+    @classmethod
+    def _generate_splitting_cache_key(cls, document: Document) -> str:
+        """根据分割实现版本+文档关联的文件哈希+处理规则生成分割结果缓存键"""
+        process_rule_hash = generate_text_hash(
+            json.dumps(document.process_rule.rule, sort_keys=True)
+        )
+        return CACHE_DOCUMENT_SPLITTING.format(
+            version=DOCUMENT_SPLITTING_VERSION,
+            upload_file_hash=document.upload_file.hash,
+            process_rule_hash=process_rule_hash,
+        )
+
+    def reindex_document(self, document_id: UUID):
+        """根据传递的文档id增量重建索引，只对新增/删除的片段执行嵌入、向量数据库及关键词表操作，未变化的片段保留原有节点与向量"""
+        # 1.获取文档记录并记录当前的启用状态
+        document = self.get(Document, document_id)
+        if document is None:
+            logging.exception(f"当前文档不存在，文档id：{document_id}")
+            raise NotFoundException("当前文档不存在")
+        origin_enabled, origin_disabled_at = document.enabled, document.disabled_at
+
+        try:
+            # 2.更新当前状态为解析中，重新加载并分割文档
+            self.update(
+                document,
+                status=DocumentStatus.PARSING,
+                processing_started_at=datetime.now(),
+            )
+            lc_documents = self._parsing(document)
+            lc_segments = self._split_documents(document, lc_documents)
+
+            # 3.查询文档现有的片段，只有构建完成的片段才拥有向量及关键词，按照内容哈希进行分组，其他状态的片段全部视为删除
+            existing_segments = {}
+            incomplete_segments = []
+            for segment in (
+                self.db.session.query(Segment)
+                .with_entities(
+                    Segment.id, Segment.node_id, Segment.hash, Segment.status
                 )
+                .filter(Segment.document_id == document.id)
+                .all()
+            ):
+                if segment.status == SegmentStatus.COMPLETED:
+                    existing_segments.setdefault(segment.hash, []).append(segment)
+                else:
+                    incomplete_segments.append(segment)
+
+            # 4.对比新旧片段哈希，命中的片段保留原有记录，未命中的片段作为新增片段
+            ordered_segments = []
+            added_lc_segments = []
+            for lc_segment in lc_segments:
+                segment_hash = generate_text_hash(lc_segment.page_content)
+                if existing_segments.get(segment_hash):
+                    ordered_segments.append(existing_segments[segment_hash].pop(0))
+                else:
+                    added_lc_segments.append(lc_segment)
+                    ordered_segments.append(lc_segment)
+            removed_segments = incomplete_segments + [
+                segment
+                for segments in existing_segments.values()
+                for segment in segments
+            ]
+
+            # 5.先对新增片段执行存储、索引构建以及向量存储，保证重建期间文档始终可以被检索到
+            self._save_segments(document, added_lc_segments)
+            self._indexing(document, added_lc_segments)
+            self._completed(document, added_lc_segments)
+
+            # 6.新片段写入完成后再删除已经不存在的片段，涵盖向量数据库、关键词表以及postgres记录，并使检索结果缓存失效
+            if removed_segments:
+                removed_segment_ids = [segment.id for segment in removed_segments]
+                self.vector_database_service.vector_database.delete_by_ids(
+                    str(document.dataset_id),
+                    [str(segment.node_id) for segment in removed_segments],
+                )
+                self.keyword_table_service.delete_keyword_table_from_ids(
+                    document.dataset_id, removed_segment_ids
+                )
+                with self.db.auto_commit():
+                    self.db.session.query(Segment).filter(
+                        Segment.id.in_(removed_segment_ids),
+                    ).delete()
+                self.retrieval_cache_service.bump_dataset_version(document.dataset_id)
+
+            # 7.按照新的分割顺序批量更新所有片段的位置
+            with self.db.auto_commit():
+                self.db.session.execute(
+                    update(Segment),
+                    [
+                        {
+                            "id": (
+                                segment.metadata["segment_id"]
+                                if isinstance(segment, LCDocument)
+                                else segment.id
+                            ),
+                            "position": position,
+                        }
+                        for position, segment in enumerate(ordered_segments, 1)
+                    ],
+                )
+
+            # 8.重新计算文档的字符总数及token总数
+            character_count, token_count = (
+                self.db.session.query(
+                    func.coalesce(func.sum(Segment.character_count), 0),
+                    func.coalesce(func.sum(Segment.token_count), 0),
+                )
+                .filter(Segment.document_id == document.id)
+                .first()
+            )
+            self.update(
+                document,
+                character_count=character_count,
+                token_count=token_count,
+            )
+
+            # 9.重建完成后文档会被设置为启用状态，原来处于禁用状态时需要恢复禁用，并同步禁用新增片段的向量及关键词数据
+            if not origin_enabled:
+                self.update(document, enabled=False, disabled_at=origin_disabled_at)
+                self.update_document_enabled(document.id)
+        except Exception as e:
+            logging.exception(f"增量重建文档索引发生错误，错误信息：{str(e)}")
+            self.update(
+                document,
+                status=DocumentStatus.ERROR,
+                error=str(e),
+                stopped_at=datetime.now(),
+            )
 
     def update_document_enabled(self, document_id: UUID):
         """根据传递的文档id更新文档状态，同时修改weaviate向量数据库中的记录"""
@@ -102,37 +413,38 @@ class IndexingService(BaseService):
             .all()
         )
         segment_ids = [id for id, _, _ in segments]
-        node_ids = [node_id for _, node_id, _ in segments]
+        node_ids = [str(node_id) for _, node_id, _ in segments]
         try:
-            # 4.执行循环遍历所有node_ids并更新向量数据
-            collection = self.vector_database_service.collection
-            for node_id in node_ids:
-                try:
-                    collection.data.update(
-                        uuid=node_id,
-                        properties={
-                            "document_enabled": document.enabled,
+            # 4.批量更新向量数据库中所有节点的文档启用状态，并在同一条语句中将更新失败的片段标记为错误
+            failed_node_ids = self.vector_database_service.update_properties_in_batch(
+                str(document.dataset_id),
+                node_ids,
+                {"document_enabled": document.enabled},
+                chunk_size=current_app.config.get("INDEXING_BATCH_SIZE", 500),
+            )
+            if failed_node_ids:
+                with self.db.auto_commit():
+                    self.db.session.query(Segment).filter(
+                        Segment.node_id.in_(failed_node_ids),
+                    ).update(
+                        {
+                            "error": "更新向量数据库文档启用状态失败",
+                            "status": SegmentStatus.ERROR,
+                            "enabled": False,
+                            "disabled_at": datetime.now(),
+                            "stopped_at": datetime.now(),
                         },
+                        synchronize_session=False,
                     )
-                except Exception as e:
-                    with self.db.auto_commit():
-                        self.db.session.query(Segment).filter(
-                            Segment.node_id == node_id,
-                        ).update(
-                            {
-                                "error": str(e),
-                                "status": SegmentStatus.ERROR,
-                                "enabled": False,
-                                "disabled_at": datetime.now(),
-                                "stopped_at": datetime.now(),
-                            }
-                        )
 
             # 5.更新关键词表对应的数据（enabled为false表示从关键词表中删除数据，enabled为true表示在关键词表中新增数据）
             if document.enabled is True:
                 # 6.从禁用改为启用，需要新增关键词
+                failed_node_id_set = set(failed_node_ids)
                 enabled_segment_ids = [
-                    id for id, _, enabled in segments if enabled is True
+                    id
+                    for id, node_id, enabled in segments
+                    if enabled is True and str(node_id) not in failed_node_id_set
                 ]
                 self.keyword_table_service.add_keyword_table_from_ids(
                     document.dataset_id, enabled_segment_ids
@@ -154,8 +466,9 @@ class IndexingService(BaseService):
                 disabled_at=None if origin_enabled else datetime.now(),
             )
         finally:
-            # 6.清空缓存键表示异步操作已经执行完成，无论失败还是成功都全部清除
+            # 6.清空缓存键表示异步操作已经执行完成，无论失败还是成功都全部清除，并递增知识库版本号使检索结果缓存失效
             self.redis_client.delete(cache_key)
+            self.retrieval_cache_service.bump_dataset_version(document.dataset_id)
 
     def delete_document(self, dataset_id: UUID, document_id: UUID):
         """根据传递的知识库id+文档id删除文档信息"""
@@ -171,9 +484,8 @@ class IndexingService(BaseService):
         ]
 
         # 2.调用向量数据库删除其关联记录
-        collection = self.vector_database_service.collection
-        collection.data.delete_many(
-            where=Filter.by_property("document_id").equal(document_id),
+        self.vector_database_service.vector_database.delete_by_document_id(
+            str(dataset_id), str(document_id)
         )
 
         # 3.删除postgres关联的segment记录
@@ -187,6 +499,9 @@ class IndexingService(BaseService):
             dataset_id, segment_ids
         )
 
+        # 5.递增知识库版本号使检索结果缓存失效
+        self.retrieval_cache_service.bump_dataset_version(dataset_id)
+
     def delete_dataset(self, dataset_id: UUID):
         """根据传递的知识库id执行相应的删除操作"""
         try:
@@ -205,6 +520,12 @@ class IndexingService(BaseService):
                 self.db.session.query(KeywordTable).filter(
                     KeywordTable.dataset_id == dataset_id,
                 ).delete()
+                self.db.session.query(KeywordPosting).filter(
+                    KeywordPosting.dataset_id == dataset_id,
+                ).delete()
+                self.db.session.query(KeywordStatistic).filter(
+                    KeywordStatistic.dataset_id == dataset_id,
+                ).delete()
 
                 # 4.删除知识库查询记录
                 self.db.session.query(DatasetQuery).filter(
@@ -212,46 +533,98 @@ class IndexingService(BaseService):
                 ).delete()
 
             # 5.调用向量数据库删除知识库的关联记录
-            self.vector_database_service.collection.data.delete_many(
-                where=Filter.by_property("dataset_id").equal(str(dataset_id))
+            self.vector_database_service.vector_database.delete_by_dataset_id(
+                str(dataset_id)
             )
         except Exception as e:
             logging.exception(
                 f"异步删除知识库关联内容出错, dataset_id: {dataset_id}, 错误信息: {str(e)}"
             )
 
-    def _parsing(self, document: Document):
-        """解析传递的文档为LangChain文档列表"""
-        # 1.获取upload_file并加载LangChain文档
-        upload_file = document.upload_file
-        lc_documents = self.file_extractor.load(upload_file, False, True)
+    def migrate_datasets_vectors(self):
+        """为所有知识库创建异步任务，将weaviate全局集合中的存量向量迁移到各自的租户"""
+        from internal.task.dataset_task import migrate_dataset_vectors
 
-        # 2.循环处理LangChain文档，并删除多余的空白字符串
-        for lc_document in lc_documents:
+        dataset_ids = [
+            id for id, in self.db.session.query(Dataset).with_entities(Dataset.id).all()
+        ]
+        for dataset_id in dataset_ids:
+            migrate_dataset_vectors.delay(dataset_id)
+
+    def migrate_dataset_vectors(self, dataset_id: UUID):
+        """将知识库在weaviate全局集合中的存量向量迁移到知识库对应的租户，迁移可重复执行"""
+        # 1.只有开启weaviate多租户后才需要迁移
+        vector_database = self.vector_database_service.vector_database
+        if (
+            not isinstance(vector_database, WeaviateVectorDatabase)
+            or not vector_database.multi_tenancy
+        ):
+            logging.warning(
+                f"未开启weaviate多租户，跳过知识库向量迁移, dataset_id: {dataset_id}"
+            )
+            return
+
+        # 2.以postgres中的片段记录为准，查询知识库下所有片段的节点id
+        node_ids = [
+            str(node_id)
+            for node_id, in self.db.session.query(Segment)
+            .with_entities(Segment.node_id)
+            .filter(Segment.dataset_id == dataset_id)
+            .all()
+        ]
+
+        # 3.按批次迁移向量数据，并记录迁移失败的节点
+        batch_size = current_app.config.get("INDEXING_BATCH_SIZE", 500)
+        failed_ids = []
+        for i in range(0, len(node_ids), batch_size):
+            failed_ids.extend(
+                vector_database.migrate_to_tenant(
+                    str(dataset_id), node_ids[i : i + batch_size]
+                )
+            )
+        if failed_ids:
+            logging.error(
+                f"知识库向量迁移部分失败, dataset_id: {dataset_id}, 失败节点: {failed_ids}"
+            )
+
+    def _parsing(self, document: Document) -> Iterator[LCDocument]:
+        """流式解析传递的文档，按页/工作表逐个返回LangChain文档，全部解析完成后更新文档状态"""
+        # 1.获取upload_file并流式加载LangChain文档
+        upload_file = document.upload_file
+        character_count = 0
+        for lc_document in self.file_extractor.lazy_load(
+            upload_file,
+            True,
+            parallel=True,
+            pages_per_task=current_app.config.get("FILE_EXTRACTOR_PAGES_PER_TASK", 20),
+        ):
+            # 2.删除多余的空白字符串，并累计字符数
             lc_document.page_content = self._clean_extra_text(lc_document.page_content)
+            character_count += len(lc_document.page_content)
+            yield lc_document
 
         # 3.更新文档状态并记录时间
         self.update(
             document,
-            character_count=sum(
-                [len(lc_document.page_content) for lc_document in lc_documents]
-            ),
+            character_count=character_count,
             status=DocumentStatus.SPLITTING,
             parsing_completed_at=datetime.now(),
         )
 
-        return lc_documents
-
-    def _splitting(self, document: Document, lc_documents: list[LCDocument]):
-        """根据传递的信息进行文档分割，拆分成小块片段"""
+    def _split_documents(
+        self, document: Document, lc_documents: Iterable[LCDocument]
+    ) -> list[LCDocument]:
+        """根据文档的处理规则清除多余字符串并逐个分割文档，只返回片段列表，不执行存储"""
         # 1.根据process_rule获取文本分割器
         process_rule = document.process_rule
-        text_splitter = self.process_rule_service.get_text_splitter_by_process_rule(
-            process_rule,
-            self.embeddings_service.calculate_token_count,
+        text_splitter = (
+            self.process_rule_service.get_token_text_splitter_by_process_rule(
+                process_rule
+            )
         )
 
-        # 2.按照process_rule规则清除多余的字符串
+        # 2.逐个消费文档，按照process_rule规则清除多余的字符串后分割成片段，已分割的文档不再保留
+        lc_segments = []
         for lc_document in lc_documents:
             lc_document.page_content = (
                 self.process_rule_service.clean_text_by_process_rule(
@@ -259,11 +632,13 @@ class IndexingService(BaseService):
                     process_rule,
                 )
             )
+            lc_segments.extend(text_splitter.split_documents([lc_document]))
 
-        # 3.分割文档列表为片段列表
-        lc_segments = text_splitter.split_documents(lc_documents)
+        return lc_segments
 
-        # 4.获取对应文档下得到最大片段位置
+    def _save_segments(self, document: Document, lc_segments: list[LCDocument]):
+        """将分割得到的片段列表批量存储到postgres数据库中，并为每个片段添加元数据"""
+        # 1.获取对应文档下得到最大片段位置
         position = (
             self.db.session.query(func.coalesce(func.max(Segment.position), 0))
             .filter(
@@ -272,39 +647,45 @@ class IndexingService(BaseService):
             .scalar()
         )
 
-        # 5.循环处理片段数据并添加元数据，同时存储到postgres数据库中
+        # 2.循环处理片段数据并添加元数据，片段id与节点id在客户端生成
         segments = []
         for lc_segment in lc_segments:
             position += 1
             content = lc_segment.page_content
-            segment = self.create(
-                Segment,
-                account_id=document.account_id,
-                dataset_id=document.dataset_id,
-                document_id=document.id,
-                node_id=uuid.uuid4(),
-                position=position,
-                content=content,
-                character_count=len(content),
-                token_count=self.embeddings_service.calculate_token_count(content),
-                hash=generate_text_hash(content),
-                status=SegmentStatus.WAITING,
-            )
+            token_count = lc_segment.metadata.get("token_count")
+            if token_count is None:
+                token_count = self.embeddings_service.calculate_token_count(content)
+            segment = {
+                "id": uuid.uuid4(),
+                "account_id": document.account_id,
+                "dataset_id": document.dataset_id,
+                "document_id": document.id,
+                "node_id": uuid.uuid4(),
+                "position": position,
+                "content": content,
+                "character_count": len(content),
+                "token_count": token_count,
+                "hash": generate_text_hash(content),
+                "status": SegmentStatus.WAITING,
+            }
             lc_segment.metadata = {
                 "account_id": str(document.account_id),
                 "dataset_id": str(document.dataset_id),
                 "document_id": str(document.id),
-                "segment_id": str(segment.id),
-                "node_id": str(segment.node_id),
+                "segment_id": str(segment["id"]),
+                "node_id": str(segment["node_id"]),
                 "document_enabled": False,
                 "segment_enabled": False,
             }
             segments.append(segment)
 
-        # 6.更新文档的数据，涵盖状态、token数等内容
+        # 3.在同一个事务中批量将片段存储到postgres数据库中
+        self.create_many(Segment, segments)
+
+        # 4.更新文档的数据，涵盖状态、token数等内容
         self.update(
             document,
-            token_count=sum([segment.token_count for segment in segments]),
+            token_count=sum([segment["token_count"] for segment in segments]),
             status=DocumentStatus.INDEXING,
             splitting_completed_at=datetime.now(),
         )
@@ -313,52 +694,46 @@ class IndexingService(BaseService):
 
     def _indexing(self, document: Document, lc_segments: list[LCDocument]):
         """根据传递的信息构建索引，涵盖关键词提取、词表构建"""
-        for lc_segment in lc_segments:
-            # 1.提取每一个片段对应的关键词，关键词的数量最多不超过10个
-            keywords = self.jieba_service.extract_keywords(lc_segment.page_content, 10)
-
-            # 2.逐条更新文档片段的关键词
-            self.db.session.query(Segment).filter(
-                Segment.id == lc_segment.metadata["segment_id"]
-            ).update(
-                {
-                    "keywords": keywords,
-                    "status": SegmentStatus.INDEXING,
-                    "indexing_completed_at": datetime.now(),
-                }
-            )
+        # 1.使用多进程在内存中提取整个文档所有片段的关键词，关键词的数量最多不超过10个
+        keywords_list = self.jieba_service.extract_keywords_in_batch(
+            [lc_segment.page_content for lc_segment in lc_segments],
+            10,
+            chunk_size=current_app.config.get("KEYWORD_EXTRACTION_CHUNK_SIZE", 200),
+        )
+        segment_keywords = {
+            lc_segment.metadata["segment_id"]: keywords
+            for lc_segment, keywords in zip(lc_segments, keywords_list)
+        }
 
-            # 3.获取当前知识库的关键词表
-            keyword_table_record = (
-                self.keyword_table_service.get_keyword_table_from_dataset_id(
-                    document.dataset_id
+        # 2.在同一个事务中批量更新文档片段的关键词
+        if segment_keywords:
+            with self.db.auto_commit():
+                self.db.session.execute(
+                    update(Segment),
+                    [
+                        {
+                            "id": segment_id,
+                            "keywords": keywords,
+                            "status": SegmentStatus.INDEXING,
+                            "indexing_completed_at": datetime.now(),
+                        }
+                        for segment_id, keywords in segment_keywords.items()
+                    ],
                 )
-            )
-            keyword_table = {
-                field: set(value)
-                for field, value in keyword_table_record.keyword_table.items()
-            }
 
-            # 4.循环将新关键词添加到关键词表中
-            for keyword in keywords:
-                if keyword not in keyword_table:
-                    keyword_table[keyword] = set()
-                keyword_table[keyword].add(lc_segment.metadata["segment_id"])
-
-            # 5.更新关键词表
-            self.update(
-                keyword_table_record,
-                keyword_table={
-                    field: list(value) for field, value in keyword_table.items()
-                },
-            )
+        # 3.将整个文档的关键词一次性写入知识库倒排索引
+        self.keyword_table_service.add_keyword_table_from_segment_keywords(
+            document.dataset_id, segment_keywords
+        )
 
-        # 6.更新文档状态
+        # 4.更新文档状态
         self.update(
             document,
             indexing_completed_at=datetime.now(),
         )
 
+        return lc_segments
+
     def _completed(self, document: Document, lc_segments: list[LCDocument]):
         """存储文档片段到向量数据库，并完成状态更新"""
         # 1.循环遍历片段列表数据，将文档状态及片段状态设置成True
@@ -366,18 +741,33 @@ class IndexingService(BaseService):
             lc_segment.metadata["document_enabled"] = True
             lc_segment.metadata["segment_enabled"] = True
 
-        # 2.调用向量数据库，每次存储10条数据，避免一次传递过多的数据
-        def thread_func(flask_app: Flask, chunks: list[LCDocument], ids: list[UUID]):
-            """线程函数，执行向量数据库与postgres数据的存储"""
+        # 2.获取批量写入配置，每个批次的向量写入与片段状态更新都是批量执行的
+        batch_size = current_app.config.get("INDEXING_BATCH_SIZE", 500)
+        max_workers = current_app.config.get("INDEXING_MAX_WORKERS", 5)
+
+        def thread_func(flask_app: Flask, chunks: list[LCDocument], ids: list[str]):
+            """线程函数，批量写入向量数据库，并批量更新postgres中片段的状态"""
             with flask_app.app_context():
+                # 3.批量写入向量数据库，整个批次出错时将该批次所有片段标记为错误
                 try:
-                    self.vector_database_service.vector_store.add_documents(
-                        chunks,
-                        ids=ids,
+                    failed_ids = set(
+                        self.vector_database_service.add_documents_in_batch(
+                            str(document.dataset_id),
+                            chunks,
+                            ids,
+                            batch_size=batch_size,
+                        )
                     )
-                    with self.db.auto_commit():
+                except Exception as e:
+                    logging.exception(f"构建文档片段索引发生异常，错误信息： {str(e)}")
+                    failed_ids = set(ids)
+                completed_ids = [id for id in ids if id not in failed_ids]
+
+                # 4.在同一个事务中批量更新成功与失败片段的状态
+                with self.db.auto_commit():
+                    if completed_ids:
                         self.db.session.query(Segment).filter(
-                            Segment.node_id.in_(ids)
+                            Segment.node_id.in_(completed_ids)
                         ).update(
                             {
                                 "status": SegmentStatus.COMPLETED,
@@ -385,11 +775,9 @@ class IndexingService(BaseService):
                                 "enabled": True,
                             }
                         )
-                except Exception as e:
-                    logging.exception(f"构建文档片段索引发生异常，错误信息： {str(e)}")
-                    with self.db.auto_commit():
+                    if failed_ids:
                         self.db.session.query(Segment).filter(
-                            Segment.node_id.in_(ids)
+                            Segment.node_id.in_(list(failed_ids))
                         ).update(
                             {
                                 "status": SegmentStatus.ERROR,
@@ -399,10 +787,11 @@ class IndexingService(BaseService):
                             }
                         )
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
+        # 5.按批次切分片段并提交到线程池，多个批次之间流水线并行执行
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = []
-            for i in range(0, len(lc_segments), 1):
-                chunks = lc_segments[i : i + 1]
+            for i in range(0, len(lc_segments), batch_size):
+                chunks = lc_segments[i : i + batch_size]
                 ids = [chunk.metadata["node_id"] for chunk in chunks]
                 futures.append(
                     executor.submit(
@@ -413,13 +802,14 @@ class IndexingService(BaseService):
             for future in futures:
                 future.result()
 
-        # 6.更新文档的状态数据
+        # 6.更新文档的状态数据，并递增知识库版本号使检索结果缓存失效
         self.update(
             document,
             status=DocumentStatus.COMPLETED,
             completed_at=datetime.now(),
             enabled=True,
         )
+        self.retrieval_cache_service.bump_dataset_version(document.dataset_id)
 
     @classmethod
     def _clean_extra_text(cls, text: str):
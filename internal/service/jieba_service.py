@@ -1,11 +1,80 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
 
+import jieba
 import jieba.analyse
+from flask import current_app
 from injector import inject
 from jieba.analyse import default_tfidf
 
 from internal.entity.jieba_entity import STOPWORD_SET
 
+# 关键词提取进程池，每个进程懒创建一个并在多次调用之间复用，子进程已预加载jieba词典
+_keyword_executor: Optional[ProcessPoolExecutor] = None
+_keyword_executor_lock = Lock()
+
+# 调用方进程可能持有线程及锁(如celery、gunicorn线程)，子进程使用forkserver/spawn启动，避免fork继承这些状态
+_keyword_mp_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _init_keyword_worker():
+    """关键词提取子进程初始化函数，预加载jieba词典并扩展停用词"""
+    jieba.initialize()
+    default_tfidf.stop_words = STOPWORD_SET
+
+
+def _get_keyword_max_workers() -> int:
+    """获取配置的关键词提取子进程数，该值为每个进程的总上限，由所有调用方共享"""
+    return max(int(current_app.config.get("KEYWORD_EXTRACTION_MAX_WORKERS", 4)), 1)
+
+
+def _get_keyword_executor() -> ProcessPoolExecutor:
+    """获取当前进程的关键词提取进程池，不存在时按配置的子进程数创建"""
+    global _keyword_executor
+    with _keyword_executor_lock:
+        if _keyword_executor is None:
+            _keyword_executor = ProcessPoolExecutor(
+                max_workers=_get_keyword_max_workers(),
+                mp_context=_keyword_mp_context,
+                initializer=_init_keyword_worker,
+            )
+        return _keyword_executor
+
+
+def _discard_keyword_executor(executor: ProcessPoolExecutor) -> None:
+    """进程池损坏(子进程异常退出)时丢弃进程池，下次使用时重新创建"""
+    global _keyword_executor
+    with _keyword_executor_lock:
+        if _keyword_executor is executor:
+            _keyword_executor = None
+
+
+def _reset_keyword_executor_after_fork() -> None:
+    """fork后的子进程(如celery worker)不能复用父进程的进程池及锁，需要重新创建"""
+    global _keyword_executor, _keyword_executor_lock
+    _keyword_executor = None
+    _keyword_executor_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_keyword_executor_after_fork)
+
+
+def _extract_keywords_chunk(
+    texts: list[str], max_keyword_pre_chunk: int
+) -> list[list[str]]:
+    """在子进程中提取一批文本的关键词列表"""
+    return [
+        jieba.analyse.extract_tags(sentence=text, topK=max_keyword_pre_chunk)
+        for text in texts
+    ]
+
 
 @inject
 @dataclass
@@ -23,3 +92,39 @@ class JiebaService:
             sentence=text,
             topK=max_keyword_pre_chunk,
         )
+
+    @classmethod
+    def cut(cls, text: str) -> list[str]:
+        """使用与关键词提取相同的分词器对文本分词，返回去除空白后的小写词语列表"""
+        return [word.lower() for word in jieba.lcut(text) if word.strip()]
+
+    @classmethod
+    def extract_keywords_in_batch(
+        cls,
+        texts: list[str],
+        max_keyword_pre_chunk: int = 10,
+        chunk_size: int = 200,
+    ) -> list[list[str]]:
+        """根据输入的文本列表，使用进程池并行提取关键词，返回结果与输入顺序一一对应，且与串行提取结果一致"""
+        # 1.文本较少或者只配置了单个子进程时直接串行提取，避免进程池的启动开销
+        if _get_keyword_max_workers() <= 1 or len(texts) <= chunk_size:
+            return [cls.extract_keywords(text, max_keyword_pre_chunk) for text in texts]
+
+        # 2.将文本列表按块切分后提交到进程内共享的进程池，子进程已预加载jieba及停用词
+        chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        executor = _get_keyword_executor()
+        try:
+            results = executor.map(
+                _extract_keywords_chunk,
+                chunks,
+                [max_keyword_pre_chunk] * len(chunks),
+            )
+
+            # 3.按照提交顺序拼接各个块的结果
+            return [
+                keywords for chunk_keywords in results for keywords in chunk_keywords
+            ]
+        except BrokenProcessPool:
+            # 4.子进程异常退出导致进程池损坏时丢弃进程池，下次调用时重新创建
+            _discard_keyword_executor(executor)
+            raise
@@ -1,109 +1,160 @@
+from collections import Counter
 from dataclasses import dataclass
 from uuid import UUID
 
 from injector import inject
-from redis import Redis
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
 
-from internal.entity.cache_entity import (
-    LOCK_KEYWORD_TABLE_UPDATE_KEYWORD_TABLE,
-    LOCK_EXPIRE_TIME,
-)
-from internal.model import Segment, KeywordTable
+from internal.model import Segment, KeywordPosting, KeywordStatistic
 from pkg.sqlalchemy import SQLAlchemy
 from .base_service import BaseService
+from .jieba_service import JiebaService
 
 
 @inject
 @dataclass
 class KeywordTableService(BaseService):
-    """知识库关键词表服务"""
+    """知识库关键词表服务，关键词以倒排索引的形式按行存储，增删只涉及受影响片段的关键词"""
 
     db: SQLAlchemy
-    redis_client: Redis
+    jieba_service: JiebaService
 
-    def get_keyword_table_from_dataset_id(self, dataset_id: UUID):
-        """根据传递的知识库id获取关键词表"""
-        keyword_table = (
-            self.db.session.query(KeywordTable)
+    def delete_keyword_table_from_ids(self, dataset_id: UUID, segment_ids: list[UUID]):
+        """根据传递的知识库id+片段id列表删除倒排索引中对应的记录，只涉及这些片段的关键词，无需锁定整个知识库"""
+        self.delete_keyword_postings(dataset_id, segment_ids)
+
+    def add_keyword_table_from_ids(self, dataset_id: UUID, segment_ids: list[UUID]):
+        """根据传递的知识库id+片段id列表，将片段关键词写入倒排索引"""
+        # 1.根据segment_ids查找片段的关键词信息
+        segments = (
+            self.db.session.query(Segment)
+            .with_entities(Segment.id, Segment.keywords)
             .filter(
-                KeywordTable.dataset_id == dataset_id,
+                Segment.id.in_(segment_ids),
             )
-            .one_or_none()
+            .all()
         )
-        if keyword_table is None:
-            keyword_table = self.create(
-                KeywordTable, dataset_id=dataset_id, keyword_table={}
-            )
-
-        return keyword_table
 
-    def delete_keyword_table_from_ids(self, dataset_id: UUID, segment_ids: list[UUID]):
-        """根据传递的知识库id+片段id列表删除对应关键词表中多余的数据"""
-        # 1.删除知识库关键词表里多余的数据，该操作需要上锁，避免在并发的情况下拿到错误的数据
-        cache_key = LOCK_KEYWORD_TABLE_UPDATE_KEYWORD_TABLE.format(
-            dataset_id=dataset_id
+        # 2.将片段关键词写入倒排索引
+        self.add_keyword_postings(
+            dataset_id, {str(id): keywords for id, keywords in segments}
         )
-        with self.redis_client.lock(cache_key, timeout=LOCK_EXPIRE_TIME):
-            # 2.获取当前知识库的关键词表
-            keyword_table_record = self.get_keyword_table_from_dataset_id(dataset_id)
-            keyword_table = keyword_table_record.keyword_table.copy()
-
-            # 3.将片段id列表转换成集合，并创建关键词集合用于清除空关键词
-            segment_ids_to_delete = set([str(segment_id) for segment_id in segment_ids])
-            keywords_to_delete = set()
-
-            # 4.循环遍历所有关键词执行判断与更新
-            for keyword, ids in keyword_table.items():
-                ids_set = set(ids)
-                if segment_ids_to_delete.intersection(ids_set):
-                    keyword_table[keyword] = list(
-                        ids_set.difference(segment_ids_to_delete)
-                    )
-                    if not keyword_table[keyword]:
-                        keywords_to_delete.add(keyword)
-
-            # 5.检测空关键词数据并删除（关键词并没有映射任何字段id的数据）
-            for keyword in keywords_to_delete:
-                del keyword_table[keyword]
-
-            # 6.将数据更新到关键词表中
-            self.update(keyword_table_record, keyword_table=keyword_table)
 
-    def add_keyword_table_from_ids(self, dataset_id: UUID, segment_ids: list[UUID]):
-        """根据传递的知识库id+片段id列表，在关键词表中添加关键词"""
-        # 1.新增知识库关键词表里多余的数据，该操作需要上锁，避免在并发的情况下拿到错误的数据
-        cache_key = LOCK_KEYWORD_TABLE_UPDATE_KEYWORD_TABLE.format(
-            dataset_id=dataset_id
-        )
-        with self.redis_client.lock(cache_key, timeout=LOCK_EXPIRE_TIME):
-            # 2.获取指定知识库的关键词比哦啊
-            keyword_table_record = self.get_keyword_table_from_dataset_id(dataset_id)
-            keyword_table = {
-                field: set(value)
-                for field, value in keyword_table_record.keyword_table.items()
+    def add_keyword_table_from_segment_keywords(
+        self, dataset_id: UUID, segment_keywords: dict[str, list[str]]
+    ):
+        """根据传递的知识库id+片段关键词映射(segment_id->keywords)，将关键词写入倒排索引"""
+        self.add_keyword_postings(dataset_id, segment_keywords)
+
+    def add_keyword_postings(
+        self,
+        dataset_id: UUID,
+        segment_keywords: dict[str, list[str]],
+        chunk_size: int = 2000,
+    ):
+        """将片段关键词映射(segment_id->keywords)写入倒排索引，已存在的记录直接忽略，同时累加知识库关键词统计"""
+        # 1.查询片段的内容并使用jieba分词，词频及片段长度统一以分词后的词语数为单位
+        segments = {}
+        for id, content in (
+            self.db.session.query(Segment)
+            .with_entities(Segment.id, Segment.content)
+            .filter(Segment.id.in_(list(segment_keywords.keys())))
+            .all()
+        ):
+            words = self.jieba_service.cut(content)
+            segments[str(id)] = (Counter(words), len(words))
+
+        # 2.将片段关键词映射展开为倒排索引记录，并按主键排序保证并发写入时加锁顺序一致，避免死锁
+        values = [
+            {
+                "dataset_id": dataset_id,
+                "keyword": keyword,
+                "segment_id": segment_id,
+                "frequency": max(segments[str(segment_id)][0][keyword.lower()], 1),
+                "segment_length": segments[str(segment_id)][1],
             }
-
-            # 3.根据segment_ids查找片段的关键词信息
-            segments = (
-                self.db.session.query(Segment)
-                .with_entities(Segment.id, Segment.keywords)
+            for segment_id, keywords in segment_keywords.items()
+            if str(segment_id) in segments
+            for keyword in set(keywords)
+        ]
+        if not values:
+            return
+        values.sort(key=lambda value: (value["keyword"], str(value["segment_id"])))
+
+        # 3.分块批量插入，主键冲突时忽略，并根据实际插入的记录统计新增的片段，
+        # 插入前已经存在倒排记录的片段(重复处理或关键词变更)已计入统计，不再重复累加
+        with self.db.auto_commit():
+            existing_segment_ids = {
+                str(segment_id)
+                for segment_id, in self.db.session.query(KeywordPosting.segment_id)
                 .filter(
-                    Segment.id.in_(segment_ids),
+                    KeywordPosting.dataset_id == dataset_id,
+                    KeywordPosting.segment_id.in_(list(segments.keys())),
                 )
+                .distinct()
                 .all()
+            }
+            inserted_segments = {}
+            for i in range(0, len(values), chunk_size):
+                inserted_segments.update(
+                    self.db.session.execute(
+                        insert(KeywordPosting)
+                        .values(values[i : i + chunk_size])
+                        .on_conflict_do_nothing()
+                        .returning(
+                            KeywordPosting.segment_id, KeywordPosting.segment_length
+                        )
+                    ).all()
+                )
+            self._update_keyword_statistic(
+                dataset_id,
+                {
+                    segment_id: segment_length
+                    for segment_id, segment_length in inserted_segments.items()
+                    if str(segment_id) not in existing_segment_ids
+                },
+                1,
             )
 
-            # 4.循环将新关键词添加到关键词表中
-            for id, keywords in segments:
-                for keyword in keywords:
-                    if keyword not in keyword_table:
-                        keyword_table[keyword] = set()
-                    keyword_table[keyword].add(str(id))
-
-            # 5.更新关键词表
-            self.update(
-                keyword_table_record,
-                keyword_table={
-                    field: list(value) for field, value in keyword_table.items()
+    def delete_keyword_postings(self, dataset_id: UUID, segment_ids: list[UUID]):
+        """删除倒排索引中片段id列表对应的记录，同时扣减知识库关键词统计"""
+        if not segment_ids:
+            return
+        with self.db.auto_commit():
+            deleted_segments = dict(
+                self.db.session.execute(
+                    delete(KeywordPosting)
+                    .where(
+                        KeywordPosting.dataset_id == dataset_id,
+                        KeywordPosting.segment_id.in_(segment_ids),
+                    )
+                    .returning(KeywordPosting.segment_id, KeywordPosting.segment_length)
+                ).all()
+            )
+            self._update_keyword_statistic(dataset_id, deleted_segments, -1)
+
+    def _update_keyword_statistic(
+        self, dataset_id: UUID, segments: dict[UUID, int], sign: int
+    ):
+        """按照片段数及片段总长度的增量原子更新知识库关键词统计，调用方负责提交事务"""
+        if not segments:
+            return
+        segment_count = sign * len(segments)
+        total_length = sign * sum(segments.values())
+        self.db.session.execute(
+            insert(KeywordStatistic)
+            .values(
+                dataset_id=dataset_id,
+                segment_count=max(segment_count, 0),
+                total_length=max(total_length, 0),
+            )
+            .on_conflict_do_update(
+                index_elements=[KeywordStatistic.dataset_id],
+                set_={
+                    "segment_count": KeywordStatistic.segment_count + segment_count,
+                    "total_length": KeywordStatistic.total_length + total_length,
+                    "updated_at": func.now(),
                 },
             )
+        )
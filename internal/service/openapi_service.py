@@ -1,13 +1,16 @@
 import json
+import uuid
 from dataclasses import dataclass
 from threading import Thread
-from typing import Generator
+from typing import Generator, Optional
+from uuid import UUID
 
 from flask import current_app
 from injector import inject
 from langchain_core.messages import HumanMessage
 
 from internal.core.agent.agents import FunctionCallAgent
+from internal.core.agent.agents.agent_queue_manager import AgentQueueManager
 from internal.core.agent.agents.react_agent import ReACTAgent
 from internal.core.agent.entities.agent_entity import AgentConfig
 from internal.core.agent.entities.queue_entity import QueueEvent
@@ -165,12 +168,29 @@ class OpenAPIService(BaseService):
             "messages": [HumanMessage(req.query.data)],
             "history": history,
             "long_term_memory": conversation.summary,
+            "task_id": uuid.uuid4(),
         }
 
         # 16.根据stream类型差异执行不同的代码
         if req.stream.data is True:
             agent_thoughts_dict = {}
 
+            # 记录任务上下文，用于断线重连时还原事件数据
+            agent.agent_queue_manager.set_task_context(
+                agent_state["task_id"],
+                end_user_id=end_user.id,
+                conversation_id=conversation.id,
+                message_id=message.id,
+            )
+
+            # 提前记录流式输出及持久化所需的数据，客户端断开连接后生成器会转交后台线程继续执行，此时请求上下文(current_user)及会话中的模型对象均已不可用
+            flask_app = current_app._get_current_object()
+            account_id = account.id
+            app_id = app.id
+            end_user_id = end_user.id
+            conversation_id = conversation.id
+            message_id = message.id
+
             def handle_stream() -> Generator:
                 """流式事件处理器，在Python只要在函数内部使用了yield关键字，那么这个函数的返回值类型肯定是生成器"""
                 for agent_thought in agent.stream(agent_state):
@@ -194,6 +214,8 @@ class OpenAPIService(BaseService):
                                         + agent_thought.thought,
                                         "answer": agent_thoughts_dict[event_id].answer
                                         + agent_thought.answer,
+                                        "message": agent_thought.message
+                                        or agent_thoughts_dict[event_id].message,
                                         "latency": agent_thought.latency,
                                     }
                                 )
@@ -213,23 +235,23 @@ class OpenAPIService(BaseService):
                             }
                         ),
                         "id": event_id,
-                        "end_user_id": str(end_user.id),
-                        "conversation_id": str(conversation.id),
-                        "message_id": str(message.id),
+                        "end_user_id": str(end_user_id),
+                        "conversation_id": str(conversation_id),
+                        "message_id": str(message_id),
                         "task_id": str(agent_thought.task_id),
                     }
-                    yield f"event: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
+                    yield f"id: {agent_thought.stream_id}\nevent: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
 
                 # 22.将消息以及推理过程添加到数据库
                 thread = Thread(
                     target=self.conversation_service.save_agent_thoughts,
                     kwargs={
-                        "flask_app": current_app._get_current_object(),
-                        "account_id": account.id,
-                        "app_id": app.id,
+                        "flask_app": flask_app,
+                        "account_id": account_id,
+                        "app_id": app_id,
                         "app_config": app_config,
-                        "conversation_id": conversation.id,
-                        "message_id": message.id,
+                        "conversation_id": conversation_id,
+                        "message_id": message_id,
                         "agent_thoughts": [
                             agent_thought
                             for agent_thought in agent_thoughts_dict.values()
@@ -282,3 +304,19 @@ class OpenAPIService(BaseService):
                 ],
             }
         )
+
+    def resume_chat(
+        self, task_id: UUID, last_event_id: Optional[str], account: Account
+    ) -> Generator:
+        """根据传递的任务id+最后接收的事件id，重新连接开放API流式对话，从断开处继续输出"""
+        # 1.校验任务是否属于当前账号，调用来源与发起对话时的智能体配置保持一致
+        if not AgentQueueManager.is_task_owner(
+            task_id, InvokeFrom.DEBUGGER, account.id
+        ):
+            raise NotFoundException("该会话任务不存在或已过期，请核实后重试")
+
+        # 2.从最后接收的事件之后继续监听任务事件流
+        agent_queue_manager = AgentQueueManager(
+            user_id=account.id, invoke_from=InvokeFrom.DEBUGGER
+        )
+        yield from agent_queue_manager.resume(task_id, last_event_id)
@@ -5,6 +5,7 @@ from typing import Callable
 from injector import inject
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from internal.core.text_splitter import TokenAwareTextSplitter
 from internal.model import ProcessRule
 
 
@@ -30,6 +31,20 @@ class ProcessRuleService:
             **kwargs,
         )
 
+    @classmethod
+    def get_token_text_splitter_by_process_rule(
+        cls,
+        process_rule: ProcessRule,
+        **kwargs,
+    ) -> TokenAwareTextSplitter:
+        """根据传递的处理规则获取基于token偏移的文本分割器，分割的片段会在元数据中携带token_count"""
+        return TokenAwareTextSplitter(
+            chunk_size=process_rule.rule["segment"]["chunk_size"],
+            chunk_overlap=process_rule.rule["segment"]["chunk_overlap"],
+            separators=process_rule.rule["segment"]["separators"],
+            **kwargs,
+        )
+
     @classmethod
     def clean_text_by_process_rule(cls, text: str, process_rule: ProcessRule):
         """根据传递的处理规则清除多余的字符串"""
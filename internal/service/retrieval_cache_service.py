@@ -0,0 +1,105 @@
+import json
+import time
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Optional
+from uuid import UUID
+
+from injector import inject
+from langchain_core.documents import Document as LCDocument
+from redis import Redis
+
+from internal.entity.cache_entity import (
+    CACHE_DATASET_VERSION,
+    CACHE_RETRIEVAL_RESULT,
+    CACHE_RETRIEVAL_RESULT_EXPIRE_TIME,
+)
+
+
+@inject
+@dataclass
+class RetrievalCacheService:
+    """检索结果缓存服务，缓存键包含每个知识库的版本号，知识库内容或启用状态变化时递增版本号使缓存精确失效"""
+
+    redis_client: Redis
+
+    def bump_dataset_version(self, *dataset_ids: UUID) -> None:
+        """递增知识库版本号，版本号不存在时先使用当前纳秒时间戳初始化，避免版本号丢失后与旧缓存键重合"""
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for dataset_id in dataset_ids:
+            cache_key = CACHE_DATASET_VERSION.format(dataset_id=dataset_id)
+            pipeline.set(cache_key, time.time_ns(), nx=True)
+            pipeline.incr(cache_key)
+        pipeline.execute()
+
+    def get(self, cache_key: str) -> Optional[list[LCDocument]]:
+        """根据缓存键获取缓存的检索结果，未命中时返回None"""
+        cache_result = self.redis_client.get(cache_key)
+        if cache_result is None:
+            return None
+
+        return [
+            LCDocument(page_content=item["page_content"], metadata=item["metadata"])
+            for item in json.loads(cache_result)
+        ]
+
+    def set(self, cache_key: str, lc_documents: list[LCDocument]) -> None:
+        """缓存检索结果，缓存键需要在检索前生成，检索期间版本号变化时结果只会写入旧版本的缓存键，不会被再次命中"""
+        self.redis_client.setex(
+            cache_key,
+            CACHE_RETRIEVAL_RESULT_EXPIRE_TIME,
+            json.dumps(
+                [
+                    {
+                        "page_content": lc_document.page_content,
+                        "metadata": lc_document.metadata,
+                    }
+                    for lc_document in lc_documents
+                ],
+                default=str,
+            ),
+        )
+
+    def _get_dataset_versions(self, dataset_ids: list[str]) -> list[str]:
+        """批量获取知识库版本号，不存在的版本号会被初始化"""
+        cache_keys = [
+            CACHE_DATASET_VERSION.format(dataset_id=dataset_id)
+            for dataset_id in dataset_ids
+        ]
+        versions = self.redis_client.mget(cache_keys)
+        for index, version in enumerate(versions):
+            if version is None:
+                self.redis_client.set(cache_keys[index], time.time_ns(), nx=True)
+                versions[index] = self.redis_client.get(cache_keys[index])
+
+        return [
+            version.decode() if isinstance(version, bytes) else str(version)
+            for version in versions
+        ]
+
+    def generate_cache_key(
+        self,
+        dataset_ids: list[UUID],
+        query: str,
+        retrieval_strategy: str,
+        k: int,
+        score: float,
+    ) -> str:
+        """根据检索参数+各知识库当前的版本号生成缓存键，需要在执行检索前调用"""
+        dataset_ids = sorted(str(dataset_id) for dataset_id in dataset_ids)
+        versions = self._get_dataset_versions(dataset_ids)
+        payload = json.dumps(
+            {
+                "datasets": [
+                    f"{dataset_id}:{version}"
+                    for dataset_id, version in zip(dataset_ids, versions)
+                ],
+                "query": query,
+                "retrieval_strategy": str(retrieval_strategy),
+                "k": k,
+                "score": score,
+            },
+            ensure_ascii=False,
+        )
+
+        return CACHE_RETRIEVAL_RESULT.format(hash=sha256(payload.encode()).hexdigest())
@@ -1,20 +1,20 @@
 from dataclasses import dataclass
 from uuid import UUID
 
-from flask import Flask
+from flask import Flask, current_app
 from injector import inject
-from langchain.retrievers import EnsembleRetriever
 from langchain_core.documents import Document as LCDocument
 from langchain_core.pydantic_v1 import BaseModel, Field
-from sqlalchemy import update
 
 from internal.core.agent.entities.agent_entity import DATASET_RETRIEVAL_TOOL_NAME
 from internal.entity.dataset_entity import RetrievalStrategy, RetrievalSource
 from internal.exception import NotFoundException
-from internal.model import Dataset, DatasetQuery, Segment
+from internal.model import Dataset
 from pkg.sqlalchemy import SQLAlchemy
 from .base_service import BaseService
 from .jieba_service import JiebaService
+from .retrieval_cache_service import RetrievalCacheService
+from .retrieval_stats_service import RetrievalStatsService
 from .vector_database_service import VectorDatabaseService
 from internal.lib.helper import combine_documents
 from langchain.tools import BaseTool, tool
@@ -28,6 +28,8 @@ class RetrievalService(BaseService):
     db: SQLAlchemy
     jieba_service: JiebaService
     vector_database_service: VectorDatabaseService
+    retrieval_cache_service: RetrievalCacheService
+    retrieval_stats_service: RetrievalStatsService
 
     def search_in_datasets(
         self,
@@ -54,68 +56,109 @@ class RetrievalService(BaseService):
             raise NotFoundException("当前无知识库可执行检索")
         dataset_ids = [dataset.id for dataset in datasets]
 
-        # 2.构建不同种类的检索器
-        from internal.core.retrievers import SemanticRetriever, FullTextRetriever
+        # 2.检索前生成缓存键(含检索开始时的知识库版本号)，优先从检索结果缓存中获取，
+        # 未命中时执行检索，检索结果完整时使用同一个缓存键写入，检索期间版本号变化的结果不会被命中
+        cache_key = self.retrieval_cache_service.generate_cache_key(
+            dataset_ids, query, retrieval_strategy, k, score
+        )
+        lc_documents = self.retrieval_cache_service.get(cache_key)
+        if lc_documents is None:
+            lc_documents, is_complete = self._retrieve(
+                dataset_ids, query, retrieval_strategy, k, score
+            )
+            if is_complete:
+                self.retrieval_cache_service.set(cache_key, lc_documents)
+
+        # 3.记录知识库查询及片段命中次数，写入缓冲区后由后台线程批量写入数据库
+        self.retrieval_stats_service.record(
+            lc_documents,
+            query=query,
+            source=retrival_source,
+            # todo:等待APP配置模块完成后进行调整
+            source_app_id=None,
+            account_id=account_id,
+        )
 
-        semantic_retriever = SemanticRetriever(
-            dataset_ids=dataset_ids,
-            vector_store=self.vector_database_service.vector_store,
-            search_kwargs={
-                "k": k,
-                "score_threshold": score,
-            },
+        return lc_documents
+
+    def _retrieve(
+        self,
+        dataset_ids: list[UUID],
+        query: str,
+        retrieval_strategy: str,
+        k: int,
+        score: float,
+    ) -> tuple[list[LCDocument], bool]:
+        """根据检索策略构建检索器并执行检索，多取fetch_k条候选记录去重及多样化后返回前k条，同时返回结果是否完整"""
+        # 1.构建不同种类的检索器，开启最大边际相关性时语义检索从fetch_k条候选记录中选出k条，关闭时按相似度取fetch_k条
+        from internal.core.retrievers import (
+            SemanticRetriever,
+            FullTextRetriever,
+            HybridRetriever,
+            suppress_near_duplicates,
         )
+
+        fetch_k = max(current_app.config.get("RETRIEVAL_FETCH_K", 20), k)
+        # 混合检索时各检索器使用相同的超时时间，超时的检索器由底层客户端终止，不会在后台继续执行
+        timeout = (
+            current_app.config.get("HYBRID_RETRIEVAL_TIMEOUT", 5)
+            if retrieval_strategy == RetrievalStrategy.HYBRID
+            else None
+        )
+        if current_app.config.get("RETRIEVAL_MMR_ENABLED", True):
+            semantic_retriever = SemanticRetriever(
+                dataset_ids=dataset_ids,
+                vector_database=self.vector_database_service.vector_database,
+                timeout=timeout,
+                search_type="mmr",
+                search_kwargs={
+                    "k": k,
+                    "fetch_k": fetch_k,
+                    "lambda_mult": current_app.config.get("RETRIEVAL_MMR_LAMBDA", 0.5),
+                    "score_threshold": score,
+                },
+            )
+        else:
+            semantic_retriever = SemanticRetriever(
+                dataset_ids=dataset_ids,
+                vector_database=self.vector_database_service.vector_database,
+                timeout=timeout,
+                search_kwargs={"k": fetch_k, "score_threshold": score},
+            )
         full_text_retriever = FullTextRetriever(
             db=self.db,
             dataset_ids=dataset_ids,
             jieba_service=self.jieba_service,
-            search_kwargs={"k": k},
+            timeout=timeout,
+            search_kwargs={"k": fetch_k},
         )
-        hybrid_retriever = EnsembleRetriever(
+        hybrid_retriever = HybridRetriever(
+            flask_app=current_app._get_current_object(),
             retrievers=[semantic_retriever, full_text_retriever],
-            weights=[0.5, 0.5],
+            weights=current_app.config.get("HYBRID_RETRIEVAL_WEIGHTS", [0.5, 0.5]),
+            fusion_strategy=current_app.config.get("HYBRID_RETRIEVAL_FUSION", "rrf"),
+            rrf_k=current_app.config.get("HYBRID_RETRIEVAL_RRF_K", 60),
+            timeout=current_app.config.get("HYBRID_RETRIEVAL_TIMEOUT", 5),
+            search_kwargs={"k": fetch_k},
         )
 
-        # 3.根据不同的检索策略执行检索
+        # 2.根据不同的检索策略执行检索，混合检索存在超时或出错的检索器时结果不完整
+        is_complete = True
         if retrieval_strategy == RetrievalStrategy.SEMANTIC:
-            lc_documents = semantic_retriever.invoke(query)[:k]
+            lc_documents = semantic_retriever.invoke(query)
         elif retrieval_strategy == RetrievalStrategy.FULL_TEXT:
-            lc_documents = full_text_retriever.invoke(query)[:k]
+            lc_documents = full_text_retriever.invoke(query)
         else:
-            lc_documents = hybrid_retriever.invoke(query)[:k]
+            lc_documents = hybrid_retriever.invoke(query)
+            is_complete = not hybrid_retriever.degraded
 
-        # 4.添加知识库查询记录（只存储唯一记录，也就是一个知识库如果检索了多篇文档，也只存储一条）
-        unique_dataset_ids = list(
-            set(str(lc_document.metadata["dataset_id"]) for lc_document in lc_documents)
+        # 3.去除近似重复的片段(如chunk重叠或跨知识库重复的文档)后取前k条
+        lc_documents = suppress_near_duplicates(
+            lc_documents,
+            threshold=current_app.config.get("RETRIEVAL_DUPLICATE_THRESHOLD", 0.8),
         )
-        for dataset_id in unique_dataset_ids:
-            self.create(
-                DatasetQuery,
-                dataset_id=dataset_id,
-                query=query,
-                source=retrival_source,
-                # todo:等待APP配置模块完成后进行调整
-                source_app_id=None,
-                created_by=account_id,
-            )
 
-        # 5.批量更新片段的命中次数，召回次数，涵盖了构建+执行语句
-        with self.db.auto_commit():
-            stmt = (
-                update(Segment)
-                .where(
-                    Segment.id.in_(
-                        [
-                            lc_document.metadata["segment_id"]
-                            for lc_document in lc_documents
-                        ]
-                    )
-                )
-                .values(hit_count=Segment.hit_count + 1)
-            )
-            self.db.session.execute(stmt)
-
-        return lc_documents
+        return lc_documents[:k], is_complete
 
     def create_langchain_tool_from_search(
         self,
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Any, Optional
+from uuid import UUID
+
+from flask import Flask, current_app
+from injector import inject, singleton
+from langchain_core.documents import Document as LCDocument
+from redis import Redis
+from sqlalchemy import update
+
+from internal.entity.cache_entity import (
+    CACHE_DATASET_QUERY_BUFFER,
+    CACHE_SEGMENT_HIT_COUNT_BUFFER,
+    LOCK_EXPIRE_TIME,
+    LOCK_RETRIEVAL_STATS_FLUSH,
+)
+from internal.model import DatasetQuery, Segment
+from pkg.sqlalchemy import SQLAlchemy
+from .base_service import BaseService
+
+
+@inject
+@singleton
+@dataclass
+class RetrievalStatsService(BaseService):
+    """检索统计服务，片段命中次数与知识库查询记录先写入redis缓冲区，由后台线程定期聚合后批量写入postgres"""
+
+    db: SQLAlchemy
+    redis_client: Redis
+    _flusher_pid: Optional[int] = field(default=None, init=False)
+    _lock: Lock = field(default_factory=Lock, init=False)
+
+    def record(
+        self,
+        lc_documents: list[LCDocument],
+        query: str,
+        source: str,
+        source_app_id: Optional[UUID],
+        account_id: UUID,
+    ) -> None:
+        """记录一次检索的片段命中及知识库查询，只写入redis缓冲区，不占用请求的数据库事务"""
+        # 1.累加片段命中次数，同时每个知识库只记录一条查询记录
+        created_at = datetime.now().isoformat()
+        dataset_ids = set(
+            str(lc_document.metadata["dataset_id"]) for lc_document in lc_documents
+        )
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for lc_document in lc_documents:
+            pipeline.hincrby(
+                CACHE_SEGMENT_HIT_COUNT_BUFFER,
+                str(lc_document.metadata["segment_id"]),
+                1,
+            )
+        for dataset_id in dataset_ids:
+            pipeline.rpush(
+                CACHE_DATASET_QUERY_BUFFER,
+                json.dumps(
+                    {
+                        "dataset_id": dataset_id,
+                        "query": query,
+                        "source": source,
+                        "source_app_id": str(source_app_id) if source_app_id else None,
+                        "created_by": str(account_id) if account_id else None,
+                        "created_at": created_at,
+                    }
+                ),
+            )
+        pipeline.execute()
+
+        # 2.确保当前进程已经启动后台刷新线程
+        self._ensure_flusher()
+
+    def flush(self) -> None:
+        """将缓冲区数据聚合后写入postgres，使用分布式锁保证同一时间只有一个进程在刷新"""
+        lock = self.redis_client.lock(LOCK_RETRIEVAL_STATS_FLUSH, LOCK_EXPIRE_TIME)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            self._flush_hit_counts()
+            self._flush_dataset_queries()
+        finally:
+            lock.release()
+
+    def _flush_hit_counts(self) -> None:
+        """聚合片段命中次数，相同增量的片段合并为一条UPDATE语句"""
+        # 1.在同一个事务中读取并删除缓冲区，之后的写入会进入新的缓冲区，进程崩溃时不会重复累加
+        hit_counts = self._take_buffer(CACHE_SEGMENT_HIT_COUNT_BUFFER, "hgetall")
+        if not hit_counts:
+            return
+
+        # 2.按照增量分组，在同一个事务中批量更新命中次数
+        segment_ids_by_count = defaultdict(list)
+        for segment_id, count in hit_counts.items():
+            segment_ids_by_count[int(count)].append(
+                segment_id.decode() if isinstance(segment_id, bytes) else segment_id
+            )
+        try:
+            with self.db.auto_commit():
+                for count, segment_ids in segment_ids_by_count.items():
+                    self.db.session.execute(
+                        update(Segment)
+                        .where(Segment.id.in_(sorted(segment_ids)))
+                        .values(hit_count=Segment.hit_count + count)
+                        .execution_options(synchronize_session=False)
+                    )
+        except Exception:
+            # 3.写入失败时将命中次数累加回缓冲区，等待下次刷新
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for segment_id, count in hit_counts.items():
+                pipeline.hincrby(CACHE_SEGMENT_HIT_COUNT_BUFFER, segment_id, int(count))
+            pipeline.execute()
+            raise
+
+    def _flush_dataset_queries(self) -> None:
+        """批量插入知识库查询记录"""
+        # 1.在同一个事务中取出并删除缓冲区中的所有查询记录
+        items = self._take_buffer(CACHE_DATASET_QUERY_BUFFER, "lrange", 0, -1)
+        if not items:
+            return
+        dataset_queries = [json.loads(item) for item in items]
+
+        # 2.批量插入查询记录，并保留检索发生的时间
+        try:
+            self.create_many(
+                DatasetQuery,
+                [
+                    {
+                        **dataset_query,
+                        "created_at": datetime.fromisoformat(
+                            dataset_query["created_at"]
+                        ),
+                        "updated_at": datetime.fromisoformat(
+                            dataset_query["created_at"]
+                        ),
+                    }
+                    for dataset_query in dataset_queries
+                ],
+            )
+        except Exception:
+            # 3.写入失败时将查询记录放回缓冲区，等待下次刷新
+            self.redis_client.rpush(CACHE_DATASET_QUERY_BUFFER, *items)
+            raise
+
+    def _take_buffer(self, buffer_key: str, command: str, *args) -> Any:
+        """使用MULTI/EXEC事务原子地读取并删除缓冲区，返回读取命令的结果，缓冲区不存在时返回空结果"""
+        pipeline = self.redis_client.pipeline(transaction=True)
+        getattr(pipeline, command)(buffer_key, *args)
+        pipeline.delete(buffer_key)
+        value, _ = pipeline.execute()
+        return value
+
+    def _ensure_flusher(self) -> None:
+        """懒启动后台刷新线程，进程fork后(如celery子进程)需要重新启动"""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            Thread(
+                target=self._flush_loop,
+                args=(current_app._get_current_object(),),
+                daemon=True,
+            ).start()
+            self._flusher_pid = os.getpid()
+
+    def _flush_loop(self, flask_app: Flask) -> None:
+        """后台刷新线程，按照配置的间隔定期刷新缓冲区"""
+        interval = flask_app.config.get("RETRIEVAL_STATS_FLUSH_INTERVAL", 5)
+        while True:
+            time.sleep(interval)
+            try:
+                with flask_app.app_context():
+                    self.flush()
+            except Exception as e:
+                logging.exception(f"刷新检索统计数据失败, 错误信息: {str(e)}")
@@ -25,6 +25,7 @@ from .base_service import BaseService
 from .embeddings_service import EmbeddingsService
 from .jieba_service import JiebaService
 from .keyword_table_service import KeywordTableService
+from .retrieval_cache_service import RetrievalCacheService
 from .vector_database_service import VectorDatabaseService
 from internal.model import Account
 
@@ -40,6 +41,7 @@ class SegmentService(BaseService):
     embeddings_service: EmbeddingsService
     keyword_table_service: KeywordTableService
     vector_database_service: VectorDatabaseService
+    retrieval_cache_service: RetrievalCacheService
 
     def create_segment(
         self,
@@ -107,7 +109,8 @@ class SegmentService(BaseService):
             )
 
             # 8.往向量数据库中新增数据
-            self.vector_database_service.vector_store.add_documents(
+            failed_ids = self.vector_database_service.add_documents_in_batch(
+                str(document.dataset_id),
                 [
                     LCDocument(
                         page_content=req.content.data,
@@ -122,8 +125,10 @@ class SegmentService(BaseService):
                         },
                     )
                 ],
-                ids=[str(segment.node_id)],
+                [str(segment.node_id)],
             )
+            if failed_ids:
+                raise FailException("片段写入向量数据库失败")
 
             # 9.重新计算片段的字符总数以及token总数
             document_character_count, document_token_count = self.db.session.query(
@@ -156,6 +161,9 @@ class SegmentService(BaseService):
                     stopped_at=datetime.now(),
                 )
             raise FailException("新增文档片段失败，请稍后尝试")
+        finally:
+            # 12.知识库内容发生变化，递增知识库版本号使检索结果缓存失效
+            self.retrieval_cache_service.bump_dataset_version(dataset_id)
 
     def update_segment(
         self,
@@ -226,21 +234,24 @@ class SegmentService(BaseService):
                     token_count=document_token_count,
                 )
 
-                # 9.更新向量数据库对应记录
-                self.vector_database_service.collection.data.update(
-                    uuid=str(segment.node_id),
+                # 9.更新向量数据库对应记录，向量通过缓存嵌入模型计算
+                embeddings = self.embeddings_service.cache_backed_embeddings
+                self.vector_database_service.vector_database.update(
+                    str(segment.dataset_id),
+                    str(segment.node_id),
                     properties={
                         "text": req.content.data,
                     },
-                    vector=self.embeddings_service.embeddings.embed_query(
-                        req.content.data
-                    ),
+                    vector=embeddings.embed_documents([req.content.data])[0],
                 )
         except Exception as e:
             logging.exception(
                 f"更新文档片段记录失败, segment_id: {segment}, 错误信息: {str(e)}"
             )
             raise FailException("更新文档片段记录失败，请稍后尝试")
+        finally:
+            # 10.知识库内容发生变化，递增知识库版本号使检索结果缓存失效
+            self.retrieval_cache_service.bump_dataset_version(dataset_id)
 
         return segment
 
@@ -348,10 +359,16 @@ class SegmentService(BaseService):
                         dataset_id, [segment_id]
                     )
 
-                # 8.同步处理weaviate向量数据库里的数据
-                self.vector_database_service.collection.data.update(
-                    uuid=segment.node_id, properties={"segment_enabled": enabled}
+                # 8.同步处理向量数据库里的数据
+                failed_node_ids = (
+                    self.vector_database_service.update_properties_in_batch(
+                        str(dataset_id),
+                        [str(segment.node_id)],
+                        {"segment_enabled": enabled},
+                    )
                 )
+                if failed_node_ids:
+                    raise FailException("更新向量数据库片段启用状态失败")
             except Exception as e:
                 logging.exception(
                     f"更改文档片段启用状态出现异常, segment_id: {segment_id}, 错误信息: {str(e)}"
@@ -365,6 +382,9 @@ class SegmentService(BaseService):
                     stopped_at=datetime.now(),
                 )
                 raise FailException("更新文档片段启用状态失败，请稍后重试")
+            finally:
+                # 9.片段启用状态发生变化，递增知识库版本号使检索结果缓存失效
+                self.retrieval_cache_service.bump_dataset_version(dataset_id)
 
     def delete_segment(
         self,
@@ -400,8 +420,8 @@ class SegmentService(BaseService):
 
         # 5.同步删除向量数据库存储的记录
         try:
-            self.vector_database_service.collection.data.delete_by_id(
-                str(segment.node_id)
+            self.vector_database_service.vector_database.delete_by_ids(
+                str(dataset_id), [str(segment.node_id)]
             )
         except Exception as e:
             logging.exception(
@@ -419,4 +439,7 @@ class SegmentService(BaseService):
             token_count=document_token_count,
         )
 
+        # 7.知识库内容发生变化，递增知识库版本号使检索结果缓存失效
+        self.retrieval_cache_service.bump_dataset_version(dataset_id)
+
         return segment
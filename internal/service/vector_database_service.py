@@ -1,49 +1,102 @@
-from dataclasses import dataclass
-from typing import Any
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
-from flask import Flask
+from flask import current_app
 from flask_weaviate import FlaskWeaviate
-from injector import inject
+from injector import inject, singleton
 from langchain_core.documents import Document
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_weaviate import WeaviateVectorStore
-from weaviate.collections import Collection
 
+from internal.core.vector_database import (
+    BaseVectorDatabase,
+    LocalVectorDatabase,
+    WeaviateVectorDatabase,
+)
 from .embeddings_service import EmbeddingsService
 
-# 向量数据库的集合名字
-COLLECTION_NAME = "Dataset"
-
 
 @inject
+@singleton
 @dataclass
 class VectorDatabaseService:
-    """向量数据库服务"""
+    """向量数据库服务，根据VECTOR_DATABASE_TYPE选择weaviate(单集合或按知识库多租户)或本地向量数据库后端"""
 
     weaviate: FlaskWeaviate
     embeddings_service: EmbeddingsService
-
-    async def _get_client(self, flask_app: Flask):
-        with flask_app.app_context():
-            return self.weaviate.client
+    _local_vector_database: Optional[LocalVectorDatabase] = field(
+        default=None, init=False
+    )
 
     @property
-    def vector_store(self) -> WeaviateVectorStore:
-        return WeaviateVectorStore(
-            client=self.weaviate.client,
-            index_name=COLLECTION_NAME,
-            text_key="text",
-            embedding=self.embeddings_service.cache_backed_embeddings,
+    def vector_database(self) -> BaseVectorDatabase:
+        """获取当前配置的向量数据库后端，本地后端在进程内复用以保留索引缓存"""
+        embeddings = self.embeddings_service.cache_backed_embeddings
+        if current_app.config.get("VECTOR_DATABASE_TYPE") == "local":
+            if self._local_vector_database is None:
+                self._local_vector_database = LocalVectorDatabase(
+                    embeddings, current_app.config.get("LOCAL_VECTOR_DATABASE_PATH")
+                )
+            return self._local_vector_database
+        return WeaviateVectorDatabase(
+            self.weaviate.client,
+            embeddings,
+            multi_tenancy=current_app.config.get("WEAVIATE_MULTI_TENANCY", False),
+        )
+
+    def add_documents_in_batch(
+        self,
+        dataset_id: str,
+        documents: list[Document],
+        ids: list[str],
+        batch_size: int = 100,
+    ) -> list[str]:
+        """批量往向量数据库中新增文档，向量按嵌入模型最大批次计算后批量写入，返回写入失败的id列表"""
+        # 1.按照嵌入模型单次请求的最大文本数切分，并计算所有文档的向量
+        texts = [document.page_content for document in documents]
+        max_batch_size = self.embeddings_service.max_batch_size
+        vectors = []
+        for i in range(0, len(texts), max_batch_size):
+            vectors.extend(
+                self.embeddings_service.cache_backed_embeddings.embed_documents(
+                    texts[i : i + max_batch_size]
+                )
+            )
+
+        # 2.批量写入向量数据库并返回写入失败的记录id
+        return self.vector_database.add_vectors(
+            str(dataset_id), documents, ids, vectors, batch_size=batch_size
         )
 
-    async def add_documents(self, documents: list[Document], **kwargs: Any):
-        """往向量数据库中新增文档，将vector_store使用async进行二次封装，避免在event中实现事件循环错误"""
-        self.vector_store.add_documents(documents, **kwargs)
+    def update_properties_in_batch(
+        self,
+        dataset_id: str,
+        ids: list[str],
+        properties: dict[str, Any],
+        chunk_size: int = 500,
+        max_retries: int = 3,
+    ) -> list[str]:
+        """将同一组属性批量更新到id列表对应的向量记录，按块执行并对失败的记录重试，返回最终更新失败的id列表"""
+        ids = [str(id) for id in ids]
+        vector_database = self.vector_database
+        failed_ids = []
+        for i in range(0, len(ids), chunk_size):
+            # 1.按块批量更新，整块出错时视为整块失败
+            chunk_ids = ids[i : i + chunk_size]
+            for attempt in range(max_retries + 1):
+                try:
+                    chunk_ids = vector_database.update_in_batch(
+                        str(dataset_id), chunk_ids, properties
+                    )
+                except Exception as e:
+                    logging.exception(
+                        f"批量更新向量数据库记录属性失败, dataset_id: {dataset_id}, 错误信息: {str(e)}"
+                    )
 
-    def get_retriever(self) -> VectorStoreRetriever:
-        """获取检索器"""
-        return self.vector_store.as_retriever()
+                # 2.全部成功或者重试次数用尽时结束，否则退避后只重试失败的记录
+                if not chunk_ids or attempt >= max_retries:
+                    break
+                time.sleep(min(2**attempt, 10))
+            failed_ids.extend(chunk_ids)
 
-    @property
-    def collection(self) -> Collection:
-        return self.weaviate.client.collections.get(COLLECTION_NAME)
+        return failed_ids
@@ -1,7 +1,8 @@
 import json
+import uuid
 from dataclasses import dataclass
 from threading import Thread
-from typing import Generator
+from typing import Generator, Optional
 from uuid import UUID
 
 from flask import current_app
@@ -9,7 +10,10 @@ from injector import inject
 from langchain_core.messages import HumanMessage
 from sqlalchemy import desc
 
-from internal.core.agent.agents.agent_queue_manager import AgentQueueManager
+from internal.core.agent.agents.agent_queue_manager import (
+    AgentQueueManager,
+    RESUME_EVENT_FIELDS,
+)
 from internal.entity.app_entity import AppStatus
 from internal.entity.conversation_entity import InvokeFrom, MessageStatus
 from internal.exception import NotFoundException, ForbiddenException
@@ -161,6 +165,21 @@ class WebAppService(BaseService):
             ),
         )
 
+        # 12.1 记录任务上下文，用于断线重连时还原事件数据
+        task_id = uuid.uuid4()
+        agent.agent_queue_manager.set_task_context(
+            task_id,
+            conversation_id=conversation.id,
+            message_id=message.id,
+        )
+
+        # 12.2 提前记录流式输出及持久化所需的数据，客户端断开连接后生成器会转交后台线程继续执行，此时请求上下文(current_user)及会话中的模型对象均已不可用
+        flask_app = current_app._get_current_object()
+        account_id = account.id
+        app_id = app.id
+        conversation_id = conversation.id
+        message_id = message.id
+
         # 13.定义字典存储推理过程，并调用智能体获取消息
         agent_thoughts = {}
         for agent_thought in agent.stream(
@@ -168,6 +187,7 @@ class WebAppService(BaseService):
                 "messages": [HumanMessage(req.query.data)],
                 "history": history,
                 "long_term_memory": conversation.summary,
+                "task_id": task_id,
             }
         ):
             # 14.提取thought以及answer
@@ -187,7 +207,8 @@ class WebAppService(BaseService):
                                 "thought": agent_thoughts[event_id].thought
                                 + agent_thought.thought,
                                 # 消息相关数据
-                                "message": agent_thought.message,
+                                "message": agent_thought.message
+                                or agent_thoughts[event_id].message,
                                 "message_token_count": agent_thought.message_token_count,
                                 "message_unit_price": agent_thought.message_unit_price,
                                 "message_price_unit": agent_thought.message_price_unit,
@@ -221,22 +242,22 @@ class WebAppService(BaseService):
                     }
                 ),
                 "id": event_id,
-                "conversation_id": str(conversation.id),
-                "message_id": str(message.id),
+                "conversation_id": str(conversation_id),
+                "message_id": str(message_id),
                 "task_id": str(agent_thought.task_id),
             }
-            yield f"event: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
+            yield f"id: {agent_thought.stream_id}\nevent: {agent_thought.event}\ndata:{json.dumps(data)}\n\n"
 
         # 20.将消息以及推理过程添加到数据库
         thread = Thread(
             target=self.conversation_service.save_agent_thoughts,
             kwargs={
-                "flask_app": current_app._get_current_object(),
-                "account_id": account.id,
-                "app_id": app.id,
+                "flask_app": flask_app,
+                "account_id": account_id,
+                "app_id": app_id,
                 "app_config": app_config,
-                "conversation_id": conversation.id,
-                "message_id": message.id,
+                "conversation_id": conversation_id,
+                "message_id": message_id,
                 "agent_thoughts": [
                     agent_thought for agent_thought in agent_thoughts.values()
                 ],
@@ -252,6 +273,31 @@ class WebAppService(BaseService):
         # 2.调用智能体队列管理器停止特定任务
         AgentQueueManager.set_stop_flag(task_id, InvokeFrom.WEB_APP, account.id)
 
+    def resume_web_app_chat(
+        self,
+        token: str,
+        task_id: UUID,
+        last_event_id: Optional[str],
+        account: Account,
+    ) -> Generator:
+        """根据传递的token+task_id+最后接收的事件id，重新连接WebApp对话的流式事件，从断开处继续输出"""
+        # 1.获取WebApp应用并校验应用是否发布
+        self.get_web_app(token)
+
+        # 2.校验任务是否属于当前账号，任务过期后事件流同样会被清除
+        if not AgentQueueManager.is_task_owner(task_id, InvokeFrom.WEB_APP, account.id):
+            raise NotFoundException("该会话任务不存在或已过期，请核实后重试")
+
+        # 3.从最后接收的事件之后继续监听任务事件流
+        agent_queue_manager = AgentQueueManager(
+            user_id=account.id, invoke_from=InvokeFrom.WEB_APP
+        )
+        yield from agent_queue_manager.resume(
+            task_id,
+            last_event_id,
+            include=RESUME_EVENT_FIELDS | {"total_token_count", "total_price"},
+        )
+
     def get_conversations(
         self, token: str, is_pinned: bool, account: Account
     ) -> list[Conversation]:
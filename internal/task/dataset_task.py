@@ -11,3 +11,23 @@ def delete_dataset(dataset_id: UUID):
 
     indexing_service = injector.get(IndexingService)
     indexing_service.delete_dataset(dataset_id)
+
+
+@shared_task
+def migrate_dataset_vectors(dataset_id: UUID):
+    """将知识库的存量向量迁移到weaviate多租户集合中对应的租户"""
+    from internal.extension.module_extension import injector
+    from internal.service import IndexingService
+
+    indexing_service = injector.get(IndexingService)
+    indexing_service.migrate_dataset_vectors(dataset_id)
+
+
+@shared_task
+def migrate_datasets_vectors():
+    """为所有知识库分发向量迁移任务，开启WEAVIATE_MULTI_TENANCY后执行一次即可"""
+    from internal.extension.module_extension import injector
+    from internal.service import IndexingService
+
+    indexing_service = injector.get(IndexingService)
+    indexing_service.migrate_datasets_vectors()
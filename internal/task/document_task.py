@@ -13,6 +13,16 @@ def build_documents(document_ids: list[UUID]):
     indexing_service.build_documents(document_ids)
 
 
+@shared_task
+def reindex_document(document_id: UUID):
+    """根据传递的文档id增量重建文档索引"""
+    from internal.extension.module_extension import injector
+    from internal.service.indexing_service import IndexingService
+
+    indexing_service = injector.get(IndexingService)
+    indexing_service.reindex_document(document_id)
+
+
 @shared_task
 def update_document_enabled(document_id: UUID):
     """根据传递的文档id修改文档的状态"""
@@ -1,7 +1,15 @@
+import logging
 from dataclasses import field, dataclass
+from threading import Thread
 from typing import Any, Union, Generator
 
-from flask import jsonify, stream_with_context, Response as FlaskResponse
+from flask import (
+    Flask,
+    current_app,
+    jsonify,
+    stream_with_context,
+    Response as FlaskResponse,
+)
 
 from .http_code import HttpCode
 
@@ -70,8 +78,10 @@ def forbidden_message(msg: str = ""):
     return message(code=HttpCode.FORBIDDEN, msg=msg)
 
 
-def compact_generate_response(response: Union[Response, Generator]):
-    """统一合并处理块输出以及流式事件输出"""
+def compact_generate_response(
+    response: Union[Response, Generator], drain_on_disconnect: bool = False
+):
+    """统一合并处理块输出以及流式事件输出，drain_on_disconnect为True时客户端断开连接后会在后台继续消费生成器，保证生成器末尾的逻辑(如持久化)正常执行"""
     # 1.检测下是否为块输出(Response)
     if isinstance(response, Response):
         return json(response)
@@ -79,7 +89,20 @@ def compact_generate_response(response: Union[Response, Generator]):
         # 2.response格式为生成器，代表本次响应需要执行流式事件输出
         def generate():
             """构建generate函数，流式从response中获取数据"""
-            yield from response
+            try:
+                for item in response:
+                    yield item
+            except GeneratorExit:
+                # 客户端断开连接时，按需转交后台线程继续消费，否则关闭response
+                if drain_on_disconnect:
+                    Thread(
+                        target=_drain_generator,
+                        args=(current_app._get_current_object(), response),
+                        daemon=True,
+                    ).start()
+                elif hasattr(response, "close"):
+                    response.close()
+                raise
 
         # 3.返回携带上下文的流式事件输出
         return FlaskResponse(
@@ -87,3 +110,13 @@ def compact_generate_response(response: Union[Response, Generator]):
             status=200,
             mimetype="text/event-stream",
         )
+
+
+def _drain_generator(flask_app: Flask, generator: Generator) -> None:
+    """在应用上下文中消费完生成器剩余的数据并丢弃"""
+    try:
+        with flask_app.app_context():
+            for _ in generator:
+                pass
+    except Exception as e:
+        logging.exception(f"后台消费流式响应出错, 错误信息: {str(e)}")
@@ -0,0 +1,60 @@
+import pytest
+from langchain_core.documents import Document as LCDocument
+
+# 检索器包依赖服务层(数据库、对象存储等)，缺少依赖时跳过
+diversity = pytest.importorskip("internal.core.retrievers.diversity")
+
+
+class TestMaximalMarginalRelevance:
+    """最大边际相关性重排序测试类"""
+
+    def test_first_pick_is_most_relevant(self):
+        vectors = [[0.5, 0.5], [1.0, 0.0], [0.0, 1.0]]
+
+        assert diversity.maximal_marginal_relevance([1.0, 0.0], vectors, k=1) == [1]
+
+    def test_prefers_diverse_over_duplicate(self):
+        # 前两条几乎相同，第三条相关性较低但与已选记录不同
+        vectors = [[1.0, 0.25], [1.0, 0.26], [0.5, 0.8]]
+
+        selected = diversity.maximal_marginal_relevance(
+            [1.0, 0.3], vectors, k=2, lambda_mult=0.5
+        )
+
+        assert selected == [1, 2]
+
+    def test_lambda_one_ranks_by_relevance(self):
+        vectors = [[1.0, 0.25], [1.0, 0.26], [0.5, 0.8]]
+
+        selected = diversity.maximal_marginal_relevance(
+            [1.0, 0.3], vectors, k=3, lambda_mult=1
+        )
+
+        assert selected == [1, 0, 2]
+
+    def test_k_larger_than_candidates(self):
+        assert diversity.maximal_marginal_relevance([1.0], [[1.0]], k=5) == [0]
+        assert diversity.maximal_marginal_relevance([1.0], [], k=5) == []
+
+
+class TestSuppressNearDuplicates:
+    """近似重复片段去除测试类"""
+
+    def test_drops_near_duplicates_keeping_first(self):
+        text = "LLMOps平台支持知识库检索、工作流编排以及多种大语言模型的接入。"
+        lc_documents = [
+            LCDocument(page_content=text, metadata={"id": 1}),
+            LCDocument(
+                page_content="欢迎使用本平台，今天天气很好。", metadata={"id": 2}
+            ),
+            LCDocument(page_content=text.replace("、", "，") + " ", metadata={"id": 3}),
+        ]
+
+        kept = diversity.suppress_near_duplicates(lc_documents, threshold=0.8)
+
+        assert [lc_document.metadata["id"] for lc_document in kept] == [1, 2]
+
+    def test_threshold_one_keeps_everything(self):
+        lc_documents = [LCDocument(page_content="相同的内容") for _ in range(3)]
+
+        assert len(diversity.suppress_near_duplicates(lc_documents, threshold=1)) == 3
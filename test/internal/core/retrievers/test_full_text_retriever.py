@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+# 全文检索器依赖服务层(数据库、对象存储等)，缺少依赖时跳过
+FullTextRetriever = pytest.importorskip(
+    "internal.core.retrievers.full_text_retriever"
+).FullTextRetriever
+
+
+def bm25(frequency, length, df, count, avg_length, k1=1.5, b=0.75):
+    """BM25参考实现"""
+    idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+    return (
+        idf
+        * frequency
+        * (k1 + 1)
+        / (frequency + k1 * (1 - b + b * length / avg_length))
+    )
+
+
+@pytest.fixture
+def retriever():
+    return FullTextRetriever.construct(k1=1.5, b=0.75)
+
+
+class TestFullTextRetriever:
+    """全文检索器BM25打分测试类"""
+
+    def test_bm25_matches_reference(self, retriever):
+        # (dataset_id, keyword, segment_id, frequency, segment_length, segment_count, total_length)
+        postings = [
+            ("d1", "llm", "s1", 3, 10, 4, 80),
+            ("d1", "llm", "s2", 1, 30, 4, 80),
+            ("d1", "rag", "s2", 2, 30, 4, 80),
+        ]
+        segment_ids, scores = retriever._bm25(postings)
+        result = dict(zip(segment_ids, scores))
+
+        assert result["s1"] == pytest.approx(bm25(3, 10, 2, 4, 20))
+        assert result["s2"] == pytest.approx(
+            bm25(1, 30, 2, 4, 20) + bm25(2, 30, 1, 4, 20)
+        )
+
+    def test_bm25_prefers_frequent_and_short_segments(self, retriever):
+        postings = [
+            ("d1", "llm", "frequent", 5, 20, 10, 200),
+            ("d1", "llm", "rare", 1, 20, 10, 200),
+            ("d1", "llm", "long", 1, 60, 10, 200),
+        ]
+        segment_ids, scores = retriever._bm25(postings)
+        result = dict(zip(segment_ids, scores))
+
+        assert result["frequent"] > result["rare"] > result["long"] > 0
+
+    def test_bm25_document_frequency_is_per_dataset(self, retriever):
+        postings = [
+            ("d1", "llm", "s1", 1, 10, 10, 100),
+            ("d1", "llm", "s2", 1, 10, 10, 100),
+            ("d2", "llm", "s3", 1, 10, 10, 100),
+        ]
+        segment_ids, scores = retriever._bm25(postings)
+        result = dict(zip(segment_ids, scores))
+
+        assert result["s1"] == pytest.approx(bm25(1, 10, 2, 10, 10))
+        assert result["s3"] == pytest.approx(bm25(1, 10, 1, 10, 10))
+        assert result["s3"] > result["s1"]
+
+    def test_bm25_falls_back_when_statistic_missing(self, retriever):
+        postings = [
+            ("d1", "llm", "s1", 2, 10, None, None),
+            ("d1", "rag", "s2", 1, 30, None, None),
+        ]
+        expected_postings = [
+            ("d1", "llm", "s1", 2, 10, 2, 40),
+            ("d1", "rag", "s2", 1, 30, 2, 40),
+        ]
+        segment_ids, scores = retriever._bm25(postings)
+        expected_segment_ids, expected_scores = retriever._bm25(expected_postings)
+
+        assert segment_ids == expected_segment_ids
+        assert scores == pytest.approx(expected_scores)
+        assert all(score > 0 for score in scores)
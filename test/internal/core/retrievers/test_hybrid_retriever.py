@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from flask import Flask
+from langchain_core.documents import Document as LCDocument
+from langchain_core.retrievers import BaseRetriever
+
+# 检索器包依赖服务层(数据库、对象存储等)，缺少依赖时跳过
+HybridRetriever = pytest.importorskip(
+    "internal.core.retrievers.hybrid_retriever"
+).HybridRetriever
+
+
+def document(segment_id, score=0.0):
+    return LCDocument(
+        page_content=segment_id, metadata={"segment_id": segment_id, "score": score}
+    )
+
+
+def segment_ids(lc_documents):
+    return [lc_document.metadata["segment_id"] for lc_document in lc_documents]
+
+
+class StaticRetriever(BaseRetriever):
+    """返回固定文档列表的检索器，可设置延迟模拟慢检索"""
+
+    lc_documents: list[LCDocument]
+    delay: float = 0
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        time.sleep(self.delay)
+        return self.lc_documents
+
+
+class TestHybridRetriever:
+    """混合检索器结果融合测试类"""
+
+    def test_rrf_uses_ranks_only(self):
+        retriever = HybridRetriever.construct(
+            weights=[0.5, 0.5], fusion_strategy="rrf", rrf_k=60
+        )
+        semantic = [document("a", 0.9), document("b", 0.8), document("c", 0.1)]
+        full_text = [document("c", 30), document("a", 20)]
+
+        fused = retriever._fuse([semantic, full_text])
+
+        # a: 1/61+1/62, c: 1/63+1/61, b: 1/62
+        assert segment_ids(fused) == ["a", "c", "b"]
+
+    def test_rrf_respects_weights(self):
+        retriever = HybridRetriever.construct(
+            weights=[1.0, 0.0], fusion_strategy="rrf", rrf_k=60
+        )
+
+        fused = retriever._fuse([[document("a"), document("b")], [document("b")]])
+
+        assert segment_ids(fused) == ["a", "b"]
+
+    def test_weighted_normalizes_scores(self):
+        retriever = HybridRetriever.construct(
+            weights=[0.7, 0.3], fusion_strategy="weighted"
+        )
+        # 语义得分归一化后 a=1, b=0.5, c=0；全文得分归一化后 c=1, b=0
+        semantic = [document("a", 0.9), document("b", 0.7), document("c", 0.5)]
+        full_text = [document("c", 12.0), document("b", 2.0)]
+
+        fused = retriever._fuse([semantic, full_text])
+
+        # a: 0.7, b: 0.35, c: 0.3
+        assert segment_ids(fused) == ["a", "b", "c"]
+
+    def test_weighted_falls_back_to_rank_for_equal_scores(self):
+        retriever = HybridRetriever.construct(weights=[1.0], fusion_strategy="weighted")
+
+        scores = retriever._score([document("a", 1), document("b", 1)])
+
+        assert scores == [1.0, 0.5]
+
+    def test_timeout_degrades_result(self):
+        fast = StaticRetriever(lc_documents=[document("a", 0.9)])
+        slow = StaticRetriever(lc_documents=[document("b", 9.0)], delay=1)
+        retriever = HybridRetriever(
+            flask_app=Flask(__name__),
+            retrievers=[fast, slow],
+            weights=[0.5, 0.5],
+            timeout=0.2,
+        )
+
+        lc_documents = retriever.invoke("query")
+
+        assert segment_ids(lc_documents) == ["a"]
+        assert retriever.degraded
@@ -0,0 +1,107 @@
+import re
+
+import pytest
+
+from internal.core.text_splitter import token_text_splitter
+from internal.core.text_splitter.token_text_splitter import TokenAwareTextSplitter
+
+
+class WordEncoding:
+    """按单词、空白和标点切分的测试编码器，提供与tiktoken一致的encode/decode_with_offsets接口"""
+
+    pattern = re.compile(r"\w+|\s+|[^\w\s]")
+
+    def encode(self, text: str, disallowed_special=()) -> list[str]:
+        return self.pattern.findall(text)
+
+    def decode_with_offsets(self, tokens: list[str]) -> tuple[str, list[int]]:
+        offsets, offset = [], 0
+        for token in tokens:
+            offsets.append(offset)
+            offset += len(token)
+        return "".join(tokens), offsets
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(
+        token_text_splitter.tiktoken, "get_encoding", lambda name: encoding
+    )
+    return encoding
+
+
+def build_splitter(chunk_size: int, chunk_overlap: int) -> TokenAwareTextSplitter:
+    return TokenAwareTextSplitter(
+        separators=["\n\n", "\n", r"\s+", ""],
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+
+
+class TestTokenAwareTextSplitter:
+    """基于token偏移的文本分割器测试类"""
+
+    @pytest.mark.parametrize(
+        "text, chunk_size, chunk_overlap",
+        [
+            ("alpha beta gamma\n\ndelta epsilon zeta eta\ntheta", 4, 0),
+            ("alpha beta gamma\n\ndelta epsilon zeta eta\ntheta", 5, 2),
+            ("one, two, three. four; five!\nsix seven", 3, 1),
+            ("supercalifragilistic word", 1, 0),
+        ],
+    )
+    def test_token_count_matches_encoding(
+        self, encoding, text, chunk_size, chunk_overlap
+    ):
+        chunks = build_splitter(chunk_size, chunk_overlap).split_text_with_token_count(
+            text
+        )
+        assert chunks
+        for chunk, token_count in chunks:
+            assert token_count == len(encoding.encode(chunk))
+
+    def test_chunks_respect_chunk_size(self, encoding):
+        text = " ".join(f"word{i}" for i in range(50))
+        chunks = build_splitter(7, 2).split_text_with_token_count(text)
+        assert len(chunks) > 1
+        assert all(token_count <= 7 for _, token_count in chunks)
+        assert chunks[0][0].startswith("word0")
+        assert chunks[-1][0].endswith("word49")
+
+    def test_chunks_overlap(self, encoding):
+        text = " ".join(f"word{i}" for i in range(20))
+        chunks = build_splitter(5, 2).split_text(text)
+        for previous, current in zip(chunks, chunks[1:]):
+            assert previous.split()[-1] == current.split()[0]
+
+    def test_create_documents_records_token_count(self, encoding):
+        documents = build_splitter(4, 0).create_documents(
+            ["alpha beta gamma delta epsilon"], [{"source": "test"}]
+        )
+        assert [document.page_content for document in documents] == [
+            "alpha beta",
+            "gamma delta",
+            "epsilon",
+        ]
+        for document in documents:
+            assert document.metadata["source"] == "test"
+            assert document.metadata["token_count"] == len(
+                encoding.encode(document.page_content)
+            )
+
+    def test_token_count_matches_tiktoken(self):
+        tiktoken = pytest.importorskip("tiktoken")
+        try:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            pytest.skip("cl100k_base编码不可用")
+
+        text = "检索增强生成（RAG）将检索到的片段拼接到提示中。\n\nThe splitter keeps token counts exact, even around emojis 🙂🙂 and numbers 1234567."
+        splitter = TokenAwareTextSplitter(
+            separators=["\n\n", "\n", "。|！|？", r"\s+", ""],
+            chunk_size=8,
+            chunk_overlap=2,
+        )
+        for chunk, token_count in splitter.split_text_with_token_count(text):
+            assert token_count == len(encoding.encode(chunk))
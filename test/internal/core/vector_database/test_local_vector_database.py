@@ -0,0 +1,200 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from internal.core.vector_database.local_vector_database import LocalVectorDatabase
+
+DATASET_ID = "dataset"
+
+
+class MappingEmbeddings(Embeddings):
+    """根据预设映射返回向量的测试嵌入模型"""
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.vectors[text]
+
+
+def build_document(
+    text: str, document_id: str = "doc", enabled: bool = True
+) -> Document:
+    return Document(
+        page_content=text,
+        metadata={
+            "document_id": document_id,
+            "document_enabled": enabled,
+            "segment_enabled": enabled,
+        },
+    )
+
+
+@pytest.fixture
+def database(tmp_path):
+    embeddings = MappingEmbeddings(
+        {"x": [1, 0, 0], "y": [0, 1, 0], "-x": [-1, 0, 0], "xy": [1, 1, 0]}
+    )
+    return LocalVectorDatabase(embeddings, str(tmp_path))
+
+
+def search(database: LocalVectorDatabase, query: str, **kwargs) -> dict[str, float]:
+    return {
+        document.page_content: score
+        for document, score in database.similarity_search_with_relevance_scores(
+            query, [DATASET_ID], **kwargs
+        )
+    }
+
+
+class TestLocalVectorDatabase:
+    """本地向量数据库测试类"""
+
+    def test_scores_are_normalized_relevance(self, database):
+        database.add_vectors(
+            DATASET_ID,
+            [build_document("a"), build_document("b"), build_document("c")],
+            ["1", "2", "3"],
+            [[2, 0, 0], [0, 3, 0], [-1, 0, 0]],
+        )
+
+        scores = search(database, "x", k=3)
+
+        assert scores["a"] == pytest.approx(1.0)
+        assert scores["b"] == pytest.approx(0.5)
+        assert scores["c"] == pytest.approx(0.0)
+        assert list(scores) == ["a", "b", "c"]
+
+    def test_score_threshold_and_k(self, database):
+        database.add_vectors(
+            DATASET_ID,
+            [build_document("a"), build_document("b"), build_document("c")],
+            ["1", "2", "3"],
+            [[1, 0, 0], [1, 1, 0], [0, 1, 0]],
+        )
+
+        assert list(search(database, "x", k=2)) == ["a", "b"]
+        assert list(search(database, "x", k=3, score_threshold=0.6)) == ["a", "b"]
+
+    def test_search_returns_query_and_normalized_vectors(self, database):
+        database.add_vectors(DATASET_ID, [build_document("a")], ["1"], [[3, 4, 0]])
+
+        query_vector, result = database.similarity_search_with_vectors(
+            "xy", [DATASET_ID]
+        )
+
+        assert query_vector == pytest.approx([2**-0.5, 2**-0.5, 0])
+        assert result[0][2] == pytest.approx([0.6, 0.8, 0])
+
+    def test_disabled_records_are_filtered(self, database):
+        database.add_vectors(
+            DATASET_ID,
+            [build_document("a", enabled=False), build_document("b")],
+            ["1", "2"],
+            [[1, 0, 0], [0, 1, 0]],
+        )
+        assert list(search(database, "x")) == ["b"]
+
+        failed_ids = database.update_in_batch(
+            DATASET_ID,
+            ["1", "missing"],
+            {"document_enabled": True, "segment_enabled": True},
+        )
+
+        assert failed_ids == ["missing"]
+        assert list(search(database, "x")) == ["a", "b"]
+
+    def test_update_text_and_vector(self, database):
+        database.add_vectors(
+            DATASET_ID,
+            [build_document("a"), build_document("b")],
+            ["1", "2"],
+            [[1, 0, 0], [0, 1, 0]],
+        )
+
+        database.update(DATASET_ID, "1", {"text": "a2"}, vector=[0, 1, 0])
+        database.update(DATASET_ID, "2", {"text": "b2"})
+
+        assert search(database, "y") == pytest.approx({"a2": 1.0, "b2": 1.0})
+
+    def test_add_overwrites_existing_ids(self, database):
+        database.add_vectors(DATASET_ID, [build_document("a")], ["1"], [[1, 0, 0]])
+        database.add_vectors(DATASET_ID, [build_document("b")], ["1"], [[0, 1, 0]])
+
+        assert search(database, "y") == pytest.approx({"b": 1.0})
+
+    def test_delete(self, database):
+        database.add_vectors(
+            DATASET_ID,
+            [
+                build_document("a", "doc1"),
+                build_document("b", "doc1"),
+                build_document("c", "doc2"),
+            ],
+            ["1", "2", "3"],
+            [[1, 0, 0], [0, 1, 0], [1, 1, 0]],
+        )
+
+        database.delete_by_ids(DATASET_ID, ["1"])
+        assert set(search(database, "x")) == {"b", "c"}
+
+        database.delete_by_document_id(DATASET_ID, "doc1")
+        assert set(search(database, "x")) == {"c"}
+
+        database.delete_by_dataset_id(DATASET_ID)
+        assert search(database, "x") == {}
+
+    def test_add_appends_shards_without_rewriting(self, database, tmp_path):
+        shards_path = tmp_path / DATASET_ID / LocalVectorDatabase.SHARDS_DIR
+        database.add_vectors(DATASET_ID, [build_document("a")], ["1"], [[1, 0, 0]])
+        (first_shard,) = os.listdir(shards_path)
+        first_stat = os.stat(shards_path / first_shard)
+
+        database.add_vectors(DATASET_ID, [build_document("b")], ["2"], [[0, 1, 0]])
+
+        assert len(os.listdir(shards_path)) == 2
+        assert os.stat(shards_path / first_shard).st_mtime_ns == first_stat.st_mtime_ns
+        log_path = tmp_path / DATASET_ID / LocalVectorDatabase.LOG_FILE
+        assert len(log_path.read_text(encoding="utf-8").splitlines()) == 2
+
+    def test_other_instances_see_appended_records(self, database, tmp_path):
+        other = LocalVectorDatabase(database.embeddings, str(tmp_path))
+        database.add_vectors(DATASET_ID, [build_document("a")], ["1"], [[1, 0, 0]])
+        assert list(search(other, "x")) == ["a"]
+
+        database.add_vectors(DATASET_ID, [build_document("b")], ["2"], [[0, 1, 0]])
+        database.update_in_batch(DATASET_ID, ["1"], {"segment_enabled": False})
+
+        assert list(search(other, "x")) == ["b"]
+
+    def test_compaction_keeps_live_records(self, database, tmp_path):
+        database.COMPACT_MAX_SHARDS = 3
+        vectors = {"a": [1, 0, 0], "b": [0, 1, 0], "c": [1, 1, 0], "d": [-1, 0, 0]}
+        for id, (text, vector) in enumerate(vectors.items()):
+            database.add_vectors(
+                DATASET_ID, [build_document(text)], [str(id)], [vector]
+            )
+        database.delete_by_ids(DATASET_ID, ["3"])
+
+        shards_path = tmp_path / DATASET_ID / LocalVectorDatabase.SHARDS_DIR
+        assert len(os.listdir(shards_path)) == 1
+        scores = search(database, "x", k=4)
+        assert list(scores) == ["a", "c", "b"]
+        assert scores["c"] == pytest.approx((1 + 2**-0.5) / 2)
+
+        reopened = LocalVectorDatabase(database.embeddings, str(tmp_path))
+        assert search(reopened, "x", k=4) == pytest.approx(scores)
+
+    def test_compaction_after_deleting_everything(self, database, tmp_path):
+        database.add_vectors(DATASET_ID, [build_document("a")], ["1"], [[1, 0, 0]])
+        database.delete_by_ids(DATASET_ID, ["1"])
+
+        assert search(database, "x") == {}
+        assert os.listdir(tmp_path / DATASET_ID / LocalVectorDatabase.SHARDS_DIR) == []
+        database.add_vectors(DATASET_ID, [build_document("b")], ["2"], [[0, 1, 0]])
+        assert list(search(database, "y")) == ["b"]
@@ -0,0 +1,112 @@
+import pytest
+
+# 嵌入服务依赖服务层(数据库、对象存储等)，缺少依赖时跳过
+EmbeddingRedisStore = pytest.importorskip(
+    "internal.service.embeddings_service"
+).EmbeddingRedisStore
+
+
+class FakePipeline:
+    """内存版redis pipeline，仅实现向量存储器用到的命令"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.redis.set(key, value, ex=ex))
+
+    def incrby(self, key, amount):
+        self.commands.append(lambda: self.redis.incrby(key, amount))
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda: None)
+
+    def execute(self):
+        return [command() for command in self.commands]
+
+
+class FakeRedis:
+    """内存版redis客户端，仅实现向量存储器用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def incrby(self, key, amount):
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+class TestEmbeddingRedisStore:
+    """向量redis存储器编解码测试类"""
+
+    def test_float32_roundtrip_is_exact(self, redis):
+        store = EmbeddingRedisStore(redis, "text-embedding-3-small")
+        vector = [0.1, -0.25, 3.5, 1e-7]
+
+        data = store.encode(vector)
+
+        assert len(data) == store._header_size + len(vector) * 4
+        assert store.decode(data) == [
+            float(value) for value in store.dtype.type(vector)
+        ]
+
+    def test_float16_roundtrip_is_close(self, redis):
+        store = EmbeddingRedisStore(redis, "text-embedding-3-small", dtype="float16")
+        vector = [0.1, -0.25, 3.5]
+
+        data = store.encode(vector)
+
+        assert len(data) == store._header_size + len(vector) * 2
+        assert store.decode(data) == pytest.approx(vector, rel=1e-3)
+
+    def test_decode_rejects_other_model(self, redis):
+        data = EmbeddingRedisStore(redis, "model-a").encode([1.0, 2.0])
+
+        assert EmbeddingRedisStore(redis, "model-b").decode(data) is None
+
+    def test_decode_rejects_invalid_data(self, redis):
+        store = EmbeddingRedisStore(redis, "model-a")
+
+        assert store.decode(b"") is None
+        assert store.decode(b"XX" + store.encode([1.0])[2:]) is None
+
+    def test_mset_and_mget(self, redis):
+        store = EmbeddingRedisStore(redis, "model-a", ttl=60)
+
+        store.mset([("a", [1.0, 2.0]), ("b", [3.0])])
+
+        assert store.mget(["a", "b", "c"]) == [[1.0, 2.0], [3.0], None]
+        assert set(redis.ttls.values()) == {60}
+
+    def test_mset_skips_writes_over_budget(self, redis):
+        store = EmbeddingRedisStore(redis, "model-a", ttl=60, max_memory=100)
+
+        store.mset([("a", [1.0] * 10)])
+        store.mset([("b", [1.0] * 10)])
+
+        assert store.mget(["a", "b"]) == [[1.0] * 10, None]
+
+    def test_max_memory_requires_ttl(self, redis):
+        with pytest.raises(ValueError):
+            EmbeddingRedisStore(redis, "model-a", max_memory=100)